@@ -0,0 +1,95 @@
+"""
+Cancellazione degli step quando il client si disconnette o il tempo finisce.
+
+Ogni step gira in un task con una propria scadenza (REQUEST_DEADLINE, vedi
+execution/deadlines.py) che segue la richiesta fino alle chiamate ai provider.
+Mentre il task lavora si controlla ogni DISCONNECT_POLL_INTERVAL secondi se il
+client è ancora connesso: se se n'è andato (tab chiusa, refresh) o la scadenza
+è passata, la scadenza viene cancellata e il task interrotto. Le coroutine si
+fermano subito; il lavoro già nei thread del pool si ferma alla prossima
+chiamata ai provider, senza consumare altri crediti Apify/OpenRouter.
+
+Configurazione (.env):
+    REQUEST_DEADLINE=300             secondi massimi per uno step (0 = nessuna scadenza)
+    DISCONNECT_POLL_INTERVAL=0.5     ogni quanti secondi controllare la connessione
+"""
+
+import asyncio
+import contextlib
+import functools
+import inspect
+import logging
+import os
+
+from fastapi import HTTPException, Request
+
+from execution import deadlines
+from execution.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CANCELLATIONS = counter(
+    "request_cancellations_total", "Richieste interrotte prima di finire", ("stage", "reason")
+)
+
+# 499 (convenzione nginx): il client ha chiuso la connessione, nessuno leggerà la risposta
+STATUS_CODES = {"client_disconnect": 499, "deadline": 504}
+
+
+def request_deadline() -> float:
+    return float(os.getenv("REQUEST_DEADLINE", "300"))
+
+
+async def run_cancellable(http_request: Request, stage: str, coro):
+    """Esegue `coro` sotto la scadenza della richiesta, interrompendola se il client se ne va."""
+    poll_interval = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+    with deadlines.deadline_scope(request_deadline()) as deadline:
+        # Il task copia il contesto corrente: la scadenza arriva fino ai provider
+        task = asyncio.create_task(coro)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=poll_interval)
+                if done:
+                    return task.result()
+                reason = None
+                if await http_request.is_disconnected():
+                    reason = "client_disconnect"
+                else:
+                    left = deadline.remaining()
+                    if left is not None and left <= 0:
+                        reason = "deadline"
+                if reason:
+                    break
+        except asyncio.CancelledError:
+            deadline.cancel("cancelled")
+            task.cancel()
+            raise
+
+        deadline.cancel(reason)
+        task.cancel()
+        with contextlib.suppress(BaseException):
+            await task
+        REQUEST_CANCELLATIONS.inc(stage=stage, reason=reason)
+        logger.info(f"[Step] {stage} interrotto ({reason})")
+        raise HTTPException(status_code=STATUS_CODES[reason], detail=f"Step {stage} interrotto: {reason}")
+
+
+def cancel_on_disconnect(stage: str):
+    """
+    Decoratore per gli endpoint degli step: aggiunge alla firma il parametro
+    `http_request` (iniettato da FastAPI) ed esegue l'handler con `run_cancellable`.
+    """
+    def decorator(handler):
+        signature = inspect.signature(handler)
+
+        @functools.wraps(handler)
+        async def wrapper(*args, http_request: Request, **kwargs):
+            return await run_cancellable(http_request, stage, handler(*args, **kwargs))
+
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("http_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+        ])
+        return wrapper
+
+    return decorator
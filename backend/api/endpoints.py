@@ -1,5 +1,9 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import json
 import logging
 import traceback
 import sys
@@ -8,10 +12,25 @@ import os
 # Add parent directory to path so execution module can be found
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from execution.transcribe_video import get_transcription
+from execution.transcribe_video import get_transcription_async
 from execution.extract_topics import extract_topics
-from execution.research_topics import research_topics
-from execution.generate_script import generate_video_script
+from execution.research_topics import research_topics, research_topics_async
+from execution.generate_script import generate_video_script, stream_video_script_async
+from execution.transcript_cache import get_transcript_cache, normalize_video_id
+from execution.provider_limits import provider_stats
+from execution.provider_calls import provider_health
+from execution.llm_cache import cache_stats as llm_cache_stats
+from execution.metrics import gauge, render_prometheus
+from execution.single_flight import content_key
+from execution.artifact_store import get_artifact_store
+from execution.research_store import get_research_store
+from execution.model_router import router_stats
+from execution import deadlines
+
+from .executor import run_stage, stage_executor
+from .job_queue import get_job_store, job_status_payload
+from .speculation import speculations
+from .disconnect import cancel_on_disconnect, request_deadline, REQUEST_CANCELLATIONS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,33 +40,102 @@ router = APIRouter()
 
 class VideoRequest(BaseModel):
     url: str
+    bypass_cache: bool = False  # Forza una nuova trascrizione ignorando la cache
+    session_id: Optional[str] = None  # Se presente, lo step successivo parte in anticipo (vedi speculation.py)
+
+class BatchRequest(BaseModel):
+    urls: list[str]
+    bypass_cache: bool = False
 
+# I campi *_handle sostituiscono il testo con l'handle restituito da uno step precedente
 class TranscriptRequest(BaseModel):
-    transcript_text: str
+    transcript_text: Optional[str] = None
+    transcript_handle: Optional[str] = None
+    bypass_cache: bool = False
+    session_id: Optional[str] = None
 
 class TopicsRequest(BaseModel):
-    topics: list[str]
+    topics: Optional[list[str]] = None
+    topics_handle: Optional[str] = None
+    bypass_cache: bool = False
+    session_id: Optional[str] = None
 
 class GenerateRequest(BaseModel):
-    transcript_text: str
-    research: str
+    transcript_text: Optional[str] = None
+    transcript_handle: Optional[str] = None
+    research: Optional[str] = None
+    research_handle: Optional[str] = None
+    bypass_cache: bool = False
+    session_id: Optional[str] = None
+
+
+# ============ ARTIFACT (output degli step tenuti lato server) ============
+
+async def _store_artifact(value) -> str:
+    return await asyncio.to_thread(get_artifact_store().put, value)
+
+async def _resolve_artifact(value, handle: Optional[str], field: str):
+    """Il valore passato in chiaro, oppure quello salvato sotto `handle`."""
+    if value is not None:
+        return value
+    if not handle:
+        raise HTTPException(status_code=422, detail=f"Serve '{field}' oppure '{field}_handle'")
+    stored = await asyncio.to_thread(get_artifact_store().get, handle)
+    if stored is None:
+        # Handle scaduto o creato da un altro processo: il client reinvia il testo
+        raise HTTPException(status_code=404, detail=f"{field}_handle sconosciuto o scaduto")
+    return stored
+
+
+# ============ SPECULAZIONE (step successivo in anticipo) ============
+# Gli step speculativi usano la cache come le chiamate di default del frontend:
+# le chiavi includono use_cache, quindi una richiesta con bypass_cache non li riusa.
+
+def _topics_key(transcript_text: str, use_cache: bool) -> str:
+    return content_key("extract_topics", transcript_text, use_cache)
+
+def _research_key(topics: list, use_cache: bool) -> str:
+    return content_key("research", use_cache, *topics)
+
+def _script_key(transcript_text: str, research: str, use_cache: bool) -> str:
+    return content_key("generate_script", transcript_text, research, use_cache)
 
-# In-memory store per semplicità (in prod usare DB/Redis)
-job_store = {}
+def _speculate_topics(session_id: str, transcript_text: str):
+    speculations.remember(session_id, transcript_text=transcript_text)
+    speculations.start(
+        session_id, "extract_topics", _topics_key(transcript_text, True),
+        run_stage, "extract_topics", extract_topics, transcript_text, use_cache=True
+    )
 
+def _speculate_research(session_id: str, topics: list):
+    speculations.start(
+        session_id, "research", _research_key(topics, True), run_stage, "research", research_topics_async, topics
+    )
+
+def _speculate_script(session_id: str, research: str):
+    transcript_text = speculations.context(session_id).get("transcript_text")
+    if transcript_text is None:
+        return
+    speculations.start(
+        session_id, "generate_script", _script_key(transcript_text, research, True),
+        run_stage, "generate_script", generate_video_script, transcript_text, research, use_cache=True
+    )
 
 # ============ STEP-BY-STEP ENDPOINTS ============
 
 @router.post("/step/transcribe")
+@cancel_on_disconnect("transcribe")
 async def step_transcribe(request: VideoRequest):
     """Step 1: Trascrizione video YouTube"""
     try:
         logger.info(f"[Step] Starting transcription for: {request.url}")
-        transcript_data = get_transcription(request.url)
+        transcript_data = await run_stage("transcribe", get_transcription_async, request.url, use_cache=not request.bypass_cache)
         logger.info(f"[Step] Transcription complete. Length: {len(transcript_data['text'])} chars")
+        _speculate_topics(request.session_id, transcript_data["text"])
         return {
             "success": True,
             "data": transcript_data,
+            "transcript_handle": await _store_artifact(transcript_data["text"]),
             "next_step": "extract_topics"
         }
     except Exception as e:
@@ -57,16 +145,27 @@ async def step_transcribe(request: VideoRequest):
 
 
 @router.post("/step/extract-topics")
+@cancel_on_disconnect("extract_topics")
 async def step_extract_topics(request: TranscriptRequest):
     """Step 2: Estrazione topics dalla trascrizione"""
+    transcript_text = await _resolve_artifact(request.transcript_text, request.transcript_handle, "transcript_text")
     try:
-        logger.info(f"[Step] Extracting topics from transcript ({len(request.transcript_text)} chars)")
-        topics = extract_topics(request.transcript_text)
+        logger.info(f"[Step] Extracting topics from transcript ({len(transcript_text)} chars)")
+        use_cache = not request.bypass_cache
+        speculated, topics = await speculations.take(
+            request.session_id, "extract_topics", _topics_key(transcript_text, use_cache)
+        )
+        if not speculated:
+            topics = await run_stage("extract_topics", extract_topics, transcript_text, use_cache=use_cache)
         logger.info(f"[Step] Topics extracted: {topics}")
+        speculations.remember(request.session_id, transcript_text=transcript_text)
+        _speculate_research(request.session_id, topics)
         return {
             "success": True,
             "data": topics,
-            "next_step": "research"
+            "topics_handle": await _store_artifact(topics),
+            "next_step": "research",
+            "speculated": speculated
         }
     except Exception as e:
         logger.error(f"[Step] Topic extraction error: {str(e)}")
@@ -75,16 +174,26 @@ async def step_extract_topics(request: TranscriptRequest):
 
 
 @router.post("/step/research")
+@cancel_on_disconnect("research")
 async def step_research(request: TopicsRequest):
     """Step 3: Ricerca approfondita sui topics"""
+    topics = await _resolve_artifact(request.topics, request.topics_handle, "topics")
     try:
-        logger.info(f"[Step] Researching topics: {request.topics}")
-        research_report = research_topics(request.topics)
+        logger.info(f"[Step] Researching topics: {topics}")
+        use_cache = not request.bypass_cache
+        speculated, research_report = await speculations.take(
+            request.session_id, "research", _research_key(topics, use_cache)
+        )
+        if not speculated:
+            research_report = await run_stage("research", research_topics_async, topics, use_cache=use_cache)
         logger.info(f"[Step] Research complete. Length: {len(research_report)} chars")
+        _speculate_script(request.session_id, research_report)
         return {
             "success": True,
             "data": research_report,
-            "next_step": "generate_script"
+            "research_handle": await _store_artifact(research_report),
+            "next_step": "generate_script",
+            "speculated": speculated
         }
     except Exception as e:
         logger.error(f"[Step] Research error: {str(e)}")
@@ -93,16 +202,29 @@ async def step_research(request: TopicsRequest):
 
 
 @router.post("/step/generate-script")
+@cancel_on_disconnect("generate_script")
 async def step_generate_script(request: GenerateRequest):
     """Step 4: Generazione script finale"""
+    transcript_text = await _resolve_artifact(request.transcript_text, request.transcript_handle, "transcript_text")
+    research = await _resolve_artifact(request.research, request.research_handle, "research")
     try:
         logger.info(f"[Step] Generating script from transcript and research")
-        final_script = generate_video_script(request.transcript_text, request.research)
+        use_cache = not request.bypass_cache
+        speculated, final_script = await speculations.take(
+            request.session_id, "generate_script", _script_key(transcript_text, research, use_cache)
+        )
+        if not speculated:
+            final_script = await run_stage(
+                "generate_script", generate_video_script, transcript_text, research,
+                use_cache=use_cache
+            )
         logger.info(f"[Step] Script generation complete. Length: {len(final_script)} chars")
         return {
             "success": True,
             "data": final_script,
-            "next_step": "completed"
+            "script_handle": await _store_artifact(final_script),
+            "next_step": "completed",
+            "speculated": speculated
         }
     except Exception as e:
         logger.error(f"[Step] Script generation error: {str(e)}")
@@ -110,50 +232,204 @@ async def step_generate_script(request: GenerateRequest):
         return {"success": False, "error": str(e)}
 
 
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@router.post("/step/generate-script/stream")
+async def step_generate_script_stream(request: GenerateRequest):
+    """
+    Step 4 (streaming): come /step/generate-script ma invia lo script come
+    Server-Sent Events man mano che il modello lo scrive.
+    Eventi: `token` ({"text": ...}), poi `done` (stesso payload dell'endpoint
+    non in streaming) oppure `error`.
+    Se il client chiude la connessione lo stream viene interrotto e la
+    generazione si ferma al token successivo.
+    """
+    transcript_text = await _resolve_artifact(request.transcript_text, request.transcript_handle, "transcript_text")
+    research = await _resolve_artifact(request.research, request.research_handle, "research")
+
+    async def event_stream():
+        parts = []
+        with deadlines.deadline_scope(request_deadline()) as deadline:
+            try:
+                logger.info(f"[Step] Streaming script generation from transcript and research")
+                use_cache = not request.bypass_cache
+                speculated, final_script = await speculations.take(
+                    request.session_id, "generate_script", _script_key(transcript_text, research, use_cache)
+                )
+                if speculated:
+                    # Script già pronto in background: un solo token con il testo completo
+                    yield _sse_event("token", {"text": final_script})
+                    yield _sse_event("done", {
+                        "success": True, "data": final_script, "script_handle": await _store_artifact(final_script),
+                        "next_step": "completed", "speculated": True
+                    })
+                    return
+                async with stage_executor.slot("generate_script"):
+                    async for delta in stream_video_script_async(transcript_text, research, use_cache=use_cache):
+                        deadlines.check()
+                        parts.append(delta)
+                        yield _sse_event("token", {"text": delta})
+                final_script = "".join(parts)
+                logger.info(f"[Step] Script streaming complete. Length: {len(final_script)} chars")
+                yield _sse_event("done", {
+                    "success": True, "data": final_script, "script_handle": await _store_artifact(final_script),
+                    "next_step": "completed"
+                })
+            except asyncio.CancelledError:
+                # Starlette cancella lo stream quando il client chiude la connessione
+                deadline.cancel("client_disconnect")
+                REQUEST_CANCELLATIONS.inc(stage="generate_script", reason="client_disconnect")
+                logger.info("[Step] Script streaming interrotto (client_disconnect)")
+                raise
+            except Exception as e:
+                logger.error(f"[Step] Script streaming error: {str(e)}")
+                logger.error(traceback.format_exc())
+                yield _sse_event("error", {"success": False, "error": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/queue")
+async def queue_status():
+    """Concorrenza e profondità della coda per ogni stage."""
+    stats = stage_executor.stats()
+    stats["providers"] = provider_stats()
+    stats["provider_health"] = provider_health()
+    stats["speculation"] = speculations.stats()
+    stats["llm_routing"] = router_stats()
+    stats["jobs"] = await asyncio.to_thread(get_job_store().counts)
+    return stats
+
+
+STAGE_RUNNING = gauge("pipeline_stage_running", "Step in esecuzione per stage", ("stage",))
+STAGE_WAITING = gauge("pipeline_stage_waiting", "Step in attesa di un posto per stage", ("stage",))
+PROVIDER_IN_FLIGHT = gauge("provider_in_flight", "Chiamate in corso verso il provider", ("provider",))
+JOBS_BY_STATUS = gauge("jobs", "Job della pipeline completa per stato", ("status",))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Metriche per stage (latenze, attese, token, cache, errori) in formato Prometheus."""
+    for stage, stats in stage_executor.stats()["stages"].items():
+        STAGE_RUNNING.set(stats["running"], stage=stage)
+        STAGE_WAITING.set(stats["waiting"], stage=stage)
+    for provider, stats in provider_stats().items():
+        PROVIDER_IN_FLIGHT.set(stats["in_flight"], provider=provider)
+    for status, count in (await asyncio.to_thread(get_job_store().counts)).items():
+        JOBS_BY_STATUS.set(count, status=status)
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+def _cache_stats() -> dict:
+    return {
+        "transcripts": get_transcript_cache().stats(),
+        "llm": llm_cache_stats(),
+        "artifacts": get_artifact_store().stats(),
+        "research": get_research_store().stats()
+    }
+
+
+@router.get("/cache")
+async def cache_status():
+    """Occupazione delle cache su disco e hit/miss delle risposte LLM."""
+    # Le statistiche leggono SQLite: fuori dall'event loop, come tutte le chiamate al job store
+    return await asyncio.to_thread(_cache_stats)
+
+
 # ============ LEGACY ENDPOINTS (per compatibilità) ============
 
 @router.post("/process-video")
-async def process_video(request: VideoRequest, background_tasks: BackgroundTasks):
-    job_id = str(len(job_store) + 1)
-    job_store[job_id] = {"step": "queued", "logs": []}
-    
-    background_tasks.add_task(run_full_pipeline, job_id, request.url)
-    
-    return {"job_id": job_id, "status": "queued"}
+async def process_video(request: VideoRequest):
+    job = await asyncio.to_thread(get_job_store().create, request.url, {"use_cache": not request.bypass_cache})
+    return {"job_id": job["job_id"], "status": "queued"}
 
 @router.get("/status/{job_id}")
 async def get_status(job_id: str):
-    if job_id not in job_store:
+    job = await asyncio.to_thread(get_job_store().get, job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return job_store[job_id]
+    return job_status_payload(job)
 
-def run_full_pipeline(job_id: str, url: str):
-    try:
-        logger.info(f"[Job {job_id}] Starting transcription...")
-        job_store[job_id]["step"] = "transcribing"
-        transcript_data = get_transcription(url)
-        job_store[job_id]["transcript"] = transcript_data
-        
-        logger.info(f"[Job {job_id}] Starting topic extraction...")
-        job_store[job_id]["step"] = "extracting_topics"
-        topics = extract_topics(transcript_data["text"])
-        job_store[job_id]["topics"] = topics
-        
-        logger.info(f"[Job {job_id}] Starting research...")
-        job_store[job_id]["step"] = "researching"
-        research_report = research_topics(topics)
-        job_store[job_id]["research"] = research_report
-        
-        logger.info(f"[Job {job_id}] Starting script generation...")
-        job_store[job_id]["step"] = "generating_script"
-        final_script = generate_video_script(transcript_data["text"], research_report)
-        job_store[job_id]["final_script"] = final_script
-        
-        job_store[job_id]["step"] = "completed"
-        logger.info(f"[Job {job_id}] Pipeline completed successfully!")
-        
-    except Exception as e:
-        logger.error(f"Error in pipeline: {str(e)}")
-        logger.error(traceback.format_exc())
-        job_store[job_id]["step"] = "error"
-        job_store[job_id]["error"] = str(e)
+@router.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    """Rimette in coda un job fallito: riparte dall'ultimo step completato."""
+    store = get_job_store()
+    if await asyncio.to_thread(store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await asyncio.to_thread(store.requeue, job_id):
+        raise HTTPException(status_code=409, detail="Solo i job in errore possono essere rimessi in coda")
+    return {"job_id": job_id, "status": "queued"}
+
+
+# ============ BATCH ============
+
+@router.post("/batch")
+async def submit_batch(request: BatchRequest):
+    """
+    Accoda la pipeline completa per molti video in un colpo solo.
+    Gli URL dello stesso video (youtu.be, watch?v=, shorts...) vengono
+    processati una volta sola; gli URL non riconosciuti vengono scartati.
+    """
+    max_urls = int(os.getenv("BATCH_MAX_URLS", "500"))
+    if len(request.urls) > max_urls:
+        raise HTTPException(status_code=400, detail=f"Massimo {max_urls} URL per batch")
+
+    unique_urls = {}
+    duplicates = []
+    invalid = []
+    for url in request.urls:
+        video_id = normalize_video_id(url)
+        if video_id is None:
+            invalid.append(url)
+        elif video_id in unique_urls:
+            duplicates.append(url)
+        else:
+            unique_urls[video_id] = url.strip()
+
+    if not unique_urls:
+        raise HTTPException(status_code=400, detail="Nessun URL YouTube valido nel batch")
+
+    info = {"submitted": len(request.urls), "duplicates": duplicates, "invalid": invalid}
+    batch_id = await asyncio.to_thread(
+        get_job_store().create_batch, list(unique_urls.values()), {"use_cache": not request.bypass_cache}, info
+    )
+    logger.info(f"[Batch {batch_id}] {len(unique_urls)} video accodati ({len(duplicates)} duplicati, {len(invalid)} non validi)")
+    return {
+        "batch_id": batch_id,
+        "status": "queued",
+        "jobs": len(unique_urls),
+        "duplicates": duplicates,
+        "invalid": invalid
+    }
+
+
+@router.get("/batch/{batch_id}")
+async def get_batch(batch_id: str, offset: int = 0, limit: int = 50):
+    """Avanzamento aggregato del batch e pagina di risultati (`offset`/`limit`)."""
+    store = get_job_store()
+    batch = await asyncio.to_thread(store.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    limit = max(1, min(limit, 200))
+    counts = await asyncio.to_thread(store.counts, batch_id)
+    jobs = await asyncio.to_thread(store.list_batch_jobs, batch_id, offset, limit)
+    total = sum(counts.values())
+    done = counts.get("completed", 0) + counts.get("error", 0)
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "counts": counts,
+        "progress": round(done / total, 3) if total else 1.0,
+        "finished": done == total,
+        **batch["info"],
+        "offset": offset,
+        "limit": limit,
+        "items": [job_status_payload(job) for job in jobs]
+    }
@@ -0,0 +1,156 @@
+"""
+Execution layer per gli step della pipeline.
+
+Le funzioni in `execution/` sono sincrone e bloccanti (Apify, OpenRouter):
+qui vengono eseguite fuori dall'event loop su un pool di thread o di processi,
+con un limite di concorrenza separato per ogni stage e contatori sulla coda.
+
+Configurazione (.env):
+    PIPELINE_EXECUTOR=thread|process       tipo di pool (default: thread)
+    PIPELINE_MAX_WORKERS=32                dimensione del pool
+    STAGE_CONCURRENCY_<STAGE>=N            limite per stage (es. STAGE_CONCURRENCY_TRANSCRIBE=4)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from execution.metrics import STAGE_QUEUE_WAIT, track_stage
+
+logger = logging.getLogger(__name__)
+
+# Limiti di default: Apify e Sonar sono i più lenti/costosi, gli step LLM puri reggono di più
+DEFAULT_STAGE_LIMITS = {
+    "transcribe": 8,
+    "extract_topics": 16,
+    "research": 8,
+    "generate_script": 16,
+}
+
+
+def _limits_from_env() -> dict:
+    limits = {}
+    for stage, default in DEFAULT_STAGE_LIMITS.items():
+        value = os.getenv(f"STAGE_CONCURRENCY_{stage.upper()}")
+        limits[stage] = int(value) if value else default
+    return limits
+
+
+class StageExecutor:
+    """
+    Esegue funzioni sincrone su un pool condiviso, con un semaforo per stage.
+    Le richieste oltre il limite dello stage restano in attesa (queue depth)
+    senza occupare un worker del pool.
+    """
+
+    def __init__(self, mode: str = None, max_workers: int = None, stage_limits: dict = None):
+        self.mode = (mode or os.getenv("PIPELINE_EXECUTOR", "thread")).lower()
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"PIPELINE_EXECUTOR non valido: {self.mode} (usa 'thread' o 'process')")
+        self.max_workers = max_workers or int(os.getenv("PIPELINE_MAX_WORKERS", "32"))
+        self.stage_limits = stage_limits or _limits_from_env()
+
+        self._pool: Executor = None
+        self._semaphores = {}
+        self._waiting = {stage: 0 for stage in self.stage_limits}
+        self._running = {stage: 0 for stage in self.stage_limits}
+        self._completed = {stage: 0 for stage in self.stage_limits}
+        self._failed = {stage: 0 for stage in self.stage_limits}
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+            logger.info(f"[Executor] Pool '{self.mode}' avviato con {self.max_workers} worker")
+        return self._pool
+
+    def _get_semaphore(self, stage: str) -> asyncio.Semaphore:
+        if stage not in self._semaphores:
+            limit = self.stage_limits.setdefault(stage, self.max_workers)
+            for counter in (self._waiting, self._running, self._completed, self._failed):
+                counter.setdefault(stage, 0)
+            self._semaphores[stage] = asyncio.Semaphore(limit)
+        return self._semaphores[stage]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, stage: str):
+        """Attende un posto libero nello stage e aggiorna contatori e metriche."""
+        semaphore = self._get_semaphore(stage)
+
+        self._waiting[stage] += 1
+        started = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[stage] -= 1
+        STAGE_QUEUE_WAIT.observe(time.perf_counter() - started, stage=stage)
+
+        self._running[stage] += 1
+        try:
+            with track_stage(stage):
+                yield
+            self._completed[stage] += 1
+        except BaseException:
+            self._failed[stage] += 1
+            raise
+        finally:
+            self._running[stage] -= 1
+            semaphore.release()
+
+    async def run(self, stage: str, fn, *args, **kwargs):
+        """
+        Esegue `fn(*args, **kwargs)` sul pool rispettando il limite dello stage.
+        In modalità thread il contextvars corrente viene propagato al worker.
+        """
+        async with self.slot(stage):
+            if self.mode == "process":
+                call = functools.partial(fn, *args, **kwargs)
+            else:
+                call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._get_pool(), call)
+
+    async def run_async(self, stage: str, coro_fn, *args, **kwargs):
+        """Come `run`, per funzioni già asincrone: applica solo il limite dello stage."""
+        async with self.slot(stage):
+            return await coro_fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        """Snapshot di concorrenza e coda per ogni stage."""
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "stages": {
+                stage: {
+                    "limit": limit,
+                    "running": self._running.get(stage, 0),
+                    "waiting": self._waiting.get(stage, 0),
+                    "completed": self._completed.get(stage, 0),
+                    "failed": self._failed.get(stage, 0),
+                }
+                for stage, limit in self.stage_limits.items()
+            },
+        }
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+# Istanza condivisa dal processo uvicorn
+stage_executor = StageExecutor()
+
+
+async def run_stage(stage: str, fn, *args, **kwargs):
+    """Scorciatoia per `stage_executor.run` / `stage_executor.run_async`."""
+    if inspect.iscoroutinefunction(fn):
+        return await stage_executor.run_async(stage, fn, *args, **kwargs)
+    return await stage_executor.run(stage, fn, *args, **kwargs)
@@ -0,0 +1,351 @@
+"""
+Job store persistente e coda per la pipeline completa (/api/process-video).
+
+I job sopravvivono ai riavvii e sono condivisi tra più processi uvicorn e
+worker: ogni worker "prende in carico" un job con un lease a tempo; se il
+worker muore il lease scade e il job torna disponibile, ripartendo dagli
+step già salvati.
+
+Configurazione (.env):
+    JOB_STORE_BACKEND=sqlite        backend registrato (vedi `register_backend`)
+    JOB_STORE_PATH=...              file SQLite (default .tmp/jobs.sqlite3)
+    JOB_TTL_SECONDS=604800          dopo quanto eliminare i job terminati (default 7 giorni)
+    JOB_LEASE_SECONDS=300           durata del lease di un worker
+    JOB_MAX_ATTEMPTS=3              tentativi prima di marcare il job in errore
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from execution.disk_cache import PROJECT_ROOT
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_ERROR = "error"
+
+
+class JobStore:
+    """
+    Interfaccia dei backend di persistenza dei job.
+    Un job è un dict con: job_id, url, status, step, options, data (output
+    degli step), error, attempts, batch_id, created_at, updated_at.
+    """
+
+    def create(self, url: str, options: dict = None, batch_id: str = None) -> dict:
+        raise NotImplementedError
+
+    def create_batch(self, urls: list, options: dict = None, info: dict = None) -> str:
+        """Crea un batch e un job per ogni URL (già deduplicati); restituisce il batch_id."""
+        raise NotImplementedError
+
+    def get_batch(self, batch_id: str):
+        raise NotImplementedError
+
+    def list_batch_jobs(self, batch_id: str, offset: int = 0, limit: int = 50) -> list:
+        """Job del batch nell'ordine di inserimento, paginati."""
+        raise NotImplementedError
+
+    def get(self, job_id: str):
+        raise NotImplementedError
+
+    def update(self, job_id: str, step: str = None, data: dict = None, worker_id: str = None, **fields) -> bool:
+        """
+        Aggiorna campi del job; `data` viene unito agli output già salvati.
+        Con `worker_id` aggiorna solo se il job è ancora in corso presso quel worker.
+        Restituisce False se non è stato aggiornato nulla.
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease_seconds: float):
+        """Assegna atomicamente il job in coda più vecchio (o con lease scaduto) al worker."""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        raise NotImplementedError
+
+    def finish(self, job_id: str, worker_id: str, status: str, error: str = None) -> bool:
+        """Chiude il job solo se è ancora del worker; False se il lease è stato perso."""
+        raise NotImplementedError
+
+    def requeue(self, job_id: str) -> bool:
+        """Rimette in coda un job terminato in errore, mantenendo gli step completati."""
+        raise NotImplementedError
+
+    def cleanup(self, ttl_seconds: float) -> int:
+        """Elimina i job terminati più vecchi di `ttl_seconds`; restituisce quanti."""
+        raise NotImplementedError
+
+    def counts(self, batch_id: str = None) -> dict:
+        """Numero di job per stato (di tutto lo store o di un batch)."""
+        raise NotImplementedError
+
+
+class SQLiteJobStore(JobStore):
+    """Backend di default: un file SQLite condiviso da tutti i processi sulla stessa macchina."""
+
+    def __init__(self, path: str = None, max_attempts: int = None):
+        self.path = path or os.getenv("JOB_STORE_PATH", os.path.join(PROJECT_ROOT, ".tmp", "jobs.sqlite3"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                step TEXT NOT NULL,
+                options TEXT NOT NULL,
+                data TEXT NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "batch_id" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                info TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transazioni esplicite (BEGIN IMMEDIATE per il claim)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["data"] = json.loads(job["data"])
+        return job
+
+    def _insert_job(self, conn: sqlite3.Connection, url: str, options: dict, batch_id: str) -> str:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (job_id, url, status, step, options, data, batch_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, '{}', ?, ?, ?)",
+            (job_id, url, STATUS_QUEUED, "queued", json.dumps(options or {}), batch_id, now, now)
+        )
+        return job_id
+
+    def create(self, url: str, options: dict = None, batch_id: str = None) -> dict:
+        job_id = self._insert_job(self._connect(), url, options, batch_id)
+        return self.get(job_id)
+
+    def create_batch(self, urls: list, options: dict = None, info: dict = None) -> str:
+        batch_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO batches (batch_id, info, created_at) VALUES (?, ?, ?)",
+                (batch_id, json.dumps(info or {}, ensure_ascii=False), time.time())
+            )
+            for url in urls:
+                self._insert_job(conn, url, options, batch_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return batch_id
+
+    def get_batch(self, batch_id: str):
+        row = self._connect().execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        batch = dict(row)
+        batch["info"] = json.loads(batch["info"])
+        return batch
+
+    def list_batch_jobs(self, batch_id: str, offset: int = 0, limit: int = 50) -> list:
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE batch_id = ? ORDER BY rowid LIMIT ? OFFSET ?",
+            (batch_id, limit, offset)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def get(self, job_id: str):
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def update(self, job_id: str, step: str = None, data: dict = None, worker_id: str = None, **fields) -> bool:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if worker_id is None:
+                row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT data FROM jobs WHERE job_id = ? AND worker_id = ? AND status = ?",
+                    (job_id, worker_id, STATUS_RUNNING)
+                ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            if step is not None:
+                fields["step"] = step
+            if data:
+                merged = json.loads(row["data"])
+                merged.update(data)
+                fields["data"] = json.dumps(merged, ensure_ascii=False)
+            fields["updated_at"] = time.time()
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def claim(self, worker_id: str, lease_seconds: float):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Job rimasti "running" con lease scaduto: il worker è morto, si riprendono
+            expired = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (STATUS_RUNNING, now, self.max_attempts)
+            ).fetchall()
+            for row in expired:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, step = ?, error = ?, worker_id = NULL, lease_until = NULL, updated_at = ? "
+                    "WHERE job_id = ?",
+                    (STATUS_ERROR, STATUS_ERROR, "Numero massimo di tentativi raggiunto", now, row["job_id"])
+                )
+
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED, STATUS_RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE job_id = ?",
+                (STATUS_RUNNING, worker_id, now + lease_seconds, now, row["job_id"])
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row["job_id"])
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker_id = ? AND status = ?",
+            (time.time() + lease_seconds, job_id, worker_id, STATUS_RUNNING)
+        )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, worker_id: str, status: str, error: str = None) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, step = ?, error = ?, worker_id = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE job_id = ? AND worker_id = ? AND status = ?",
+            (status, status, error, time.time(), job_id, worker_id, STATUS_RUNNING)
+        )
+        return cursor.rowcount == 1
+
+    def requeue(self, job_id: str) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, step = ?, error = NULL, attempts = 0, updated_at = ? "
+            "WHERE job_id = ? AND status = ?",
+            (STATUS_QUEUED, "queued", time.time(), job_id, STATUS_ERROR)
+        )
+        return cursor.rowcount == 1
+
+    def cleanup(self, ttl_seconds: float) -> int:
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (STATUS_COMPLETED, STATUS_ERROR, time.time() - ttl_seconds)
+        )
+        conn.execute(
+            "DELETE FROM batches WHERE created_at < ? AND batch_id NOT IN "
+            "(SELECT DISTINCT batch_id FROM jobs WHERE batch_id IS NOT NULL)",
+            (time.time() - ttl_seconds,)
+        )
+        return cursor.rowcount
+
+    def counts(self, batch_id: str = None) -> dict:
+        if batch_id is None:
+            rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        else:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) AS n FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+_BACKENDS = {
+    "sqlite": SQLiteJobStore,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def register_backend(name: str, factory):
+    """Registra un backend alternativo (es. Redis/Postgres) selezionabile con JOB_STORE_BACKEND."""
+    _BACKENDS[name] = factory
+
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv("JOB_STORE_BACKEND", "sqlite")
+                if backend not in _BACKENDS:
+                    raise ValueError(f"JOB_STORE_BACKEND sconosciuto: {backend}")
+                _store = _BACKENDS[backend]()
+    return _store
+
+
+def job_status_payload(job: dict) -> dict:
+    """Formato di risposta di /api/status: step e output degli step al primo livello."""
+    payload = {
+        "job_id": job["job_id"],
+        "url": job["url"],
+        "batch_id": job.get("batch_id"),
+        "status": job["status"],
+        "step": job["step"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "logs": [],
+    }
+    payload.update(job["data"])
+    if job.get("error"):
+        payload["error"] = job["error"]
+    return payload
@@ -0,0 +1,171 @@
+"""
+Precalcolo speculativo dello step successivo, legato a una sessione.
+
+Il frontend esegue gli step uno alla volta e tra uno e l'altro aspetta l'utente:
+se la richiesta porta un `session_id`, appena uno step finisce il server avvia
+in background lo step successivo sul suo output. Quando arriva la chiamata vera
+con lo stesso input (stessa chiave) riceve il risultato già pronto, o aspetta
+quello in corso invece di ripartire da zero; con un input diverso la speculazione
+viene cancellata. Le speculazioni non usate scadono dopo SPECULATION_TTL secondi.
+
+Lo stato vive nel processo (come lo stage executor): con più worker uvicorn una
+richiesta che arriva a un altro processo semplicemente non trova la speculazione.
+
+La speculazione è opzionale: uno step precalcolato costa crediti OpenRouter
+anche quando l'utente non prosegue, quindi va attivata esplicitamente.
+
+Configurazione (.env):
+    SPECULATION_ENABLED=0          1 per precalcolare lo step successivo (default: session_id ignorati)
+    SPECULATION_TTL=600            secondi di validità di una sessione inattiva
+    SPECULATION_MAX_SESSIONS=500   sessioni tenute in memoria (le più vecchie escono)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from execution import deadlines
+from execution.metrics import counter
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = counter("speculation_total", "Esito delle speculazioni per stage", ("stage", "outcome"))
+
+
+class _Session:
+    __slots__ = ("touched_at", "context", "speculations")
+
+    def __init__(self):
+        self.touched_at = time.monotonic()
+        self.context = {}
+        self.speculations = {}  # stage -> (key, task)
+
+
+class SpeculationStore:
+    """Da usare solo dall'event loop (nessun lock: tutto gira sullo stesso thread)."""
+
+    def __init__(self, ttl: float = None, max_sessions: int = None, enabled: bool = None):
+        self.ttl = ttl or float(os.getenv("SPECULATION_TTL", "600"))
+        self.max_sessions = max_sessions or int(os.getenv("SPECULATION_MAX_SESSIONS", "500"))
+        if enabled is None:
+            enabled = os.getenv("SPECULATION_ENABLED", "0").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self._sessions = OrderedDict()
+
+    def _session(self, session_id: str) -> _Session:
+        self._sweep()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+            while len(self._sessions) > self.max_sessions:
+                _, oldest = self._sessions.popitem(last=False)
+                self._discard(oldest, "expired")
+        session.touched_at = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _sweep(self):
+        deadline = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.touched_at >= deadline:
+                break
+            del self._sessions[session_id]
+            self._discard(session, "expired")
+
+    def _discard(self, session: _Session, outcome: str):
+        for stage, (_, task) in session.speculations.items():
+            if not task.done():
+                task.cancel()
+            OUTCOMES.inc(stage=stage, outcome=outcome)
+        session.speculations.clear()
+
+    def remember(self, session_id: str, **context):
+        """Salva dati della sessione utili agli step successivi (es. la trascrizione)."""
+        if session_id and self.enabled:
+            self._session(session_id).context.update(context)
+
+    def context(self, session_id: str) -> dict:
+        if not session_id or not self.enabled:
+            return {}
+        return self._session(session_id).context
+
+    def start(self, session_id: str, stage: str, key: str, coro_fn, *args, **kwargs):
+        """Avvia `coro_fn(*args, **kwargs)` in background come speculazione di `stage`."""
+        if not session_id or not self.enabled:
+            return
+        session = self._session(session_id)
+        previous = session.speculations.pop(stage, None)
+        if previous is not None:
+            if previous[0] == key:
+                session.speculations[stage] = previous
+                return
+            previous[1].cancel()
+            OUTCOMES.inc(stage=stage, outcome="cancelled")
+
+        # La speculazione sopravvive alla richiesta che l'ha avviata: non ne eredita la scadenza
+        with deadlines.detached():
+            task = asyncio.create_task(coro_fn(*args, **kwargs))
+        # Consuma l'eventuale errore: la chiamata vera rifarà lo step
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        session.speculations[stage] = (key, task)
+        OUTCOMES.inc(stage=stage, outcome="started")
+        logger.info(f"[Speculation] {stage} avviato in background per la sessione {session_id}")
+
+    async def take(self, session_id: str, stage: str, key: str) -> tuple:
+        """
+        Restituisce (True, risultato) se c'è una speculazione di `stage` con la
+        stessa chiave (aspettandola se ancora in corso), altrimenti (False, None).
+        Una speculazione con chiave diversa viene cancellata.
+        """
+        if not session_id or not self.enabled:
+            return False, None
+        session = self._session(session_id)
+        entry = session.speculations.pop(stage, None)
+        if entry is None:
+            return False, None
+
+        speculated_key, task = entry
+        if speculated_key != key:
+            task.cancel()
+            OUTCOMES.inc(stage=stage, outcome="cancelled")
+            return False, None
+
+        try:
+            # shield: se il client si disconnette non buttiamo via il lavoro in corso
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                OUTCOMES.inc(stage=stage, outcome="failed")
+                return False, None
+            # Chi aspettava se n'è andato: la speculazione resta disponibile per la prossima
+            # chiamata con la stessa chiave (se nel frattempo non ne è partita un'altra)
+            session.speculations.setdefault(stage, entry)
+            raise
+        except Exception as e:
+            logger.warning(f"[Speculation] {stage} fallito in background ({e}), ricalcolo")
+            OUTCOMES.inc(stage=stage, outcome="failed")
+            return False, None
+        OUTCOMES.inc(stage=stage, outcome="hit")
+        return True, result
+
+    def cancel_all(self):
+        for session in self._sessions.values():
+            self._discard(session, "cancelled")
+        self._sessions.clear()
+
+    def stats(self) -> dict:
+        self._sweep()
+        return {
+            "enabled": self.enabled,
+            "sessions": len(self._sessions),
+            "in_flight": sum(
+                1 for session in self._sessions.values()
+                for _, task in session.speculations.values() if not task.done()
+            ),
+        }
+
+
+speculations = SpeculationStore()
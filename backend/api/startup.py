@@ -0,0 +1,71 @@
+"""
+Avvio a freddo del backend (es. container HF Spaces risvegliato).
+
+Gli SDK dei provider (openai, apify_client) non vengono importati all'avvio ma
+alla prima chiamata; `prewarm()` li importa e crea i client durante il lifespan
+di FastAPI, così il costo non ricade sulla prima richiesta. In modalità
+"background" il server accetta richieste subito e il prewarm gira in un thread;
+in "blocking" l'avvio finisce solo a prewarm completato.
+I tempi (secondi dall'avvio del processo) sono esposti su /api/health.
+
+Configurazione (.env):
+    STARTUP_PREWARM=background     background | blocking | off
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from execution.openrouter_client import warm_up as warm_up_openrouter, get_async_client
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimings:
+    def __init__(self, started: float):
+        self.started = started  # time.perf_counter() all'inizio di main.py
+        self.marks = {}
+
+    def mark(self, name: str):
+        self.marks[name] = round(time.perf_counter() - self.started, 3)
+
+    def snapshot(self) -> dict:
+        return {**self.marks, "uptime_s": round(time.perf_counter() - self.started, 1)}
+
+
+def _prewarm_sync() -> dict:
+    """Import degli SDK e creazione dei client sincroni (gira in un thread)."""
+    errors = {}
+    try:
+        warm_up_openrouter()
+    except Exception as e:
+        # Tipicamente OPENROUTER_API_KEY mancante: l'errore vero arriverà alla prima richiesta
+        errors["openrouter"] = str(e)
+    try:
+        import apify_client  # noqa: F401
+    except Exception as e:
+        errors["apify"] = str(e)
+    return errors
+
+
+async def _prewarm(timings: StartupTimings):
+    errors = await asyncio.to_thread(_prewarm_sync)
+    if "openrouter" not in errors:
+        # Il client async è legato all'event loop: va creato da qui
+        get_async_client()
+    timings.mark("prewarm_s")
+    for provider, error in errors.items():
+        logger.warning(f"[Startup] Prewarm {provider} non riuscito: {error}")
+    logger.info(f"[Startup] Prewarm completato in {timings.marks['prewarm_s']}s dall'avvio")
+
+
+async def prewarm(timings: StartupTimings):
+    """Da chiamare nel lifespan; restituisce il task in background (o None)."""
+    mode = os.getenv("STARTUP_PREWARM", "background").lower()
+    if mode in ("off", "0", "false", "no"):
+        return None
+    if mode == "blocking":
+        await _prewarm(timings)
+        return None
+    return asyncio.create_task(_prewarm(timings))
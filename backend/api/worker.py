@@ -0,0 +1,258 @@
+"""
+Worker della pipeline completa: consumano i job dal job store persistente.
+
+Possono girare dentro il processo API (thread avviati allo startup, vedi
+JOB_WORKERS_EMBEDDED) oppure come processi dedicati:
+
+    cd backend && python -m api.worker --processes 2 --concurrency 4
+
+La pipeline gira come grafo di stage (execution/pipeline.py): ogni job riparte
+dagli stage salvati, quindi se un worker muore o un job viene rimesso in coda
+dopo un errore gli stage già completati non vengono rifatti.
+
+Configurazione (.env):
+    JOB_WORKERS_EMBEDDED=1          avvia i worker nel processo API (0 = solo processi dedicati)
+    JOB_WORKER_CONCURRENCY=2        job in parallelo per processo
+    JOB_POLL_INTERVAL=1.0           secondi tra un controllo della coda e l'altro
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+
+# Add parent directory to path so execution module can be found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from execution.pipeline import run_video_pipeline
+from execution import deadlines
+
+from .job_queue import JobStore, get_job_store, STATUS_COMPLETED, STATUS_ERROR
+
+logger = logging.getLogger(__name__)
+
+
+class _Heartbeat:
+    """
+    Rinnova il lease del job in background finché la pipeline lavora. Se il
+    lease viene perso (es. il job è stato ripreso da un altro worker) cancella
+    la scadenza della pipeline: gli stage si fermano alla prossima chiamata ai
+    provider (deadlines.check) e il job non viene più toccato da questo worker.
+    """
+
+    def __init__(self, store: JobStore, job_id: str, worker_id: str, lease_seconds: float,
+                 deadline: deadlines.Deadline):
+        self.store = store
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.deadline = deadline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def lost(self) -> bool:
+        return self.deadline.cancel_reason == "lease_lost"
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            if not self.store.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                logger.warning(f"[Job {self.job_id}] Lease perso dal worker {self.worker_id}, interrompo")
+                self.deadline.cancel("lease_lost")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# Stage del grafo -> chiave nel job record (stessi nomi della vecchia risposta di /api/status)
+STAGE_OUTPUT_KEYS = {
+    "fetch_transcript": "raw_transcript",
+    "translate": "transcript",
+    "extract_topics": "topics",
+    "research": "research",
+    "generate_script": "final_script",
+}
+
+STAGE_STEP_LABELS = {
+    "fetch_transcript": "transcribing",
+    "translate": "translating",
+    "extract_topics": "extracting_topics",
+    "research": "researching",
+    "generate_script": "generating_script",
+}
+
+
+def run_full_pipeline(store: JobStore, job: dict, heartbeat: _Heartbeat = None):
+    """
+    Esegue gli stage mancanti del job, salvando l'output di ognuno appena
+    pronto insieme al tempo impiegato (data["timings"], secondi per stage).
+    Con il lease perso gli output non vengono più salvati e la pipeline si ferma.
+    """
+    job_id = job["job_id"]
+    worker_id = heartbeat.worker_id if heartbeat is not None else None
+    data = job["data"]
+    timings = dict(data.get("timings", {}))
+    timings_lock = threading.Lock()
+    checkpoints = {
+        stage: data[key] for stage, key in STAGE_OUTPUT_KEYS.items() if key in data
+    }
+
+    def lease_lost():
+        # Il job non è più nostro (ripreso da un altro worker o rimesso in coda): ci si ferma
+        # senza aspettare il prossimo heartbeat
+        logger.warning(f"[Job {job_id}] Lease perso dal worker {worker_id}, interrompo")
+        if heartbeat is not None:
+            heartbeat.deadline.cancel("lease_lost")
+
+    def on_stage_start(stage: str):
+        deadlines.check()
+        logger.info(f"[Job {job_id}] Starting {stage}...")
+        if not store.update(job_id, step=STAGE_STEP_LABELS[stage], worker_id=worker_id):
+            lease_lost()
+            deadlines.check()
+
+    def on_stage_complete(stage: str, output, seconds: float):
+        if heartbeat is not None and heartbeat.lost:
+            return
+        logger.info(f"[Job {job_id}] {stage} completed in {seconds}s")
+        with timings_lock:
+            timings[stage] = seconds
+            if not store.update(job_id, data={STAGE_OUTPUT_KEYS[stage]: output, "timings": dict(timings)},
+                                worker_id=worker_id):
+                lease_lost()
+
+    run_video_pipeline(
+        job["url"],
+        use_cache=job["options"].get("use_cache", True),
+        checkpoints=checkpoints,
+        on_stage_start=on_stage_start,
+        on_stage_complete=on_stage_complete
+    )
+
+
+def process_job(store: JobStore, job: dict, worker_id: str, lease_seconds: float):
+    job_id = job["job_id"]
+    with deadlines.deadline_scope() as deadline:
+        heartbeat = _Heartbeat(store, job_id, worker_id, lease_seconds, deadline)
+        try:
+            with heartbeat:
+                run_full_pipeline(store, job, heartbeat)
+            status, error = STATUS_COMPLETED, None
+        except Exception as e:
+            if heartbeat.lost:
+                logger.warning(f"[Job {job_id}] Interrotto: il job è ora di un altro worker")
+                return
+            logger.error(f"Error in pipeline: {str(e)}")
+            logger.error(traceback.format_exc())
+            status, error = STATUS_ERROR, str(e)
+
+    if not store.finish(job_id, worker_id, status, error=error):
+        logger.warning(f"[Job {job_id}] Lease perso dal worker {worker_id}: esito {status} scartato")
+    elif status == STATUS_COMPLETED:
+        logger.info(f"[Job {job_id}] Pipeline completed successfully!")
+
+
+def worker_loop(stop_event: threading.Event, worker_id: str, store: JobStore = None):
+    """Ciclo di un worker: prende un job, lo esegue, ricomincia. Pulisce i job scaduti ogni tanto."""
+    store = store or get_job_store()
+    lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+    poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+    ttl_seconds = float(os.getenv("JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+    next_cleanup = 0.0
+
+    logger.info(f"[Worker {worker_id}] Avviato")
+    while not stop_event.is_set():
+        try:
+            if time.time() >= next_cleanup:
+                removed = store.cleanup(ttl_seconds)
+                if removed:
+                    logger.info(f"[Worker {worker_id}] Eliminati {removed} job scaduti")
+                next_cleanup = time.time() + 3600
+
+            job = store.claim(worker_id, lease_seconds)
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            logger.info(f"[Worker {worker_id}] Job {job['job_id']} preso in carico (tentativo {job['attempts']})")
+            process_job(store, job, worker_id, lease_seconds)
+        except Exception as e:
+            logger.error(f"[Worker {worker_id}] Errore nel ciclo: {e}")
+            stop_event.wait(poll_interval)
+    logger.info(f"[Worker {worker_id}] Fermato")
+
+
+def _new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def start_workers(concurrency: int = None) -> tuple:
+    """
+    Avvia `concurrency` thread worker nel processo corrente.
+    Restituisce (stop_event, threads) per poterli fermare.
+    """
+    concurrency = concurrency or int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+    stop_event = threading.Event()
+    threads = []
+    for _ in range(concurrency):
+        thread = threading.Thread(
+            target=worker_loop, args=(stop_event, _new_worker_id()), daemon=True, name="job-worker"
+        )
+        thread.start()
+        threads.append(thread)
+    return stop_event, threads
+
+
+def stop_workers(stop_event: threading.Event, threads: list, timeout: float = 5.0):
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout)
+
+
+def _run_process(concurrency: int):
+    logging.basicConfig(level=logging.INFO)
+    stop_event, threads = start_workers(concurrency)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_workers(stop_event, threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker della pipeline video")
+    parser.add_argument("--processes", type=int, default=1, help="numero di processi worker")
+    parser.add_argument("--concurrency", type=int, default=None, help="job in parallelo per processo")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _run_process(args.concurrency)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_run_process, args=(args.concurrency,), daemon=False)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
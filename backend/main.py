@@ -3,19 +3,49 @@ Backend API con FastAPI.
 Entry point principale per l'API.
 """
 
+import time
+
+# Inizio dell'avvio: riferimento per i tempi di cold start riportati su /api/health
+_BOOT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.middleware.gzip import GZipMiddleware
 import os
+import sys
+
+# Carica variabili d'ambiente (una sola volta: gli script di execution/ riusano lo stesso loader).
+# La cartella execution/ sta accanto a backend/ in locale e in /app (PYTHONPATH) nel container.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from execution.env_loader import load_env
+
+load_env(os.path.dirname(os.path.abspath(__file__)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvio: worker dei job e prewarm dei client. Chiusura: pool degli step e worker."""
+    global _job_workers
+    if os.getenv("JOB_WORKERS_EMBEDDED", "1").lower() not in ("0", "false", "no"):
+        _job_workers = worker.start_workers()
+    prewarm_task = await startup.prewarm(startup_timings)
+    startup_timings.mark("ready_s")
+    yield
+    if prewarm_task is not None and not prewarm_task.done():
+        prewarm_task.cancel()
+    endpoints.speculations.cancel_all()
+    endpoints.stage_executor.shutdown(wait=False)
+    if _job_workers is not None:
+        worker.stop_workers(*_job_workers)
 
-# Carica variabili d'ambiente
-load_dotenv()
 
 # Inizializza app FastAPI
 app = FastAPI(
     title="App API",
     description="API Backend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configura CORS per permettere richieste dal frontend
@@ -36,6 +66,27 @@ app.add_middleware(
 )
 
 
+class StreamSafeGZipMiddleware:
+    """GZip per le risposte JSON, escluso lo streaming SSE (la compressione bufferizza i token)."""
+
+    def __init__(self, app, minimum_size: int = 1000, compresslevel: int = 6):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].endswith("/stream"):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+app.add_middleware(
+    StreamSafeGZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1000")),
+    compresslevel=int(os.getenv("GZIP_LEVEL", "6"))
+)
+
+
 @app.get("/")
 async def root():
     """Endpoint di health check."""
@@ -44,18 +95,18 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint (con i tempi di avvio del processo)."""
+    return {"status": "healthy", "startup": startup_timings.snapshot()}
 
 # Import e include routers
 try:
     # Tentativo 1: Import relativo (es. esecuzione come modulo) o root flat
-    from api import endpoints
+    from api import endpoints, worker, startup
 except ImportError as e1:
     print(f"Tentativo 1 (flat) fallito: {e1}")
     try:
         # Tentativo 2: Import assoluto (es. esecuzione da root con cartella backend)
-        from backend.api import endpoints
+        from backend.api import endpoints, worker, startup
     except ImportError as e2:
         print(f"Tentativo 2 (nested) fallito: {e2}")
         # Se falliscono entrambi, probabilmente l'errore è nel primo (dipendenze interne)
@@ -64,3 +115,9 @@ except ImportError as e1:
 
 app.include_router(endpoints.router, prefix="/api", tags=["video-processing"])
 
+startup_timings = startup.StartupTimings(_BOOT_STARTED)
+startup_timings.mark("imports_s")
+
+# Worker dei job nel processo API (utile su HF Spaces, dove gira un solo container);
+# avviati nel lifespan, salvo JOB_WORKERS_EMBEDDED=0 (worker dedicati)
+_job_workers = None
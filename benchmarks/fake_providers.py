@@ -0,0 +1,308 @@
+"""
+Script: fake_providers.py
+Obiettivo: Server locali che imitano OpenRouter e Apify, per i benchmark senza crediti API.
+
+- OpenRouter: POST .../chat/completions (anche in streaming SSE), con usage nei token.
+  Le richieste di estrazione topic ricevono una lista JSON, le altre testo di riempimento.
+- Apify: avvio actor, attesa del run (waitForFinish) e lettura paginata del dataset
+  con segmenti {start, dur, text} come pintostudio/youtube-transcript-scraper.
+
+Latenza, velocità di generazione ed errori sono configurabili. Il backend va
+puntato ai fake con:
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:<porta>/api/v1
+    APIFY_API_URL=http://127.0.0.1:<porta>
+
+Uso: python fake_providers.py [--openrouter-port 9101] [--apify-port 9102] [--llm-latency 0.3] ...
+"""
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WORDS = {
+    "it": "il video spiega come la ricerca e i dati cambiano il modo in cui lavoriamo ogni giorno con nuovi strumenti".split(),
+    "en": "the video explains how research and data change the way we work every day with new tools".split(),
+}
+
+
+@dataclass
+class FakeConfig:
+    llm_latency: float = 0.3          # secondi prima del primo token
+    token_rate: float = 200.0         # token al secondo generati
+    completion_tokens: int = 300      # lunghezza delle risposte (limitata da max_tokens)
+    llm_error_rate: float = 0.0       # frazione di richieste con errore
+    llm_error_status: int = 429       # 429 (con Retry-After) oppure 5xx
+    llm_slow_rate: float = 0.0        # frazione di richieste lente (coda della latenza)
+    llm_slow_latency: float = 5.0     # secondi in più per le richieste lente
+    apify_latency: float = 2.0        # durata di un run dell'actor
+    apify_error_rate: float = 0.0     # frazione di run che terminano FAILED
+    segments: int = 600               # segmenti di sottotitoli per video
+    language: str = "en"              # lingua dei sottotitoli (en attiva la traduzione)
+
+
+def _filler(words: int, language: str = "it") -> str:
+    vocabulary = WORDS.get(language, WORDS["it"])
+    return " ".join(vocabulary[i % len(vocabulary)] for i in range(words))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":  # apify-client comprime il body
+            body = gzip.decompress(body)
+        return json.loads(body or b"{}")
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeOpenRouterHandler(_Handler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+
+        request = self._read_json()
+        config = self.config
+        if random.random() < config.llm_error_rate:
+            headers = {"Retry-After": "1"} if config.llm_error_status == 429 else {}
+            return self._send_json(config.llm_error_status, {"error": {"message": "fake error", "code": config.llm_error_status}}, headers)
+
+        messages = request.get("messages", [])
+        prompt_text = " ".join(str(message.get("content", "")) for message in messages)
+        prompt_tokens = max(1, len(prompt_text) // 4)
+        completion_tokens = min(config.completion_tokens, request.get("max_tokens") or config.completion_tokens)
+
+        if "lista JSON" in prompt_text:
+            content = json.dumps([f"Topic {i + 1}" for i in range(4)])
+        else:
+            # Una parola ~ 1.3 token: la risposta occupa circa completion_tokens
+            content = _filler(max(1, int(completion_tokens / 1.3)))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+
+        time.sleep(config.llm_latency)
+        if random.random() < config.llm_slow_rate:
+            time.sleep(config.llm_slow_latency)
+        if request.get("stream"):
+            return self._stream(request, completion_id, content, completion_tokens, usage)
+
+        time.sleep(completion_tokens / config.token_rate)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    def _stream(self, request: dict, completion_id: str, content: str, completion_tokens: int, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(choices: list, extra: dict = None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", "fake"), "choices": choices}
+            chunk.update(extra or {})
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        words = content.split(" ")
+        delay = completion_tokens / self.config.token_rate / max(1, len(words))
+        try:
+            for i, word in enumerate(words):
+                send([{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}])
+                time.sleep(delay)
+            send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            send([], {"usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Il client ha chiuso lo stream
+
+
+class FakeApifyHandler(_Handler):
+    runs = {}
+    runs_lock = threading.Lock()
+
+    def _run_payload(self, run: dict) -> dict:
+        finished = time.time() >= run["finishes_at"]
+        status = run["final_status"] if finished else "RUNNING"
+        return {"data": {"id": run["id"], "status": status, "defaultDatasetId": run["id"],
+                         "startedAt": run["started_at"]}}
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if not (path.startswith("/v2/acts/") and path.endswith("/runs")):
+            return self._send_json(404, {"error": {"type": "record-not-found", "message": "not found"}})
+
+        run_input = self._read_json()
+        config = self.config
+        run_id = uuid.uuid4().hex[:17]
+        run = {
+            "id": run_id,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "finishes_at": time.time() + config.apify_latency,
+            "final_status": "FAILED" if random.random() < config.apify_error_rate else "SUCCEEDED",
+            "video_url": run_input.get("videoUrl", "")
+        }
+        with self.runs_lock:
+            self.runs[run_id] = run
+        self._send_json(201, self._run_payload(run))
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip("/")
+        query = parse_qs(parsed.query)
+        parts = path.split("/")
+
+        if path.startswith("/v2/actor-runs/") and len(parts) == 4:
+            run = self.runs.get(parts[3])
+            if run is None:
+                return self._send_json(404, {"error": {"type": "record-not-found", "message": "run not found"}})
+            wait = float(query.get("waitForFinish", ["0"])[0] or 0)
+            time.sleep(max(0.0, min(wait, run["finishes_at"] - time.time())))
+            return self._send_json(200, self._run_payload(run))
+
+        if path.startswith("/v2/actor-runs/") and path.endswith("/log"):
+            # Log del run (apify-client lo legge in streaming durante call())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if path.startswith("/v2/datasets/") and path.endswith("/items") and len(parts) == 5:
+            run = self.runs.get(parts[3])
+            items = self._dataset_items(run) if run and run["final_status"] == "SUCCEEDED" else []
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", [str(len(items))])[0] or len(items))
+            page = items[offset:offset + limit]
+            return self._send_json(200, page, {
+                "x-apify-pagination-total": str(len(items)),
+                "x-apify-pagination-offset": str(offset),
+                "x-apify-pagination-limit": str(limit),
+                "x-apify-pagination-count": str(len(page)),
+                "x-apify-pagination-desc": ""
+            })
+
+        self._send_json(404, {"error": {"type": "record-not-found", "message": "not found"}})
+
+    def _dataset_items(self, run: dict) -> list:
+        config = self.config
+        segments = [
+            {"start": round(i * 3.2, 2), "dur": 3.2, "text": _filler(12, config.language)}
+            for i in range(config.segments)
+        ]
+        return [{"title": f"Fake video {run['video_url']}", "language": config.language, "data": segments}]
+
+
+def _serve(handler: type, config: FakeConfig, port: int, host: str) -> ThreadingHTTPServer:
+    bound_handler = type(handler.__name__, (handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), bound_handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name=f"fake-{handler.__name__}").start()
+    return server
+
+
+def start_fake_providers(config: FakeConfig = None, openrouter_port: int = 0, apify_port: int = 0,
+                         host: str = "127.0.0.1") -> dict:
+    """
+    Avvia i due fake in thread daemon (porta 0 = porta libera casuale).
+    Restituisce {'servers': [...], 'env': variabili da passare al backend}.
+    """
+    config = config or FakeConfig()
+    openrouter = _serve(FakeOpenRouterHandler, config, openrouter_port, host)
+    apify = _serve(FakeApifyHandler, config, apify_port, host)
+    return {
+        "servers": [openrouter, apify],
+        "env": {
+            "OPENROUTER_BASE_URL": f"http://{host}:{openrouter.server_address[1]}/api/v1",
+            "OPENROUTER_API_KEY": "fake-key",
+            "APIFY_API_URL": f"http://{host}:{apify.server_address[1]}",
+            "APIFY_API_KEY": "fake-key",
+        }
+    }
+
+
+def stop_fake_providers(fakes: dict):
+    for server in fakes["servers"]:
+        server.shutdown()
+        server.server_close()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeConfig()
+    parser.add_argument("--llm-latency", type=float, default=defaults.llm_latency, help="secondi prima del primo token")
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate, help="token al secondo")
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens, help="token per risposta")
+    parser.add_argument("--llm-error-rate", type=float, default=defaults.llm_error_rate, help="frazione di errori OpenRouter")
+    parser.add_argument("--llm-error-status", type=int, default=defaults.llm_error_status, help="status HTTP degli errori")
+    parser.add_argument("--llm-slow-rate", type=float, default=defaults.llm_slow_rate, help="frazione di richieste lente")
+    parser.add_argument("--llm-slow-latency", type=float, default=defaults.llm_slow_latency, help="secondi in più per le richieste lente")
+    parser.add_argument("--apify-latency", type=float, default=defaults.apify_latency, help="durata di un run Apify")
+    parser.add_argument("--apify-error-rate", type=float, default=defaults.apify_error_rate, help="frazione di run FAILED")
+    parser.add_argument("--segments", type=int, default=defaults.segments, help="segmenti per video")
+    parser.add_argument("--language", default=defaults.language, help="lingua dei sottotitoli (it/en)")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        llm_latency=args.llm_latency,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        llm_error_rate=args.llm_error_rate,
+        llm_error_status=args.llm_error_status,
+        llm_slow_rate=args.llm_slow_rate,
+        llm_slow_latency=args.llm_slow_latency,
+        apify_latency=args.apify_latency,
+        apify_error_rate=args.apify_error_rate,
+        segments=args.segments,
+        language=args.language
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenRouter/Apify per i benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--openrouter-port", type=int, default=9101)
+    parser.add_argument("--apify-port", type=int, default=9102)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    fakes = start_fake_providers(config_from_args(args), args.openrouter_port, args.apify_port, args.host)
+    print("Fake provider attivi. Variabili per il backend:")
+    for key, value in fakes["env"].items():
+        print(f"  {key}={value}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_fake_providers(fakes)
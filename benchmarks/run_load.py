@@ -0,0 +1,264 @@
+"""
+Script: run_load.py
+Obiettivo: Misurare latenza e throughput del backend sotto carico.
+
+Invia richieste agli step (/api/step/*) e alla pipeline completa
+(/api/process-video + polling di /api/status) con la concorrenza indicata e
+riporta p50/p95/p99, throughput ed errori per scenario. In parallelo sonda
+/api/health ogni 100 ms: la sua latenza misura il lag dell'event loop
+(se uno step blocca il loop, l'health check rallenta con lui).
+
+Con --spawn avvia da solo i fake provider (fake_providers.py) e un backend
+uvicorn configurato per usarli, con cache e job store temporanei: nessun
+credito API consumato, adatto alla CI.
+
+Uso:
+    python run_load.py --spawn --scenarios steps --concurrency 16 --requests 200
+    python run_load.py --base-url http://localhost:8000 --scenarios process-video --requests 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from fake_providers import add_config_arguments, config_from_args, start_fake_providers, stop_fake_providers
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+SAMPLE_TRANSCRIPT = " ".join(["Il video spiega come la ricerca e i dati cambiano il modo in cui lavoriamo."] * 200)
+SAMPLE_RESEARCH = "# Risultati Ricerca\n\n" + "\n\n".join(f"## Topic {i}\n\n" + SAMPLE_TRANSCRIPT[:2000] for i in range(4))
+
+STEP_SCENARIOS = ("transcribe", "extract-topics", "research", "generate-script")
+
+
+def _fake_video_url() -> str:
+    # ID sempre nuovi: altrimenti dalla seconda richiesta in poi si misura la cache
+    return f"https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}"
+
+
+def _step_request(scenario: str) -> tuple:
+    unique = uuid.uuid4().hex[:8]
+    if scenario == "transcribe":
+        return "/api/step/transcribe", {"url": _fake_video_url()}
+    if scenario == "extract-topics":
+        return "/api/step/extract-topics", {"transcript_text": f"{unique} {SAMPLE_TRANSCRIPT}"}
+    if scenario == "research":
+        return "/api/step/research", {"topics": [f"Topic {unique} {i}" for i in range(4)]}
+    if scenario == "generate-script":
+        return "/api/step/generate-script", {"transcript_text": f"{unique} {SAMPLE_TRANSCRIPT}", "research": SAMPLE_RESEARCH}
+    raise ValueError(f"Scenario sconosciuto: {scenario}")
+
+
+def percentile(values: list, pct: float) -> float:
+    """Percentile nearest-rank (valori già in secondi)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+async def _step_call(client: httpx.AsyncClient, scenario: str) -> bool:
+    path, payload = _step_request(scenario)
+    response = await client.post(path, json=payload)
+    return response.status_code == 200 and response.json().get("success", False)
+
+
+async def _process_video_call(client: httpx.AsyncClient, poll_interval: float, job_timeout: float) -> bool:
+    response = await client.post("/api/process-video", json={"url": _fake_video_url()})
+    if response.status_code != 200:
+        return False
+    job_id = response.json()["job_id"]
+    deadline = time.perf_counter() + job_timeout
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(poll_interval)
+        status = (await client.get(f"/api/status/{job_id}")).json().get("status")
+        if status == "completed":
+            return True
+        if status == "error":
+            return False
+    return False
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, concurrency: int, requests: int,
+                       poll_interval: float = 0.5, job_timeout: float = 600) -> dict:
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                if scenario == "process-video":
+                    ok = await _process_video_call(client, poll_interval, job_timeout)
+                else:
+                    ok = await _step_call(client, scenario)
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def probe_event_loop(client: httpx.AsyncClient, stop: asyncio.Event, interval: float = 0.1) -> list:
+    """Latenze di /api/health durante il carico."""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get("/api/health")
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+    return latencies
+
+
+async def run_benchmark(base_url: str, scenarios: list, concurrency: int, requests: int,
+                        poll_interval: float, job_timeout: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    timeout = httpx.Timeout(job_timeout)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client, \
+            httpx.AsyncClient(base_url=base_url, timeout=10) as probe_client:
+        for scenario in scenarios:
+            stop = asyncio.Event()
+            probe = asyncio.create_task(probe_event_loop(probe_client, stop))
+            summary = await run_scenario(client, scenario, concurrency, requests, poll_interval, job_timeout)
+            stop.set()
+            lag = await probe
+            summary["event_loop_lag_p50_ms"] = round(percentile(lag, 50) * 1000, 1)
+            summary["event_loop_lag_p99_ms"] = round(percentile(lag, 99) * 1000, 1)
+            summary["event_loop_lag_max_ms"] = round(max(lag) * 1000, 1) if lag else 0.0
+            results[scenario] = summary
+            print(f"[INFO] {scenario}: {json.dumps(summary)}", file=sys.stderr)
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_backend(env_overrides: dict, port: int, workdir: str) -> subprocess.Popen:
+    """Avvia uvicorn con i fake provider e cache/job store in una cartella temporanea."""
+    env = dict(os.environ)
+    env.update(env_overrides)
+    env.update({
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "JOB_POLL_INTERVAL": "0.2",
+    })
+    log_path = os.path.join(workdir, "backend.log")
+    print(f"[INFO] Log del backend: {log_path}", file=sys.stderr)
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT
+        )
+
+
+def wait_until_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Backend non raggiungibile su {base_url} dopo {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test del backend")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="backend già avviato (ignorato con --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="avvia fake provider e backend locali")
+    parser.add_argument("--scenarios", default="steps",
+                        help="lista separata da virgole: transcribe, extract-topics, research, generate-script, "
+                             "process-video; 'steps' = tutti gli step, 'all' = step + process-video")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="richieste per scenario")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="polling di /api/status (process-video)")
+    parser.add_argument("--job-timeout", type=float, default=600)
+    parser.add_argument("--output", help="salva i risultati in JSON (es. per la CI)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = []
+    for name in args.scenarios.split(","):
+        name = name.strip()
+        if name in ("steps", "all"):
+            scenarios.extend(STEP_SCENARIOS)
+            if name == "all":
+                scenarios.append("process-video")
+        elif name:
+            scenarios.append(name)
+
+    fakes = backend = None
+    base_url = args.base_url.rstrip("/")
+    try:
+        if args.spawn:
+            fakes = start_fake_providers(config_from_args(args))
+            port = _free_port()
+            workdir = tempfile.mkdtemp(prefix="bench-")
+            backend = spawn_backend(fakes["env"], port, workdir)
+            base_url = f"http://127.0.0.1:{port}"
+        wait_until_ready(base_url)
+
+        results = asyncio.run(run_benchmark(
+            base_url, scenarios, args.concurrency, args.requests, args.poll_interval, args.job_timeout
+        ))
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait(timeout=10)
+        if fakes is not None:
+            stop_fake_providers(fakes)
+
+    report = {"base_url": base_url, "concurrency": args.concurrency, "requests": args.requests, "results": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Script: artifact_store.py
+Obiettivo: Tenere lato server gli output degli step (trascrizioni, report) e
+restituire al client un handle da usare al posto del testo nelle richieste successive.
+
+Gli artifact sono JSON compressi con zlib e indirizzati per contenuto (lo stesso
+testo produce sempre lo stesso handle). Restano in memoria fino a
+ARTIFACT_MEMORY_MB; oltre, i meno usati di recente vengono spostati su disco
+(DiskCache "artifacts"), da cui tornano in memoria alla prima lettura.
+Gli handle sono validi nel processo che li ha creati e, dopo lo spill, per
+tutti i processi che condividono CACHE_DIR.
+
+Configurazione (.env):
+    ARTIFACT_MEMORY_MB=64          memoria massima (dati compressi)
+    ARTIFACT_DISK_MB=512           spazio massimo su disco
+    ARTIFACT_TTL=86400             validità in secondi
+    ARTIFACT_COMPRESSION_LEVEL=6   livello zlib (1 veloce - 9 compatto)
+"""
+
+import os
+import json
+import time
+import zlib
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    from execution.disk_cache import DiskCache
+except ImportError:
+    from disk_cache import DiskCache
+
+HANDLE_PREFIX = "art_"
+
+
+class ArtifactStore:
+    def __init__(self, memory_bytes: int = None, disk_bytes: int = None, ttl: float = None,
+                 compression_level: int = None, directory: str = None):
+        self.memory_bytes = memory_bytes or int(float(os.getenv("ARTIFACT_MEMORY_MB", "64")) * 1024 * 1024)
+        self.ttl = ttl or float(os.getenv("ARTIFACT_TTL", str(24 * 3600)))
+        self.compression_level = compression_level or int(os.getenv("ARTIFACT_COMPRESSION_LEVEL", "6"))
+        self._disk = DiskCache(
+            "artifacts",
+            ttl=self.ttl,
+            max_bytes=disk_bytes or int(float(os.getenv("ARTIFACT_DISK_MB", "512")) * 1024 * 1024),
+            directory=directory
+        )
+        self._memory = OrderedDict()  # handle -> (blob compresso, creato_il)
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._spilled = 0
+
+    @staticmethod
+    def is_handle(value) -> bool:
+        return isinstance(value, str) and value.startswith(HANDLE_PREFIX)
+
+    def put(self, value) -> str:
+        """Salva un valore serializzabile in JSON e restituisce il suo handle."""
+        payload = json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        handle = HANDLE_PREFIX + hashlib.sha256(payload).hexdigest()[:32]
+        if self._refresh(handle):
+            return handle
+        blob = zlib.compress(payload, self.compression_level)
+        with self._lock:
+            # Stesso contenuto salvato da un'altra richiesta mentre comprimevamo
+            if handle in self._memory:
+                self._memory[handle] = (self._memory[handle][0], time.time())
+                self._memory.move_to_end(handle)
+                return handle
+            self._memory[handle] = (blob, time.time())
+            self._memory_used += len(blob)
+            to_spill = self._evict()
+        self._spill(to_spill)
+        return handle
+
+    def _refresh(self, handle: str) -> bool:
+        """Se l'handle è già in memoria ne rinnova la scadenza (un nuovo put riparte da zero)."""
+        with self._lock:
+            entry = self._memory.get(handle)
+            if entry is None:
+                return False
+            self._memory[handle] = (entry[0], time.time())
+            self._memory.move_to_end(handle)
+            return True
+
+    def get(self, handle: str):
+        """Restituisce il valore dell'handle, oppure None se sconosciuto o scaduto."""
+        if not self.is_handle(handle):
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(handle)
+            if entry is not None and now - entry[1] > self.ttl:
+                self._drop(handle)
+                entry = None
+            elif entry is not None:
+                self._memory.move_to_end(handle)
+        if entry is None:
+            stored = self._disk.get(handle)
+            if stored is None:
+                return None
+            entry = (base64.b64decode(stored["blob"]), stored["created_at"])
+            with self._lock:
+                if handle not in self._memory:
+                    self._memory[handle] = entry
+                    self._memory_used += len(entry[0])
+                to_spill = self._evict()
+            self._spill(to_spill)
+        return json.loads(zlib.decompress(entry[0]))
+
+    def _drop(self, handle: str):
+        blob, _ = self._memory.pop(handle)
+        self._memory_used -= len(blob)
+
+    def _evict(self) -> list:
+        """Toglie dalla memoria i meno usati oltre il limite (da chiamare con il lock)."""
+        evicted = []
+        while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+            handle, (blob, created_at) = self._memory.popitem(last=False)
+            self._memory_used -= len(blob)
+            evicted.append((handle, blob, created_at))
+        return evicted
+
+    def _spill(self, evicted: list):
+        now = time.time()
+        for handle, blob, created_at in evicted:
+            if now - created_at > self.ttl:
+                continue
+            try:
+                self._disk.set(handle, {"blob": base64.b64encode(blob).decode("ascii"), "created_at": created_at})
+                self._spilled += 1
+            except Exception as e:
+                print(f"[WARN] Impossibile spostare l'artifact {handle} su disco: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            memory = {"entries": len(self._memory), "bytes": self._memory_used, "max_bytes": self.memory_bytes,
+                      "spilled": self._spilled}
+        return {"memory": memory, "disk": self._disk.stats()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
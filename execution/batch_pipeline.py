@@ -0,0 +1,296 @@
+"""
+Script: batch_pipeline.py
+Obiettivo: Eseguire la pipeline completa su una lista di video, offline e riprendibile.
+
+Legge un file di URL YouTube (uno per riga, righe vuote e '#' ignorate, video
+duplicati scartati) e li elabora con un pool di worker, usando la pipeline a
+stage di pipeline.py (trascrizione, traduzione, topic, ricerca, script).
+
+Due file crescono man mano, con un record JSON per riga:
+    <output>.jsonl              un risultato per video (completato o in errore)
+    <output>.jsonl.checkpoint   gli output di ogni stage appena completato
+
+Interrompendo il processo (Ctrl+C, crash, riavvio della macchina) basta
+rilanciare lo stesso comando: i video già nel file dei risultati vengono
+saltati e quelli a metà ripartono dall'ultimo stage salvato. I video in errore
+vengono riprovati solo con --retry-failed, anche loro dall'ultimo stage salvato.
+
+Uso:
+    python batch_pipeline.py urls.txt --output results.jsonl --workers 4
+    python batch_pipeline.py urls.txt --output results.jsonl --retry-failed --no-cache
+
+Configurazione (.env):
+    BATCH_WORKERS=4      video elaborati in parallelo (i limiti per provider restano quelli globali)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from execution.pipeline import run_video_pipeline, StageError
+    from execution.transcript_cache import cache_key, normalize_video_id
+    from execution.env_loader import load_env
+except ImportError:
+    from pipeline import run_video_pipeline, StageError
+    from transcript_cache import cache_key, normalize_video_id
+    from env_loader import load_env
+
+load_env()
+
+
+def read_urls(path: str) -> list:
+    """URL del file nell'ordine originale, senza duplicati (stesso video = stessa chiave)."""
+    urls = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            url = line.strip()
+            if not url or url.startswith("#"):
+                continue
+            key = cache_key(url)
+            if key not in seen:
+                seen.add(key)
+                urls.append(url)
+    return urls
+
+
+def _read_jsonl(path: str) -> list:
+    """Record di un file JSONL; un'ultima riga troncata (crash a metà scrittura) viene ignorata."""
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+class JsonlWriter:
+    """Append thread-safe con flush e fsync a ogni record: sopravvive a un crash."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class BatchState:
+    """Risultati e checkpoint di un run precedente con gli stessi file."""
+
+    def __init__(self, output_path: str, checkpoint_path: str):
+        self.results = {}  # chiave video -> ultimo risultato
+        for record in _read_jsonl(output_path):
+            self.results[record["key"]] = record
+
+        # I checkpoint dei video in errore restano: con --retry-failed ripartono dall'ultimo stage riuscito
+        self.checkpoints = {}  # chiave video -> {stage: output}
+        for record in _read_jsonl(checkpoint_path):
+            if not self._completed(record["key"]):
+                self.checkpoints.setdefault(record["key"], {})[record["stage"]] = record["output"]
+        self._compact(checkpoint_path)
+
+    def _completed(self, key: str) -> bool:
+        result = self.results.get(key)
+        return result is not None and result["status"] == "completed"
+
+    def _compact(self, checkpoint_path: str):
+        """Riscrive i checkpoint tenendo solo i video non ancora completati."""
+        if not os.path.exists(checkpoint_path):
+            return
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, stages in self.checkpoints.items():
+                for stage, output in stages.items():
+                    f.write(json.dumps({"key": key, "stage": stage, "output": output}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, checkpoint_path)
+
+    def is_done(self, key: str, retry_failed: bool) -> bool:
+        return self._completed(key) or (key in self.results and not retry_failed)
+
+
+class Progress:
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.completed = 0
+        self.failed = 0
+        self.stage_seconds = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, status: str, timings: dict):
+        with self._lock:
+            if status == "completed":
+                self.completed += 1
+            else:
+                self.failed += 1
+            for stage, seconds in timings.items():
+                self.stage_seconds.setdefault(stage, []).append(seconds)
+            return self.line()
+
+    def line(self) -> str:
+        done = self.completed + self.failed
+        elapsed = time.perf_counter() - self.started
+        rate = done / elapsed if elapsed else 0.0
+        remaining = self.total - done
+        eta = remaining / rate if rate else float("inf")
+        percent = 100 * done / self.total if self.total else 100.0
+        return (f"{done}/{self.total} ({percent:.1f}%) - {self.failed} errori - "
+                f"{rate * 60:.1f} video/min - ETA {_format_duration(eta)}")
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        done = self.completed + self.failed
+        return {
+            "videos": self.total + self.skipped,
+            "skipped_already_done": self.skipped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "not_processed": self.total - done,
+            "elapsed_s": round(elapsed, 1),
+            "throughput_per_min": round(done / elapsed * 60, 2) if elapsed else 0.0,
+            "avg_stage_s": {
+                stage: round(sum(values) / len(values), 2) for stage, values in self.stage_seconds.items()
+            },
+        }
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "?"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def process_video(url: str, key: str, checkpoints: dict, checkpoint_writer: JsonlWriter, use_cache: bool) -> dict:
+    """Esegue (o riprende) la pipeline per un video e restituisce il record del risultato."""
+    def save_checkpoint(stage: str, output, _seconds: float):
+        checkpoint_writer.write({"key": key, "stage": stage, "output": output})
+
+    record = {"key": key, "url": url, "video_id": normalize_video_id(url)}
+    try:
+        outputs, timings = run_video_pipeline(
+            url, use_cache=use_cache, checkpoints=checkpoints, on_stage_complete=save_checkpoint
+        )
+    except StageError as e:
+        return {**record, "status": "error", "stage": e.stage, "error": str(e.error), "timings": {}}
+    except Exception as e:
+        return {**record, "status": "error", "stage": None, "error": str(e), "timings": {}}
+
+    return {
+        **record,
+        "status": "completed",
+        "resumed_stages": sorted(checkpoints),
+        "transcript": outputs["translate"],
+        "topics": outputs["extract_topics"],
+        "research": outputs["research"],
+        "final_script": outputs["generate_script"],
+        "timings": timings,
+    }
+
+
+def run_batch(urls: list, output_path: str, checkpoint_path: str = None, workers: int = None,
+              use_cache: bool = True, retry_failed: bool = False) -> dict:
+    """Elabora i video non ancora conclusi e restituisce il riepilogo del run."""
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    workers = workers or int(os.getenv("BATCH_WORKERS", "4"))
+
+    state = BatchState(output_path, checkpoint_path)
+    todo = [(url, cache_key(url)) for url in urls]
+    todo = [(url, key) for url, key in todo if not state.is_done(key, retry_failed)]
+    progress = Progress(len(todo), skipped=len(urls) - len(todo))
+    resumable = sum(1 for _, key in todo if key in state.checkpoints)
+    print(f"[INFO] {len(urls)} video, {progress.skipped} già conclusi, {len(todo)} da elaborare "
+          f"({resumable} ripresi da checkpoint) con {workers} worker", file=sys.stderr)
+
+    results = JsonlWriter(output_path)
+    checkpoints = JsonlWriter(checkpoint_path)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+    written = set()
+
+    def write_result(future):
+        written.add(future)
+        record = future.result()
+        results.write(record)
+        line = progress.record(record["status"], record["timings"])
+        if record["status"] == "completed":
+            print(f"[INFO] {line}", file=sys.stderr)
+        else:
+            print(f"[WARN] {record['url']}: {record['error']} - {line}", file=sys.stderr)
+
+    futures = []
+    try:
+        futures = [
+            pool.submit(process_video, url, key, state.checkpoints.get(key, {}), checkpoints, use_cache)
+            for url, key in todo
+        ]
+        for future in as_completed(futures):
+            write_result(future)
+    except KeyboardInterrupt:
+        print("[WARN] Interrotto: attendo i video in corso, poi rilancia lo stesso comando per riprendere",
+              file=sys.stderr)
+        pool.shutdown(wait=True, cancel_futures=True)
+        # I video finiti durante l'attesa vanno comunque nei risultati
+        for future in futures:
+            if future not in written and future.done() and not future.cancelled():
+                write_result(future)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        results.close()
+        checkpoints.close()
+
+    return progress.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline completa su una lista di video YouTube (riprendibile)")
+    parser.add_argument("urls_file", help="file con un URL YouTube per riga")
+    parser.add_argument("--output", default="batch_results.jsonl", help="risultati JSONL (uno per video)")
+    parser.add_argument("--checkpoint", help="file dei checkpoint (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, help="video in parallelo (default BATCH_WORKERS o 4)")
+    parser.add_argument("--no-cache", action="store_true", help="ignora le cache di trascrizioni, LLM e ricerche")
+    parser.add_argument("--retry-failed", action="store_true", help="rielabora i video finiti in errore")
+    args = parser.parse_args()
+
+    try:
+        urls = read_urls(args.urls_file)
+    except OSError as e:
+        print(f"Errore lettura input: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        summary = run_batch(
+            urls, args.output, checkpoint_path=args.checkpoint, workers=args.workers,
+            use_cache=not args.no_cache, retry_failed=args.retry_failed
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if summary["failed"]:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
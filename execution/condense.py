@@ -0,0 +1,122 @@
+"""
+Script: condense.py
+Obiettivo: Condensare testi lunghi (map-reduce) invece di troncarli.
+
+Il testo viene diviso in blocchi entro un budget di token, ogni blocco viene
+riassunto in parallelo (map) e i riassunti vengono uniti in un digest (reduce);
+se il digest supera ancora il budget si ripete il passaggio sul digest.
+Ogni riassunto passa dalla cache LLM, indicizzata per contenuto: rieseguendo
+su un testo modificato si pagano solo i blocchi cambiati.
+
+Configurazione (.env):
+    CONDENSE_CHUNK_TOKENS=3000     dimensione dei blocchi da riassumere
+    CONDENSE_CONCURRENCY=6         riassunti in parallelo
+
+Uso: python condense.py <file> [budget_tokens]
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from execution.model_router import choose_model
+    from execution.llm_cache import cached_completion
+    from execution.text_chunks import chunk_text, estimate_tokens, CHARS_PER_TOKEN
+    from execution import deadlines
+except ImportError:
+    from model_router import choose_model
+    from llm_cache import cached_completion
+    from text_chunks import chunk_text, estimate_tokens, CHARS_PER_TOKEN
+    import deadlines
+
+SYSTEM_PROMPT = "Sei un editor esperto. Riassumi fedelmente, mantenendo fatti, numeri, nomi ed esempi concreti."
+
+# Sotto questa soglia un riassunto perde troppo contenuto per essere utile
+MIN_SUMMARY_TOKENS = 150
+MAX_REDUCE_ROUNDS = 3
+
+# Descrizione del testo nel prompt ("Questo è un estratto <source>")
+TRANSCRIPT_SOURCE = "della trascrizione di un video"
+
+
+def _summarize_chunk(chunk: str, target_tokens: int, use_cache: bool, source: str = TRANSCRIPT_SOURCE) -> str:
+    # Niente posizione del blocco nel prompt: inserire un blocco nel testo non deve
+    # invalidare in cache i riassunti di quelli successivi (l'ordine è nel digest)
+    prompt = f"""
+    Questo è un estratto {source}.
+    Riassumilo in italiano in al massimo {target_tokens * CHARS_PER_TOKEN // 6} parole circa,
+    senza introduzioni né commenti.
+
+    Testo:
+    {chunk}
+    """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    return cached_completion(
+        "condense",
+        choose_model("condense", messages),
+        messages,
+        use_cache=use_cache,
+        max_tokens=target_tokens * 2,
+        temperature=0.2
+    ).strip()
+
+
+def condense_text(text: str, budget_tokens: int, use_cache: bool = True,
+                  chunk_tokens: int = None, max_concurrency: int = None, source: str = TRANSCRIPT_SOURCE) -> str:
+    """
+    Restituisce `text` invariato se sta nel budget, altrimenti un digest che
+    copre tutto il testo entro `budget_tokens` token stimati.
+    `source` descrive il testo nel prompt, con la preposizione (es. "del report di ricerca").
+    Se il riassunto di un blocco fallisce, quel blocco viene troncato alla sua quota.
+    """
+    if estimate_tokens(text) <= budget_tokens:
+        return text
+
+    if chunk_tokens is None:
+        chunk_tokens = int(os.getenv("CONDENSE_CHUNK_TOKENS", "3000"))
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("CONDENSE_CONCURRENCY", "6"))
+
+    digest = text
+    for round_index in range(MAX_REDUCE_ROUNDS):
+        chunks = chunk_text(digest, chunk_tokens)
+        target_tokens = max(MIN_SUMMARY_TOKENS, budget_tokens // len(chunks))
+
+        def summarize_or_truncate(index: int, chunk: str) -> str:
+            try:
+                return _summarize_chunk(chunk, target_tokens, use_cache, source)
+            except (deadlines.DeadlineExceeded, deadlines.RequestCancelled):
+                raise
+            except Exception as e:
+                print(f"[WARN] Riassunto blocco {index + 1}/{len(chunks)} fallito: {e}, uso testo troncato")
+                return chunk[:target_tokens * CHARS_PER_TOKEN]
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))), thread_name_prefix="condense") as pool:
+            summaries = list(pool.map(deadlines.propagate(summarize_or_truncate), range(len(chunks)), chunks))
+
+        digest = "\n\n".join(f"[Parte {i + 1}/{len(summaries)}] {summary}" for i, summary in enumerate(summaries))
+        print(f"[INFO] Condensazione (giro {round_index + 1}): {len(chunks)} blocchi, {estimate_tokens(text)} -> {estimate_tokens(digest)} token stimati")
+        if estimate_tokens(digest) <= budget_tokens:
+            return digest
+
+    # Ultima difesa: il prompt non deve mai superare il budget
+    return digest[:budget_tokens * CHARS_PER_TOKEN]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python condense.py <file> [budget_tokens]")
+        sys.exit(1)
+
+    try:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            content = f.read()
+        budget = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+        print(condense_text(content, budget))
+    except Exception as e:
+        print(f"Errore: {str(e)}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,172 @@
+"""
+Script: deadlines.py
+Obiettivo: Scadenza e cancellazione di una richiesta, propagate a tutte le chiamate ai provider.
+
+Il backend apre una `deadline_scope` per ogni richiesta: la scadenza vive in un
+contextvar, quindi la vedono anche i thread del pool degli step e i thread
+interni (traduzione, ricerca, condensazione) se avviati con `propagate`.
+provider_calls.py la controlla prima di ogni tentativo e di ogni backoff, e le
+chiamate OpenRouter e Apify usano `timeout_for()` come timeout: nessuna chiamata
+va oltre il tempo rimasto alla richiesta.
+
+La stessa scadenza può essere cancellata (`cancel()`), ad esempio quando il
+client si disconnette: il lavoro nei thread, che non si può interrompere, si
+ferma alla prossima chiamata a `check()`.
+
+Nella pipeline a stage il tempo rimasto viene diviso tra gli stage in base al
+peso (STAGE_WEIGHTS) di ciascuno rispetto al percorso che gli resta davanti.
+
+Configurazione (.env):
+    REQUEST_DEADLINE=300     secondi massimi per una richiesta agli step (0 = nessuna scadenza)
+    PIPELINE_DEADLINE=1800   secondi massimi per la pipeline completa di un video (0 = nessuna)
+"""
+
+import time
+import asyncio
+import contextlib
+import contextvars
+
+# Quota indicativa del tempo totale per stage (trascrizione e ricerca sono le più lente)
+STAGE_WEIGHTS = {
+    "transcribe": 4,
+    "fetch_transcript": 3,
+    "translate": 2,
+    "extract_topics": 1,
+    "research": 3,
+    "generate_script": 2,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Il tempo della richiesta (o dello stage) è finito."""
+
+
+class RequestCancelled(Exception):
+    """La richiesta è stata cancellata (es. client disconnesso) mentre il lavoro era in corso."""
+
+
+class Deadline:
+    def __init__(self, expires_at: float = None, parent: "Deadline" = None):
+        self.expires_at = expires_at
+        self.parent = parent
+        self.cancel_reason = None
+
+    def cancel(self, reason: str = "cancelled"):
+        self.cancel_reason = reason
+
+    def cancelled(self):
+        """Motivo della cancellazione (anche di una scadenza esterna), oppure None."""
+        deadline = self
+        while deadline is not None:
+            if deadline.cancel_reason:
+                return deadline.cancel_reason
+            deadline = deadline.parent
+        return None
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds: float = None):
+    """
+    Imposta una scadenza tra `seconds` secondi (None o 0 = nessun limite proprio)
+    senza mai superare quella già attiva. Restituisce l'oggetto Deadline.
+    """
+    parent = _current.get()
+    expires_at = time.monotonic() + seconds if seconds else None
+    if parent is not None and parent.expires_at is not None:
+        expires_at = parent.expires_at if expires_at is None else min(expires_at, parent.expires_at)
+    deadline = Deadline(expires_at, parent)
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def detached():
+    """Esegue il blocco senza la scadenza della richiesta (es. lavoro speculativo in background)."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def remaining():
+    """Secondi rimasti alla richiesta corrente, oppure None se non c'è scadenza."""
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def check():
+    """Solleva RequestCancelled o DeadlineExceeded se la richiesta non deve proseguire."""
+    deadline = _current.get()
+    if deadline is None:
+        return
+    reason = deadline.cancelled()
+    if reason:
+        raise RequestCancelled(f"Richiesta cancellata ({reason})")
+    left = deadline.remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Tempo massimo della richiesta superato")
+
+
+def timeout_for(default: float = None):
+    """Timeout da passare a una chiamata: il minore tra `default` e il tempo rimasto."""
+    check()
+    left = remaining()
+    if left is None:
+        return default
+    return left if default is None else min(default, left)
+
+
+def stage_seconds(stage: str, downstream_weight: float = 0.0):
+    """
+    Quota del tempo rimasto per `stage`, dato il peso degli stage che dovranno
+    ancora seguirlo (sul percorso più lungo). None se non c'è scadenza.
+    """
+    left = remaining()
+    if left is None:
+        return None
+    weight = STAGE_WEIGHTS.get(stage, 1)
+    return max(0.0, left) * weight / (weight + downstream_weight)
+
+
+def propagate(fn):
+    """
+    Avvolge `fn` perché giri nel contesto (scadenza compresa) di chi la crea:
+    da usare con ThreadPoolExecutor.submit/map, che non copiano i contextvars.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+async def wait_with_deadline(coro, default_timeout: float = None):
+    """`asyncio.wait_for` con il timeout ridotto al tempo rimasto alla richiesta."""
+    try:
+        timeout = timeout_for(default_timeout)
+    except BaseException:
+        coro.close()
+        raise
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        if default_timeout is None or timeout < default_timeout:
+            raise DeadlineExceeded("Tempo massimo della richiesta superato")
+        raise
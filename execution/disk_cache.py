@@ -0,0 +1,118 @@
+"""
+Script: disk_cache.py
+Obiettivo: Cache chiave/valore persistente su SQLite, con TTL ed eviction LRU per dimensione.
+
+Usata dagli script di `execution/` per non ripetere chiamate lente o a pagamento
+(Apify, OpenRouter). I file vivono in `.tmp/cache/` (o in CACHE_DIR) e possono
+essere cancellati in qualsiasi momento: verranno rigenerati.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def default_cache_dir() -> str:
+    return os.getenv("CACHE_DIR", os.path.join(PROJECT_ROOT, ".tmp", "cache"))
+
+
+class DiskCache:
+    """
+    Cache JSON su file SQLite condivisibile tra thread e processi.
+
+    - `ttl`: secondi di validità di una voce (None = nessuna scadenza)
+    - `max_bytes`: dimensione massima dei valori salvati; oltre questa soglia
+      vengono eliminate le voci usate meno di recente (LRU)
+    """
+
+    def __init__(self, name: str, ttl: float = None, max_bytes: int = None, directory: str = None):
+        directory = directory or default_cache_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Una connessione per thread: sqlite3 non permette di condividerle
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Restituisce il valore salvato o None se assente/scaduto."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value):
+        """Salva un valore serializzabile in JSON e applica l'eviction."""
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now)
+            )
+            self._evict(conn, now)
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        if self.max_bytes is None:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Elimina dalle voci meno usate finché non si rientra nel limite
+        to_delete = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes, "ttl": self.ttl}
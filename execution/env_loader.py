@@ -0,0 +1,44 @@
+"""
+Script: env_loader.py
+Obiettivo: Caricare il file .env una sola volta per processo.
+
+Ogni script di `execution/` ha bisogno delle variabili del .env già all'import,
+ma rileggere e riparsare il file da ogni modulo rallenta l'avvio del backend.
+`load_env()` cerca il .env risalendo dalla cartella indicata (come
+`load_dotenv()`) e lo carica solo la prima volta; le variabili già presenti
+nell'ambiente non vengono sovrascritte.
+"""
+
+import os
+import threading
+
+_loaded = set()  # cartelle di partenza e file .env già caricati
+_lock = threading.Lock()
+
+
+def _find_dotenv(start_dir: str):
+    directory = os.path.abspath(start_dir)
+    while True:
+        candidate = os.path.join(directory, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def load_env(start_dir: str = None):
+    """Carica il primo .env trovato risalendo da `start_dir` (default: cartella `execution/`)."""
+    start_dir = os.path.abspath(start_dir or os.path.dirname(os.path.abspath(__file__)))
+    if start_dir in _loaded:
+        return
+    with _lock:
+        if start_dir in _loaded:
+            return
+        path = _find_dotenv(start_dir)
+        if path is not None and path not in _loaded:
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            _loaded.add(path)
+        _loaded.add(start_dir)
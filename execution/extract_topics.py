@@ -6,48 +6,61 @@ Obiettivo: Estrarre i topic principali da una trascrizione usando Claude.
 import os
 import sys
 import json
-from dotenv import load_dotenv
-from openai import OpenAI  # Usiamo client OpenAI compatibile con OpenRouter
 
-load_dotenv()
+# Client OpenRouter condiviso (import come package dal backend o come script locale)
+try:
+    from execution.openrouter_client import get_default_model
+    from execution.llm_cache import cached_completion
+    from execution.model_router import choose_model
+    from execution.condense import condense_text
+    from execution.single_flight import SingleFlight, content_key
+    from execution.env_loader import load_env
+except ImportError:
+    from openrouter_client import get_default_model
+    from llm_cache import cached_completion
+    from model_router import choose_model
+    from condense import condense_text
+    from single_flight import SingleFlight, content_key
+    from env_loader import load_env
 
-def extract_topics(transcript_text: str) -> list:
+load_env()
+
+_extractions = SingleFlight("extract_topics")
+
+def extract_topics(transcript_text: str, use_cache: bool = True) -> list:
     """
     Estrae 3-5 topic principali dalla trascrizione.
     Restituisce una lista di stringhe.
+    Con lo stesso input la risposta arriva dalla cache LLM (`use_cache=False` la ignora).
+    Le trascrizioni oltre TOPICS_INPUT_BUDGET_TOKENS (default 3750) vengono condensate, non troncate.
+    Richieste contemporanee con la stessa trascrizione condividono un'unica estrazione.
     """
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    model = os.getenv("OPENROUTER_MODEL_CLAUDE", "anthropic/claude-3.5-sonnet")
-    
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY mancante nel file .env")
+    key = content_key(get_default_model(), use_cache, transcript_text)
+    return list(_extractions.do(key, _extract_topics, transcript_text, use_cache))
 
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
+
+def _extract_topics(transcript_text: str, use_cache: bool) -> list:
+    budget_tokens = int(os.getenv("TOPICS_INPUT_BUDGET_TOKENS", "3750"))
+    transcript_text = condense_text(transcript_text, budget_tokens, use_cache=use_cache)
 
     prompt = f"""
     Analizza la seguente trascrizione di un video YouTube ed estrai i 3-5 argomenti principali (Key Topics).
     Restituisci SOLO una lista JSON di stringhe, senza altro testo.
     
     Trascrizione:
-    {transcript_text[:15000]}  # Tronca per evitare limiti di token se troppo lungo
+    {transcript_text}
     """
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Sei un esperto analista di contenuti. Estrai topic rilevanti e specifici."},
-            {"role": "user", "content": prompt}
-        ],
-        extra_headers={
-            "HTTP-Referer": "https://antigravity.app", 
-            "X-Title": "Antigravity App"
-        }
-    )
-
-    content = response.choices[0].message.content.strip()
+    messages = [
+        {"role": "system", "content": "Sei un esperto analista di contenuti. Estrai topic rilevanti e specifici."},
+        {"role": "user", "content": prompt}
+    ]
+    content = cached_completion(
+        "extract_topics",
+        choose_model("extract_topics", messages),
+        messages,
+        use_cache=use_cache
+    ).strip()
     
     # Pulisci il markdown json se presente
     if "```json" in content:
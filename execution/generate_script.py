@@ -6,25 +6,32 @@ Obiettivo: Generare un nuovo script video basato su trascrizione e ricerca.
 import os
 import sys
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
 
-load_dotenv()
+# Client OpenRouter condiviso (import come package dal backend o come script locale)
+try:
+    from execution.model_router import choose_model
+    from execution.llm_cache import cached_completion, stream_cached_completion
+    from execution.condense import condense_text
+    from execution.env_loader import load_env
+except ImportError:
+    from model_router import choose_model
+    from llm_cache import cached_completion, stream_cached_completion
+    from condense import condense_text
+    from env_loader import load_env
 
-def generate_video_script(original_transcript: str, research_data: str) -> str:
-    """
-    Genera un nuovo script video integrando l'originale con la ricerca.
-    """
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    model = os.getenv("OPENROUTER_MODEL_CLAUDE", "anthropic/claude-3.5-sonnet")
-    
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY mancante nel file .env")
+load_env()
+
+SYSTEM_PROMPT = "Sei un creatore di contenuti virali. Scrivi script ottimizzati per l'engagement."
 
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
+
+def _build_messages(original_transcript: str, research_data: str, use_cache: bool = True) -> list:
+    # Ogni input ha il suo budget (SCRIPT_INPUT_BUDGET_TOKENS, default 2500):
+    # oltre viene condensato, così lo script copre tutto il video e tutta la ricerca
+    budget_tokens = int(os.getenv("SCRIPT_INPUT_BUDGET_TOKENS", "2500"))
+    original_transcript = condense_text(original_transcript, budget_tokens, use_cache=use_cache)
+    research_data = condense_text(research_data, budget_tokens, use_cache=use_cache,
+                                  source="di un report di ricerca online sui temi del video")
 
     prompt = f"""
     Sei uno sceneggiatore video esperto (Video Scriptwriter).
@@ -33,10 +40,10 @@ def generate_video_script(original_transcript: str, research_data: str) -> str:
     
     INPUT:
     1. Trascrizione video originale (fonte di ispirazione):
-    {original_transcript[:10000]}...
+    {original_transcript}
     
     2. Ricerca approfondita sui temi (nuove info da includere):
-    {research_data[:10000]}...
+    {research_data}
     
     ISTRUZIONI:
     - Scrivi uno script coinvolgente, con Hook iniziale, Corpo centrale strutturato, e Call to Action.
@@ -45,19 +52,42 @@ def generate_video_script(original_transcript: str, research_data: str) -> str:
     - Formato output: Markdown ben formattato.
     """
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "Sei un creatore di contenuti virali. Scrivi script ottimizzati per l'engagement."},
-            {"role": "user", "content": prompt}
-        ],
-        extra_headers={
-            "HTTP-Referer": "https://antigravity.app", 
-            "X-Title": "Antigravity App"
-        }
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def generate_video_script(original_transcript: str, research_data: str, use_cache: bool = True) -> str:
+    """
+    Genera un nuovo script video integrando l'originale con la ricerca.
+    Con lo stesso input la risposta arriva dalla cache LLM (`use_cache=False` la ignora).
+    """
+    messages = _build_messages(original_transcript, research_data, use_cache)
+    return cached_completion(
+        "generate_script",
+        choose_model("generate_script", messages),
+        messages,
+        use_cache=use_cache
     )
 
-    return response.choices[0].message.content
+
+async def stream_video_script_async(original_transcript: str, research_data: str, use_cache: bool = True):
+    """
+    Come `generate_video_script`, ma restituisce un async generator che produce
+    il testo dello script man mano che il modello lo genera.
+    A stream completato lo script finisce nella cache LLM, quindi una successiva
+    chiamata a `generate_video_script` con lo stesso input non rifà la completion.
+    """
+    # La condensazione fa chiamate bloccanti: fuori dall'event loop
+    messages = await asyncio.to_thread(_build_messages, original_transcript, research_data, use_cache)
+    async for delta in stream_cached_completion(
+        "generate_script",
+        choose_model("generate_script", messages),
+        messages,
+        use_cache=use_cache
+    ):
+        yield delta
 
 if __name__ == "__main__":
     # Input atteso: Questo script richiede due input specifici.
@@ -0,0 +1,130 @@
+"""
+Script: language_detect.py
+Obiettivo: Riconoscere la lingua di un testo in locale, senza chiamate LLM.
+
+Conta le stopword più frequenti di ogni lingua supportata: sui transcript
+(centinaia di parole) è affidabile e costa pochi millisecondi. Serve a evitare
+la traduzione quando il testo è già in italiano.
+"""
+
+import re
+from collections import Counter
+
+# Parole funzionali frequenti e il più possibile distintive per lingua
+STOPWORDS = {
+    "it": {
+        "il", "lo", "gli", "di", "che", "è", "non", "per", "sono", "della", "del", "nel",
+        "nella", "anche", "come", "questo", "questa", "più", "molto", "perché", "quando",
+        "ci", "mi", "ho", "hai", "ha", "abbiamo", "siamo", "cosa", "tutto", "quindi",
+        "allora", "dei", "delle", "alla", "al", "l", "dell", "nell", "all", "sul", "e",
+        "ma", "io", "noi", "voi", "loro", "essere", "fare", "se", "già", "poi", "ancora",
+    },
+    "en": {
+        "the", "and", "is", "are", "to", "of", "that", "it", "you", "this", "with", "for",
+        "was", "have", "not", "they", "we", "be", "on", "what", "so", "can", "just",
+        "about", "there", "if", "or", "at", "from", "my", "your", "do", "going", "like",
+        "would", "will", "which", "when", "their", "because", "really",
+    },
+    "es": {
+        "el", "los", "las", "que", "es", "y", "por", "para", "con", "una", "del", "pero",
+        "como", "más", "muy", "porque", "cuando", "esto", "esta", "está", "son", "hay",
+        "yo", "nosotros", "también", "todo", "entonces", "lo", "se", "su", "sus", "ya",
+    },
+    "fr": {
+        "le", "les", "des", "est", "et", "que", "pour", "dans", "une", "pas", "qui",
+        "avec", "sur", "plus", "mais", "comme", "nous", "vous", "ils", "je", "c", "j",
+        "d", "qu", "ce", "cette", "très", "parce", "quand", "aussi", "tout", "alors",
+    },
+    "de": {
+        "der", "die", "das", "und", "ist", "nicht", "ich", "sie", "es", "mit", "auf",
+        "für", "ein", "eine", "den", "dem", "zu", "wir", "auch", "aber", "wenn", "dass",
+        "sehr", "noch", "oder", "wie", "was", "sind", "haben", "also", "jetzt", "hier",
+    },
+    "pt": {
+        "o", "os", "as", "que", "é", "e", "não", "para", "com", "uma", "um", "do", "da",
+        "dos", "das", "mas", "como", "mais", "muito", "porque", "quando", "isso", "isto",
+        "está", "são", "você", "nós", "também", "tudo", "então", "no", "na", "ao",
+    },
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+# Quota minima di stopword (sul totale delle parole) per considerare affidabile il risultato
+MIN_STOPWORD_RATIO = 0.08
+
+
+# Una lingua diversa da quella dichiarata prevale se ha almeno questo multiplo di stopword
+DOMINANCE_RATIO = 1.5
+
+
+def _stopword_ratios(text: str, sample_chars: int = 20000) -> tuple:
+    """(quota di stopword di ogni lingua sul totale delle parole, numero di parole)."""
+    words = [w.lower() for w in _WORD_RE.findall(text[:sample_chars])]
+    counts = Counter(words)
+    ratios = {
+        lang: sum(counts[w] for w in stopwords) / len(words) if words else 0.0
+        for lang, stopwords in STOPWORDS.items()
+    }
+    return ratios, len(words)
+
+
+def detect_language(text: str, sample_chars: int = 20000) -> tuple:
+    """
+    Restituisce (codice ISO 639-1, confidenza 0-1) della lingua prevalente,
+    oppure (None, 0.0) se il testo è troppo corto o non riconoscibile.
+    Analizza solo i primi `sample_chars` caratteri.
+    """
+    ratios, total_words = _stopword_ratios(text, sample_chars)
+    if total_words < 5:
+        return None, 0.0
+
+    best = max(ratios, key=ratios.get)
+    if ratios[best] < MIN_STOPWORD_RATIO:
+        return None, 0.0
+
+    confidence = ratios[best] / sum(ratios.values())
+    return best, round(confidence, 3)
+
+
+def normalize_language_code(value) -> str:
+    """Riduce 'it-IT', 'IT', 'ita', 'Italian' ecc. al codice a due lettere."""
+    if not value or not isinstance(value, str):
+        return None
+    value = value.strip().lower()
+    aliases = {"italian": "it", "italiano": "it", "ita": "it", "english": "en", "eng": "en"}
+    if value in aliases:
+        return aliases[value]
+    code = re.split(r"[-_]", value)[0]
+    return code if len(code) == 2 else None
+
+
+def resolve_language(text: str, declared_language: str = None) -> tuple:
+    """
+    Combina la lingua dichiarata dalla sorgente (es. campo dell'item Apify)
+    con il riconoscimento locale. Restituisce (codice o None, origine), con
+    origine "source" o "local".
+
+    La dichiarazione non basta da sola: spesso è solo la lingua richiesta
+    all'actor ("it") ripetuta anche per sottotitoli di ripiego in un'altra
+    lingua. Vale finché nessun'altra lingua ha chiaramente più stopword
+    (DOMINANCE_RATIO volte quelle della lingua dichiarata).
+    """
+    declared = normalize_language_code(declared_language)
+    if not declared:
+        return detect_language(text)[0], "local"
+
+    ratios, total_words = _stopword_ratios(text)
+    if total_words < 5:
+        return declared, "source"
+    declared_ratio = ratios.get(declared, 0.0)
+    others = {lang: ratio for lang, ratio in ratios.items() if lang != declared}
+    best = max(others, key=others.get)
+    if others[best] >= MIN_STOPWORD_RATIO and others[best] >= declared_ratio * DOMINANCE_RATIO:
+        return best, "local"
+    return declared, "source"
+
+
+def is_italian(text: str, declared_language: str = None) -> bool:
+    """True se il testo è (prevalentemente) italiano."""
+    language, _ = resolve_language(text, declared_language)
+    return language == "it"
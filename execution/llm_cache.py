@@ -0,0 +1,183 @@
+"""
+Script: llm_cache.py
+Obiettivo: Cache delle risposte LLM indirizzata per contenuto.
+
+La chiave è l'hash di modello + messaggi (system e user prompt) + parametri di
+sampling: rieseguire uno step con lo stesso input restituisce la risposta
+salvata senza pagare un'altra completion. Il modello è quello scelto dal
+routing (model_router.py); se a rispondere è stato il backup di una richiesta
+hedged, la risposta viene salvata comunque sotto la chiave del modello scelto.
+
+Configurazione (.env):
+    LLM_CACHE_ENABLED=1                  0 per disattivare la cache ovunque
+    LLM_CACHE_DISABLED_STAGES=...        stage esclusi, separati da virgola (es. generate_script)
+    LLM_CACHE_TTL                        validità in secondi (default 30 giorni)
+    LLM_CACHE_MAX_MB                     dimensione massima (default 100 MB)
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import defaultdict
+
+try:
+    from execution.disk_cache import DiskCache
+    from execution.openrouter_client import get_client, get_async_client, request_timeout
+    from execution.provider_limits import async_provider_slot
+    from execution.provider_calls import call_provider, acall_provider
+    from execution.metrics import track_llm_call, record_usage, record_cache
+    from execution.model_router import hedged_call
+except ImportError:
+    from disk_cache import DiskCache
+    from openrouter_client import get_client, get_async_client, request_timeout
+    from provider_limits import async_provider_slot
+    from provider_calls import call_provider, acall_provider
+    from metrics import track_llm_call, record_usage, record_cache
+    from model_router import hedged_call
+
+_cache = None
+_lock = threading.Lock()
+_hits = defaultdict(int)
+_misses = defaultdict(int)
+
+
+def get_llm_cache() -> DiskCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = DiskCache(
+                    "llm_responses",
+                    ttl=float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600))),
+                    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "100")) * 1024 * 1024),
+                )
+    return _cache
+
+
+def is_cache_enabled(stage: str) -> bool:
+    if os.getenv("LLM_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return False
+    disabled = {s.strip() for s in os.getenv("LLM_CACHE_DISABLED_STAGES", "").split(",") if s.strip()}
+    return stage not in disabled
+
+
+def completion_key(model: str, messages: list, params: dict) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def complete(stage: str, model: str, messages: list, **params) -> tuple:
+    """
+    Chat completion via OpenRouter senza cache, con hedging se lo stage lo prevede.
+    Restituisce (testo, modello che ha risposto).
+    """
+    def call(target: str):
+        def create():
+            with track_llm_call(stage, target):
+                return get_client().chat.completions.create(
+                    model=target, messages=messages, timeout=request_timeout(), **params
+                )
+
+        response = call_provider("openrouter", create, key=target)
+        record_usage(stage, target, response.usage)
+        return response.choices[0].message.content
+
+    return hedged_call(stage, model, call)
+
+
+def cached_completion(stage: str, model: str, messages: list, use_cache: bool = True, **params) -> str:
+    """
+    Esegue una chat completion via OpenRouter passando dalla cache.
+    Restituisce il testo della risposta; `params` (temperature, max_tokens...)
+    fanno parte della chiave.
+    """
+    enabled = use_cache and is_cache_enabled(stage)
+    key = completion_key(model, messages, params)
+
+    if enabled:
+        cached = get_llm_cache().get(key)
+        record_cache("llm", stage, cached is not None)
+        if cached is not None:
+            with _lock:
+                _hits[stage] += 1
+            return cached["content"]
+        with _lock:
+            _misses[stage] += 1
+
+    content, answered_by = complete(stage, model, messages, **params)
+
+    if enabled and content:
+        try:
+            get_llm_cache().set(key, {"stage": stage, "model": answered_by, "content": content})
+        except Exception as e:
+            print(f"[WARN] Impossibile salvare la risposta LLM in cache: {e}")
+    return content
+
+
+async def stream_cached_completion(stage: str, model: str, messages: list, use_cache: bool = True, **params):
+    """
+    Variante in streaming di `cached_completion` (async generator di frammenti di testo),
+    senza hedging: i token arrivano al client man mano, non si può cambiare modello a metà.
+    Su cache hit restituisce la risposta salvata in un unico frammento; altrimenti
+    inoltra i token man mano che arrivano e salva il testo completo solo se lo
+    stream termina: la stessa richiesta non in streaming troverà poi il risultato in cache.
+    """
+    enabled = use_cache and is_cache_enabled(stage)
+    key = completion_key(model, messages, params)
+
+    if enabled:
+        cached = await asyncio.to_thread(get_llm_cache().get, key)
+        record_cache("llm", stage, cached is not None)
+        if cached is not None:
+            with _lock:
+                _hits[stage] += 1
+            yield cached["content"]
+            return
+        with _lock:
+            _misses[stage] += 1
+
+    parts = []
+    async def create():
+        with track_llm_call(stage, model):
+            return await get_async_client().chat.completions.create(
+                model=model, messages=messages, stream=True, timeout=request_timeout(), **params
+            )
+
+    # Il posto nel semaforo resta occupato per tutta la durata dello stream;
+    # i retry riguardano solo l'apertura (prima che arrivi qualunque token)
+    async with async_provider_slot("openrouter"):
+        stream = await acall_provider("openrouter", create, key=model, slot=False)
+        try:
+            async for chunk in stream:
+                # L'ultimo chunk può portare l'usage (senza choices)
+                record_usage(stage, model, getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            # Se il client si disconnette chiudiamo subito la connessione verso OpenRouter
+            await stream.close()
+
+    content = "".join(parts)
+    if enabled and content:
+        try:
+            await asyncio.to_thread(get_llm_cache().set, key, {"stage": stage, "model": model, "content": content})
+        except Exception as e:
+            print(f"[WARN] Impossibile salvare la risposta LLM in cache: {e}")
+
+
+def cache_stats() -> dict:
+    """Contatori hit/miss per stage (del processo corrente) e occupazione su disco."""
+    with _lock:
+        stats = {"hits": dict(_hits), "misses": dict(_misses)}
+    stats.update(get_llm_cache().stats())
+    return stats
@@ -0,0 +1,239 @@
+"""
+Script: metrics.py
+Obiettivo: Metriche di latenza, token e cache per stage, in formato Prometheus.
+
+Contatori e istogrammi in memoria, senza dipendenze esterne: gli step della
+pipeline, le chiamate OpenRouter/Apify e le cache li aggiornano, l'API li
+espone su GET /api/metrics. I valori sono per processo (con più worker uvicorn
+o processi worker dedicati ognuno espone i propri).
+"""
+
+import math
+import time
+import asyncio
+import threading
+import contextlib
+
+try:
+    from execution.deadlines import DeadlineExceeded, RequestCancelled, current as current_deadline
+except ImportError:
+    from deadlines import DeadlineExceeded, RequestCancelled, current as current_deadline
+
+# Secondi: gli step vanno da poche centinaia di ms (cache) a diversi minuti (Apify)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: label attese {self.labelnames}, ricevute {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [conteggi per bucket, somma, conteggio totale]
+            state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = sorted((key, list(counts), total, count) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, counts, total, count in items:
+            bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, counts + [count]):
+                le = 'le="' + bound + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def _register(cls, name: str, documentation: str, labelnames: tuple, **kwargs):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, documentation, labelnames, **kwargs)
+        return _registry[name]
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return _register(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return _register(Gauge, name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def render_prometheus() -> str:
+    """Tutte le metriche registrate nel formato testuale di Prometheus (0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# --- Metriche della pipeline ---
+
+STAGE_DURATION = histogram(
+    "pipeline_stage_duration_seconds", "Durata di uno step della pipeline (esclusa l'attesa in coda)", ("stage", "status")
+)
+STAGE_QUEUE_WAIT = histogram(
+    "pipeline_stage_queue_wait_seconds", "Attesa prima che lo step ottenga un posto nel suo stage", ("stage",)
+)
+STAGE_ERRORS = counter("pipeline_stage_errors_total", "Step terminati con errore", ("stage",))
+STAGE_CANCELLATIONS = counter(
+    "pipeline_stage_cancellations_total", "Step interrotti prima della fine (client disconnesso, scadenza...)",
+    ("stage", "reason")
+)
+
+LLM_DURATION = histogram(
+    "llm_request_duration_seconds", "Durata delle chiamate OpenRouter", ("stage", "model")
+)
+LLM_TOKENS = counter("llm_tokens_total", "Token riportati da OpenRouter (response.usage)", ("stage", "model", "type"))
+LLM_ERRORS = counter("llm_errors_total", "Chiamate OpenRouter fallite", ("stage", "model"))
+
+CACHE_REQUESTS = counter("cache_requests_total", "Letture dalle cache (hit/miss)", ("cache", "stage", "result"))
+
+PROVIDER_WAIT = histogram("provider_slot_wait_seconds", "Attesa di un posto libero verso il provider", ("provider",))
+PROVIDER_DURATION = histogram("provider_call_duration_seconds", "Durata delle chiamate verso il provider", ("provider",))
+
+
+@contextlib.contextmanager
+def track_stage(stage: str):
+    """Misura la durata di uno step e conta errori, cancellazioni e scadenze."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except DeadlineExceeded:
+        status = "timeout"
+        STAGE_CANCELLATIONS.inc(stage=stage, reason="deadline")
+        raise
+    except (asyncio.CancelledError, RequestCancelled):
+        status = "cancelled"
+        deadline = current_deadline()
+        reason = deadline.cancelled() if deadline is not None else None
+        STAGE_CANCELLATIONS.inc(stage=stage, reason=reason or "cancelled")
+        raise
+    except BaseException:
+        status = "error"
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, stage=stage, status=status)
+
+
+@contextlib.contextmanager
+def track_llm_call(stage: str, model: str):
+    """Misura una chiamata OpenRouter (anche se chi chiama è una coroutine)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        LLM_ERRORS.inc(stage=stage, model=model)
+        raise
+    finally:
+        LLM_DURATION.observe(time.perf_counter() - start, stage=stage, model=model)
+
+
+def record_usage(stage: str, model: str, usage):
+    """Registra i token di `response.usage` (ignorato se il provider non lo restituisce)."""
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens:
+            LLM_TOKENS.inc(tokens, stage=stage, model=model, type=kind)
+
+
+def record_cache(cache: str, stage: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, stage=stage, result="hit" if hit else "miss")
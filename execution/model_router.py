@@ -0,0 +1,253 @@
+"""
+Script: model_router.py
+Obiettivo: Scegliere il modello OpenRouter per stage e dimensione dell'input, con richieste "hedged".
+
+Routing: una tabella indica per ogni stage quale modello usare in base ai
+caratteri dei messaggi. Le regole di uno stage si leggono in ordine e vince la
+prima la cui soglia è maggiore della dimensione dell'input; una regola senza
+soglia vale per qualunque dimensione. Gli stage non in tabella usano il modello
+di default. Sintassi (stage separati da ';', regole da ','):
+
+    translate=fast<12000,default; extract_topics=fast<20000,default; condense=fast
+
+I nomi "default", "fast" e "backup" sono alias (vedi sotto), altrimenti si
+indica l'id OpenRouter completo (es. google/gemini-flash-1.5).
+
+Hedging (opzionale, disattivato di default: duplica la spesa sulle chiamate
+lente): negli stage in LLM_HEDGE_STAGES, se il modello scelto non risponde
+entro il suo p95 recente (per stage e modello, sulle ultime LLM_HEDGE_WINDOW
+chiamate) parte una seconda richiesta al modello di backup e vince la prima
+risposta valida. La richiesta perdente non viene ritentata; la sua latenza, se
+arriva, continua ad alimentare il p95. Se la prima richiesta fallisce prima
+del ritardo il backup parte subito, tranne quando il motivo è la scadenza o la
+cancellazione della richiesta (deadlines.py).
+
+Configurazione (.env):
+    OPENROUTER_MODEL_CLAUDE                  alias "default" (vedi openrouter_client.py)
+    OPENROUTER_MODEL_FAST=anthropic/claude-3.5-haiku   alias "fast"
+    OPENROUTER_MODEL_BACKUP=openai/gpt-4o-mini         alias "backup", modello delle richieste hedged
+    MODEL_ROUTES=...                         tabella di routing (default DEFAULT_ROUTES, "" = sempre default)
+    LLM_HEDGE_STAGES=                        stage con hedging, es. translate,extract_topics,condense
+                                             (default vuoto = disattivato)
+    LLM_HEDGE_PERCENTILE=0.95                percentile della latenza oltre il quale partire col backup
+    LLM_HEDGE_MIN_SAMPLES=20                 campioni necessari prima di usare il percentile
+    LLM_HEDGE_DEFAULT_DELAY=10               ritardo (secondi) finché i campioni non bastano
+    LLM_HEDGE_MIN_DELAY=1                    ritardo minimo, per non raddoppiare le chiamate veloci
+    LLM_HEDGE_WINDOW=200                     chiamate recenti considerate per il percentile
+    LLM_HEDGE_WORKERS=64                     thread per le richieste hedged in corso
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from execution.openrouter_client import get_default_model
+    from execution.metrics import counter
+    from execution import deadlines
+except ImportError:
+    from openrouter_client import get_default_model
+    from metrics import counter
+    import deadlines
+
+DEFAULT_ROUTES = "translate=fast<12000,default; extract_topics=fast<20000,default; condense=fast"
+DEFAULT_HEDGE_STAGES = ""
+
+HEDGES = counter("llm_hedged_requests_total", "Richieste LLM duplicate sul modello di backup, per vincitore",
+                 ("stage", "winner"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def resolve_model(name: str) -> str:
+    """Alias della tabella -> id OpenRouter."""
+    if name == "default":
+        return get_default_model()
+    if name == "fast":
+        return os.getenv("OPENROUTER_MODEL_FAST", "anthropic/claude-3.5-haiku")
+    if name == "backup":
+        return os.getenv("OPENROUTER_MODEL_BACKUP", "openai/gpt-4o-mini")
+    return name
+
+
+def parse_routes(spec: str) -> dict:
+    """'translate=fast<12000,default' -> {"translate": [(12000, "fast"), (None, "default")]}."""
+    routes = {}
+    for stage_spec in spec.split(";"):
+        if not stage_spec.strip():
+            continue
+        stage, sep, rules = stage_spec.partition("=")
+        if not sep:
+            raise ValueError(f"MODEL_ROUTES non valido: '{stage_spec.strip()}' (atteso stage=modello<caratteri,...)")
+        parsed = []
+        for rule in rules.split(","):
+            model, _, limit = rule.strip().partition("<")
+            if model:
+                parsed.append((int(limit) if limit else None, model.strip()))
+        routes[stage.strip()] = parsed
+    return routes
+
+
+def _routes() -> dict:
+    return parse_routes(os.getenv("MODEL_ROUTES", DEFAULT_ROUTES))
+
+
+def input_size(messages: list) -> int:
+    return sum(len(message.get("content") or "") for message in messages)
+
+
+def choose_model(stage: str, messages: list) -> str:
+    """Modello per `stage` in base alla dimensione dei messaggi."""
+    size = input_size(messages)
+    for limit, model in _routes().get(stage, ()):
+        if limit is None or size < limit:
+            return resolve_model(model)
+    return get_default_model()
+
+
+class LatencyTracker:
+    """Latenze recenti per (stage, modello), per stimare il ritardo dell'hedging."""
+
+    def __init__(self, window: int = None):
+        self.window = window or int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, model: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get((stage, model))
+            if samples is None:
+                samples = self._samples[(stage, model)] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, stage: str, model: str, q: float, min_samples: int = 1):
+        """Percentile `q` (0-1) delle latenze, oppure None se i campioni sono meno di `min_samples`."""
+        with self._lock:
+            samples = sorted(self._samples.get((stage, model), ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(q * len(samples)) - 1)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = list(self._samples)
+        return {
+            f"{stage}:{model}": {
+                "samples": len(self._samples[(stage, model)]),
+                "p50_s": round(self.percentile(stage, model, 0.5), 3),
+                "p95_s": round(self.percentile(stage, model, 0.95), 3),
+            }
+            for stage, model in keys
+        }
+
+
+latencies = LatencyTracker()
+
+
+def hedge_delay(stage: str, model: str) -> float:
+    """Secondi da attendere prima di duplicare la richiesta."""
+    p = latencies.percentile(
+        stage, model, float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95")),
+        min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    )
+    if p is None:
+        p = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "10"))
+    return max(float(os.getenv("LLM_HEDGE_MIN_DELAY", "1")), p)
+
+
+def backup_model(stage: str):
+    """Modello per la richiesta hedged, oppure None se lo stage non usa l'hedging."""
+    stages = {s.strip() for s in os.getenv("LLM_HEDGE_STAGES", DEFAULT_HEDGE_STAGES).split(",") if s.strip()}
+    if stage not in stages:
+        return None
+    return resolve_model("backup")
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HEDGE_WORKERS", "64")),
+                                           thread_name_prefix="llm-hedge")
+    return _pool
+
+
+def _observed(stage: str, call, model: str):
+    started = time.perf_counter()
+    result = call(model)
+    latencies.observe(stage, model, time.perf_counter() - started)
+    return result
+
+
+def hedged_call(stage: str, model: str, call):
+    """
+    Esegue `call(model)`; se lo stage usa l'hedging e la risposta tarda oltre il
+    p95 recente, esegue anche `call(backup)`. Restituisce (risultato, modello che ha risposto).
+    """
+    backup = backup_model(stage)
+    if backup is None:
+        return _observed(stage, call, model), model
+
+    pool = _get_pool()
+    attempts = {}  # future -> (modello, scadenza propria della richiesta)
+
+    def launch(target: str):
+        # Ogni richiesta ha una scadenza figlia di quella corrente: si può cancellare solo la perdente
+        with deadlines.deadline_scope() as scope:
+            future = pool.submit(deadlines.propagate(_observed), stage, call, target)
+        attempts[future] = (target, scope)
+
+    def cancel_others(keep, reason: str):
+        for other, (_, scope) in attempts.items():
+            if other is not keep:
+                scope.cancel(reason)
+
+    def stopped(error) -> bool:
+        return isinstance(error, (deadlines.DeadlineExceeded, deadlines.RequestCancelled))
+
+    launch(model)
+    done, _ = wait(attempts, timeout=hedge_delay(stage, model))
+    if done:
+        error = next(iter(done)).exception()
+        if stopped(error):
+            raise error
+    if not done or error is not None:
+        launch(backup)
+
+    errors = []
+    pending = set(attempts)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if stopped(error):
+                # Scadenza o cancellazione: inutile aspettare l'altra richiesta
+                cancel_others(future, "hedge_aborted")
+                raise error
+            if error is not None:
+                errors.append(error)
+                continue
+            target, _ = attempts[future]
+            cancel_others(future, "hedge_lost")
+            if len(attempts) > 1:
+                HEDGES.inc(stage=stage, winner="primary" if target == model else "backup")
+            return future.result(), target
+
+    HEDGES.inc(stage=stage, winner="none")
+    raise errors[0]
+
+
+def router_stats() -> dict:
+    return {
+        "routes": {stage: [[limit, resolve_model(name)] for limit, name in rules]
+                   for stage, rules in _routes().items()},
+        "hedge_stages": sorted(s.strip() for s in os.getenv("LLM_HEDGE_STAGES", DEFAULT_HEDGE_STAGES).split(",")
+                               if s.strip()),
+        "backup_model": resolve_model("backup"),
+        "latency": latencies.stats(),
+    }
@@ -0,0 +1,142 @@
+"""
+Script: openrouter_client.py
+Obiettivo: Client OpenRouter condiviso (sync e async) con connessioni keep-alive.
+
+Tutti gli script di `execution/` passano da qui invece di creare un nuovo
+`OpenAI(...)` a ogni chiamata: il pool HTTP (e le connessioni TLS già aperte)
+viene riutilizzato tra richieste e thread. Il pacchetto openai viene importato
+alla creazione del primo client (o da `warm_up()` all'avvio del backend).
+
+Configurazione (.env):
+    OPENROUTER_BASE_URL            default https://openrouter.ai/api/v1
+    OPENROUTER_MAX_CONNECTIONS     connessioni massime nel pool (default 100)
+    OPENROUTER_MAX_KEEPALIVE       connessioni tenute aperte a riposo (default 20)
+    OPENROUTER_KEEPALIVE_EXPIRY    secondi prima di chiudere una connessione inattiva (default 60)
+    OPENROUTER_TIMEOUT             timeout di lettura per richiesta in secondi (default 120),
+                                   ridotto al tempo rimasto se la richiesta ha una scadenza
+    OPENROUTER_CONNECT_TIMEOUT     timeout di connessione in secondi (default 10)
+    OPENROUTER_MAX_RETRIES         retry automatici del client OpenAI (default 0: i retry
+                                   li gestisce provider_calls.py, con backoff e circuit breaker)
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING
+import httpx
+
+try:
+    from execution.env_loader import load_env
+    from execution.deadlines import timeout_for
+except ImportError:
+    from env_loader import load_env
+    from deadlines import timeout_for
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+load_env()
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_MODEL = "anthropic/claude-3.5-sonnet"
+
+EXTRA_HEADERS = {
+    "HTTP-Referer": "https://antigravity.app",
+    "X-Title": "Antigravity App"
+}
+
+_lock = threading.Lock()
+_client = None
+# Un client async per event loop: le connessioni httpx async non possono cambiare loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_api_key() -> str:
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if not api_key:
+        raise ValueError("OPENROUTER_API_KEY mancante nel file .env")
+    return api_key
+
+
+def get_default_model() -> str:
+    """Modello generico (alias "default" nella tabella di routing di model_router.py)."""
+    return os.getenv("OPENROUTER_MODEL_CLAUDE", DEFAULT_MODEL)
+
+
+def _client_options() -> dict:
+    timeout = float(os.getenv("OPENROUTER_TIMEOUT", "120"))
+    return {
+        "base_url": os.getenv("OPENROUTER_BASE_URL", DEFAULT_BASE_URL),
+        "api_key": get_api_key(),
+        "timeout": httpx.Timeout(timeout, connect=float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))),
+        "max_retries": int(os.getenv("OPENROUTER_MAX_RETRIES", "0")),
+        "default_headers": EXTRA_HEADERS,
+    }
+
+
+def request_timeout() -> float:
+    """Timeout di una singola richiesta: OPENROUTER_TIMEOUT, ridotto al tempo rimasto (deadlines.py)."""
+    return timeout_for(float(os.getenv("OPENROUTER_TIMEOUT", "120")))
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60")),
+    )
+
+
+def get_client() -> "OpenAI":
+    """
+    Restituisce il client sincrono condiviso (thread-safe), creandolo alla prima chiamata.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                # Import differito: il pacchetto openai è la parte più lenta dell'avvio
+                from openai import OpenAI
+                options = _client_options()
+                _client = OpenAI(
+                    http_client=httpx.Client(limits=_pool_limits(), timeout=options["timeout"]),
+                    **options
+                )
+    return _client
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """
+    Restituisce il client asincrono condiviso per l'event loop corrente.
+    Va chiamata dall'interno di una coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from openai import AsyncOpenAI
+        options = _client_options()
+        client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(limits=_pool_limits(), timeout=options["timeout"]),
+            **options
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def warm_up():
+    """
+    Importa l'SDK e crea il client sincrono (con le risorse chat già caricate),
+    così la prima richiesta non paga questi costi.
+    """
+    get_client().chat.completions
+
+
+def close_clients():
+    """Chiude il client sincrono; i client async vengono rilasciati con il loro event loop."""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+    _async_clients.clear()
@@ -0,0 +1,209 @@
+"""
+Script: pipeline.py
+Obiettivo: Eseguire la pipeline completa come grafo di stage con checkpoint.
+
+Gli stage partono appena i loro input sono pronti, quindi quelli indipendenti
+si sovrappongono: l'estrazione dei topic lavora sul testo originale mentre la
+traduzione è ancora in corso. L'output di ogni stage viene passato a un
+callback di checkpoint; rieseguendo con i checkpoint salvati si riparte
+dall'ultimo stage riuscito.
+
+La pipeline ha una scadenza complessiva (PIPELINE_DEADLINE, vedi deadlines.py):
+ogni stage riceve una quota del tempo rimasto proporzionale al suo peso
+rispetto agli stage che ancora lo seguono.
+
+Grafo della pipeline video:
+
+    fetch_transcript ──> translate ─────────────────────┐
+           └──────────> extract_topics ──> research ──> generate_script
+
+Uso: python pipeline.py <youtube_url> [--no-cache]
+
+Configurazione (.env):
+    PIPELINE_DEADLINE=1800   secondi massimi per un video (0 = nessuna scadenza)
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from execution.transcribe_video import transcription_from_cache, fetch_raw_transcript, finalize_transcription
+    from execution.extract_topics import extract_topics
+    from execution.research_topics import research_topics
+    from execution.generate_script import generate_video_script
+    from execution.metrics import track_stage
+    from execution import deadlines
+except ImportError:
+    from transcribe_video import transcription_from_cache, fetch_raw_transcript, finalize_transcription
+    from extract_topics import extract_topics
+    from research_topics import research_topics
+    from generate_script import generate_video_script
+    from metrics import track_stage
+    import deadlines
+
+
+class Stage:
+    """Uno stage del grafo: `fn` riceve gli output delle dipendenze, nell'ordine di `deps`."""
+
+    def __init__(self, name: str, fn, deps: tuple = ()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+class StageError(Exception):
+    """Errore di uno stage; gli output completati restano nei checkpoint."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage '{stage}' fallito: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageGraph:
+    def __init__(self, stages: list):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Dipendenza sconosciuta '{dep}' per lo stage '{stage.name}'")
+        self._downstream = {}
+
+    def downstream_weight(self, name: str) -> float:
+        """Peso del percorso più pesante di stage che dipendono (anche indirettamente) da `name`."""
+        if name not in self._downstream:
+            children = [stage.name for stage in self.stages.values() if name in stage.deps]
+            self._downstream[name] = max(
+                (deadlines.STAGE_WEIGHTS.get(child, 1) + self.downstream_weight(child) for child in children),
+                default=0.0
+            )
+        return self._downstream[name]
+
+    def run(self, checkpoints: dict = None, on_stage_start=None, on_stage_complete=None,
+            max_workers: int = None) -> tuple:
+        """
+        Esegue gli stage mancanti. `checkpoints` contiene gli output già salvati
+        (nome stage -> output) e non vengono ricalcolati.
+
+        Callback (chiamati dai thread worker):
+            on_stage_start(name)
+            on_stage_complete(name, output, seconds)
+
+        Restituisce (outputs, timings). Alla prima eccezione attende gli stage
+        già in corso (i loro checkpoint vengono comunque salvati) e solleva StageError.
+        """
+        outputs = dict(checkpoints or {})
+        timings = {}
+        pending = [name for name in self.stages if name not in outputs]
+        lock = threading.Lock()
+
+        def execute(stage: Stage):
+            deadlines.check()
+            if on_stage_start:
+                on_stage_start(stage.name)
+            started = time.perf_counter()
+            with lock:
+                args = [outputs[dep] for dep in stage.deps]
+            with deadlines.deadline_scope(deadlines.stage_seconds(stage.name, self.downstream_weight(stage.name))):
+                with track_stage(stage.name):
+                    result = stage.fn(*args)
+            seconds = round(time.perf_counter() - started, 3)
+            if on_stage_complete:
+                on_stage_complete(stage.name, result, seconds)
+            return result, seconds
+
+        running = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=max_workers or len(self.stages), thread_name_prefix="pipeline") as pool:
+            while pending or running:
+                if failure is None:
+                    ready = [name for name in pending if all(dep in outputs for dep in self.stages[name].deps)]
+                    for name in ready:
+                        pending.remove(name)
+                        running[pool.submit(deadlines.propagate(execute), self.stages[name])] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result, seconds = future.result()
+                    except Exception as e:
+                        if failure is None:
+                            failure = StageError(name, e)
+                        continue
+                    with lock:
+                        outputs[name] = result
+                    timings[name] = seconds
+
+        if failure is not None:
+            raise failure
+        if pending:
+            raise ValueError(f"Stage non eseguibili (dipendenze cicliche?): {pending}")
+        return outputs, timings
+
+
+def build_video_pipeline(video_url: str, use_cache: bool = True) -> StageGraph:
+    """Grafo della pipeline completa per un video."""
+
+    def fetch_transcript():
+        if use_cache:
+            cached = transcription_from_cache(video_url)
+            if cached:
+                # In cache c'è già il testo tradotto: translate non chiama il modello
+                # e i topic vengono estratti direttamente dalla versione italiana
+                return {"raw_text": cached["text"], "title": cached["metadata"]["title"],
+                        "language": cached["metadata"].get("language"), "transcript": cached}
+        return fetch_raw_transcript(video_url)
+
+    def translate(raw: dict):
+        if raw.get("transcript"):
+            return raw["transcript"]
+        return finalize_transcription(video_url, raw)
+
+    return StageGraph([
+        Stage("fetch_transcript", fetch_transcript),
+        Stage("translate", translate, deps=("fetch_transcript",)),
+        Stage("extract_topics", lambda raw: extract_topics(raw["raw_text"], use_cache=use_cache),
+              deps=("fetch_transcript",)),
+        Stage("research", lambda topics: research_topics(topics, use_cache=use_cache), deps=("extract_topics",)),
+        Stage("generate_script",
+              lambda transcript, research: generate_video_script(transcript["text"], research, use_cache=use_cache),
+              deps=("translate", "research")),
+    ])
+
+
+def run_video_pipeline(video_url: str, use_cache: bool = True, checkpoints: dict = None,
+                       on_stage_start=None, on_stage_complete=None) -> tuple:
+    """Esegue (o riprende) la pipeline per un video. Restituisce (outputs, timings)."""
+    graph = build_video_pipeline(video_url, use_cache=use_cache)
+    with deadlines.deadline_scope(float(os.getenv("PIPELINE_DEADLINE", "1800"))):
+        return graph.run(checkpoints, on_stage_start=on_stage_start, on_stage_complete=on_stage_complete)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python pipeline.py <youtube_url> [--no-cache]")
+        sys.exit(1)
+
+    try:
+        outputs, timings = run_video_pipeline(
+            sys.argv[1],
+            use_cache="--no-cache" not in sys.argv[2:],
+            on_stage_complete=lambda name, _, seconds: print(f"[INFO] Stage {name} completato in {seconds}s", file=sys.stderr)
+        )
+        print(json.dumps({
+            "transcript": outputs["translate"],
+            "topics": outputs["extract_topics"],
+            "research": outputs["research"],
+            "final_script": outputs["generate_script"],
+            "timings": timings
+        }, indent=2, ensure_ascii=False))
+    except Exception as e:
+        print(f"Errore: {str(e)}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,349 @@
+"""
+Script: provider_calls.py
+Obiettivo: Layer comune per le chiamate ai provider esterni (OpenRouter, Apify).
+
+Ogni chiamata passa, nell'ordine, da:
+    1. circuit breaker per provider: dopo N errori consecutivi lato provider
+       (5xx, timeout, connessione) le chiamate falliscono subito per un periodo
+       di pausa, poi una sola chiamata di prova decide se riaprire il traffico;
+    2. token bucket per provider/modello: ritmo massimo di richieste al secondo,
+       adattivo (dimezza a ogni 429, risale gradualmente dopo i successi);
+    3. semaforo di concorrenza del provider (provider_limits.py), tenuto solo
+       durante la chiamata, non durante le attese;
+    4. retry con backoff esponenziale e jitter sugli errori transitori,
+       rispettando Retry-After quando il provider lo indica.
+Attese e retry rispettano la scadenza della richiesta (deadlines.py): se il
+tempo rimasto non basta per un altro tentativo, l'errore viene restituito subito.
+
+Configurazione (.env), <P> = OPENROUTER | APIFY:
+    <P>_RATE_LIMIT          richieste al secondo per modello/actor (default 8 / 1)
+    <P>_BURST               richieste consecutive senza attesa (default 16 / 4)
+    <P>_MAX_ATTEMPTS        tentativi per chiamata (default 4 / 2)
+    <P>_BACKOFF_BASE        primo backoff in secondi (default 1), poi raddoppia
+    <P>_BACKOFF_MAX         backoff massimo in secondi (default 30)
+    <P>_BREAKER_THRESHOLD   errori consecutivi che aprono il circuito (default 5)
+    <P>_BREAKER_COOLDOWN    secondi di circuito aperto (default 30)
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+
+import httpx
+
+try:
+    from execution.provider_limits import provider_slot, async_provider_slot
+    from execution.metrics import counter, gauge, histogram
+    from execution import deadlines
+except ImportError:
+    from provider_limits import provider_slot, async_provider_slot
+    from metrics import counter, gauge, histogram
+    import deadlines
+
+DEFAULTS = {
+    "openrouter": {"rate_limit": 8.0, "burst": 16, "max_attempts": 4},
+    "apify": {"rate_limit": 1.0, "burst": 4, "max_attempts": 2},
+}
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529}
+
+RETRIES = counter("provider_retries_total", "Tentativi ripetuti per provider e motivo", ("provider", "reason"))
+REJECTED = counter("provider_circuit_rejections_total", "Chiamate rifiutate a circuito aperto", ("provider",))
+CIRCUIT_STATE = gauge("provider_circuit_state", "Stato del circuito (0 chiuso, 1 prova, 2 aperto)", ("provider",))
+RATE_LIMIT = gauge("provider_rate_limit", "Ritmo corrente del token bucket (richieste/s)", ("provider", "key"))
+THROTTLE_WAIT = histogram("provider_throttle_wait_seconds", "Attesa imposta dal token bucket", ("provider",))
+
+
+class ProviderUnavailableError(Exception):
+    """Circuito aperto: il provider viene considerato giù e la chiamata non parte."""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"Provider '{provider}' temporaneamente non disponibile, riprova tra {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+def _setting(provider: str, name: str, default):
+    value = os.getenv(f"{provider.upper()}_{name.upper()}")
+    fallback = DEFAULTS.get(provider, {}).get(name, default)
+    return type(default)(value) if value else type(default)(fallback)
+
+
+class TokenBucket:
+    """
+    Token bucket con prenotazione: chi chiama riceve subito il tempo da attendere
+    (il token è già suo), così l'attesa avviene fuori dal lock e in ordine di arrivo.
+    Il ritmo scende a metà a ogni 429 e risale del 5% per ogni successo.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, provider: str, threshold: int, cooldown: float):
+        self.provider = provider
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    REJECTED.inc(provider=self.provider)
+                    raise ProviderUnavailableError(self.provider, remaining)
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                # Una sola chiamata di prova alla volta
+                if self._probe_in_flight:
+                    REJECTED.inc(provider=self.provider)
+                    raise ProviderUnavailableError(self.provider, self.cooldown)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self, provider_fault: bool):
+        """`provider_fault`=False per errori che non dicono nulla sulla salute del provider (es. 400)."""
+        with self._lock:
+            was_probe = self._probe_in_flight
+            self._probe_in_flight = False
+            if not provider_fault:
+                if was_probe:
+                    self._set_state(self.CLOSED)
+                return
+            self.failures += 1
+            if was_probe or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def abandon(self):
+        """La chiamata non ha avuto esito (cancellata, scaduta): libera la prova senza cambiare stato."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _set_state(self, state: int):
+        self.state = state
+        CIRCUIT_STATE.set(state, provider=self.provider)
+
+
+_buckets = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def _get_bucket(provider: str, key: str) -> TokenBucket:
+    bucket_key = (provider, key)
+    if bucket_key not in _buckets:
+        with _registry_lock:
+            if bucket_key not in _buckets:
+                _buckets[bucket_key] = TokenBucket(_setting(provider, "rate_limit", 8.0), _setting(provider, "burst", 16))
+    return _buckets[bucket_key]
+
+
+def _get_breaker(provider: str) -> CircuitBreaker:
+    if provider not in _breakers:
+        with _registry_lock:
+            if provider not in _breakers:
+                _breakers[provider] = CircuitBreaker(
+                    provider, _setting(provider, "breaker_threshold", 5), _setting(provider, "breaker_cooldown", 30.0)
+                )
+    return _breakers[provider]
+
+
+def _classify(error: Exception) -> tuple:
+    """
+    Restituisce (reason, retryable, provider_fault, retry_after).
+    Gli errori di timeout e di connessione e gli status 429/5xx sono transitori.
+    """
+    if isinstance(error, (deadlines.DeadlineExceeded, deadlines.RequestCancelled)):
+        # Decisione di chi chiama, non un problema del provider
+        return "deadline", False, False, None
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        retry_after = None
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        if headers.get("retry-after"):
+            try:
+                retry_after = float(headers["retry-after"])
+            except ValueError:
+                retry_after = None
+        if status == 429:
+            return "rate_limited", True, False, retry_after
+        retryable = status in RETRYABLE_STATUS
+        return f"http_{status}", retryable, status >= 500, retry_after
+    connection_errors = (httpx.TransportError, TimeoutError, ConnectionError)
+    # openai viene importato solo quando serve: se non è caricato l'errore non può essere suo.
+    # Il modulo può essere ancora a metà import (altro thread): si usano solo le classi già definite
+    openai = sys.modules.get("openai")
+    api_connection_error = getattr(openai, "APIConnectionError", None)
+    if isinstance(api_connection_error, type):
+        connection_errors += (api_connection_error,)
+    if isinstance(error, connection_errors):
+        return "connection", True, True, None
+    return "error", False, False, None
+
+
+def _backoff(provider: str, attempt: int, retry_after: float) -> float:
+    """Full jitter (0..base*2^n); se il provider indica Retry-After si attende almeno quello."""
+    base = _setting(provider, "backoff_base", 1.0)
+    cap = _setting(provider, "backoff_max", 30.0)
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+def _after_failure(provider: str, key: str, attempt: int, max_attempts: int, error: Exception) -> float:
+    """Aggiorna bucket e circuito; restituisce il backoff oppure rilancia se non si riprova."""
+    reason, retryable, provider_fault, retry_after = _classify(error)
+    try:
+        deadlines.check()
+    except Exception as stop:
+        # Il timeout era quello ridotto dalla scadenza della richiesta: non dice nulla sul provider
+        _get_breaker(provider).abandon()
+        raise stop from error
+    if reason == "deadline":
+        _get_breaker(provider).abandon()
+        raise error
+    _get_breaker(provider).record_failure(provider_fault)
+    if reason == "rate_limited":
+        bucket = _get_bucket(provider, key)
+        bucket.throttled()
+        RATE_LIMIT.set(round(bucket.rate, 3), provider=provider, key=key)
+    if not retryable or attempt + 1 >= max_attempts:
+        raise error
+    delay = _backoff(provider, attempt, retry_after)
+    left = deadlines.remaining()
+    if left is not None and delay >= left:
+        raise error
+    RETRIES.inc(provider=provider, reason=reason)
+    print(f"[WARN] {provider} ({key}): {reason}, nuovo tentativo {attempt + 2}/{max_attempts} tra {delay:.1f}s")
+    return delay
+
+
+def _throttle(provider: str, key: str) -> float:
+    """Attesa imposta dal token bucket; DeadlineExceeded se supera il tempo rimasto alla richiesta."""
+    wait = _get_bucket(provider, key).reserve()
+    if wait:
+        THROTTLE_WAIT.observe(wait, provider=provider)
+        left = deadlines.remaining()
+        if left is not None and wait >= left:
+            raise deadlines.DeadlineExceeded(f"{provider}: attesa del rate limit oltre la scadenza della richiesta")
+    return wait
+
+
+def _after_success(provider: str, key: str):
+    _get_breaker(provider).record_success()
+    bucket = _get_bucket(provider, key)
+    bucket.succeeded()
+    RATE_LIMIT.set(round(bucket.rate, 3), provider=provider, key=key)
+
+
+def call_provider(provider: str, fn, *args, key: str = "default", slot: bool = True, **kwargs):
+    """
+    Esegue `fn(*args, **kwargs)` verso `provider` con circuit breaker, token
+    bucket per (provider, key), semaforo di concorrenza e retry.
+    `slot=False` se il chiamante tiene già il posto nel semaforo.
+    """
+    max_attempts = _setting(provider, "max_attempts", 3)
+    for attempt in range(max_attempts):
+        deadlines.check()
+        _get_breaker(provider).before_call()
+        # Da qui la chiamata di prova (circuito semiaperto) è nostra: ogni uscita deve liberarla
+        try:
+            wait = _throttle(provider, key)
+            if wait:
+                time.sleep(wait)
+            if slot:
+                with provider_slot(provider):
+                    result = fn(*args, **kwargs)
+            else:
+                result = fn(*args, **kwargs)
+        except Exception as e:
+            time.sleep(_after_failure(provider, key, attempt, max_attempts, e))
+            continue
+        except BaseException:
+            _get_breaker(provider).abandon()
+            raise
+        _after_success(provider, key)
+        return result
+
+
+async def acall_provider(provider: str, coro_fn, *args, key: str = "default", slot: bool = True, **kwargs):
+    """Come `call_provider` per le coroutine: attese e backoff non bloccano l'event loop."""
+    max_attempts = _setting(provider, "max_attempts", 3)
+    for attempt in range(max_attempts):
+        deadlines.check()
+        _get_breaker(provider).before_call()
+        # Anche la cancellazione durante l'attesa del bucket deve liberare la chiamata di prova
+        try:
+            wait = _throttle(provider, key)
+            if wait:
+                await asyncio.sleep(wait)
+            if slot:
+                async with async_provider_slot(provider):
+                    result = await coro_fn(*args, **kwargs)
+            else:
+                result = await coro_fn(*args, **kwargs)
+        except Exception as e:
+            await asyncio.sleep(_after_failure(provider, key, attempt, max_attempts, e))
+            continue
+        except BaseException:
+            _get_breaker(provider).abandon()
+            raise
+        _after_success(provider, key)
+        return result
+
+
+def provider_health() -> dict:
+    """Stato dei circuiti e ritmo corrente dei bucket (per /api/queue)."""
+    with _registry_lock:
+        breakers = dict(_breakers)
+        buckets = dict(_buckets)
+    return {
+        "circuits": {
+            provider: {"state": ("closed", "half_open", "open")[breaker.state], "consecutive_failures": breaker.failures}
+            for provider, breaker in breakers.items()
+        },
+        "rate_limits": {
+            f"{provider}:{key}": {"rate": round(bucket.rate, 3), "max_rate": bucket.max_rate}
+            for (provider, key), bucket in buckets.items()
+        }
+    }
@@ -0,0 +1,164 @@
+"""
+Script: provider_limits.py
+Obiettivo: Limitare le chiamate contemporanee verso ogni provider esterno.
+
+Un solo semaforo per provider, condiviso da tutti i thread del processo
+(step API, worker dei job, batch): così un batch di centinaia di video usa
+tutta la capacità disponibile senza superare i limiti di Apify o OpenRouter.
+Con più processi (uvicorn --workers N, worker dedicati) il limite vale per processo.
+
+Configurazione (.env):
+    APIFY_MAX_CONCURRENCY=4          run di actor Apify in parallelo
+    OPENROUTER_MAX_CONCURRENCY=16    completion OpenRouter in parallelo
+"""
+
+import os
+import time
+import asyncio
+import threading
+import contextlib
+from collections import deque
+
+try:
+    from execution.metrics import PROVIDER_WAIT, PROVIDER_DURATION
+except ImportError:
+    from metrics import PROVIDER_WAIT, PROVIDER_DURATION
+
+DEFAULT_LIMITS = {
+    "apify": 4,
+    "openrouter": 16,
+}
+
+
+class _Limiter:
+    """
+    Semaforo condiviso da thread e coroutine. Chi aspetta viene servito in
+    ordine di arrivo: un thread si blocca su un Event, una coroutine attende un
+    Future del proprio event loop (nessun thread occupato durante l'attesa).
+    Al rilascio il posto passa direttamente al primo in coda.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._used = 0
+        self._waiters = deque()  # threading.Event oppure (loop, future)
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> bool:
+        # Da chiamare con il lock: non si scavalca chi è già in coda
+        if self._used < self.limit and not self._waiters:
+            self._used += 1
+            return True
+        return False
+
+    def acquire(self):
+        with self._lock:
+            if self._try_acquire():
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def acquire_async(self):
+        with self._lock:
+            if self._try_acquire():
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        future = waiter[1]
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # Il posto era già stato ceduto a noi: va restituito. Se il future è
+            # stato cancellato prima del passaggio ci pensa _hand_over.
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def _hand_over(self, future: asyncio.Future):
+        """Gira sull'event loop della coroutine in attesa."""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._used -= 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(self._hand_over, future)
+        except RuntimeError:
+            # Event loop chiuso: il posto passa al prossimo
+            self.release()
+
+
+_limiters = {}
+_in_flight = {}
+_lock = threading.Lock()
+
+
+def _get_limiter(provider: str) -> _Limiter:
+    if provider not in _limiters:
+        with _lock:
+            if provider not in _limiters:
+                limit = int(os.getenv(f"{provider.upper()}_MAX_CONCURRENCY", str(DEFAULT_LIMITS.get(provider, 8))))
+                _limiters[provider] = _Limiter(limit)
+                _in_flight[provider] = 0
+    return _limiters[provider]
+
+
+def _acquired(provider: str, delta: int):
+    with _lock:
+        _in_flight[provider] += delta
+
+
+@contextlib.contextmanager
+def provider_slot(provider: str):
+    """Attende un posto libero per `provider` (bloccante, per codice sincrono)."""
+    limiter = _get_limiter(provider)
+    started = time.perf_counter()
+    limiter.acquire()
+    PROVIDER_WAIT.observe(time.perf_counter() - started, provider=provider)
+    _acquired(provider, 1)
+    try:
+        with PROVIDER_DURATION.time(provider=provider):
+            yield
+    finally:
+        _acquired(provider, -1)
+        limiter.release()
+
+
+@contextlib.asynccontextmanager
+async def async_provider_slot(provider: str):
+    """Come `provider_slot` per le coroutine: l'attesa non blocca l'event loop né occupa thread."""
+    limiter = _get_limiter(provider)
+    started = time.perf_counter()
+    await limiter.acquire_async()
+    PROVIDER_WAIT.observe(time.perf_counter() - started, provider=provider)
+    _acquired(provider, 1)
+    try:
+        with PROVIDER_DURATION.time(provider=provider):
+            yield
+    finally:
+        _acquired(provider, -1)
+        limiter.release()
+
+
+def provider_stats() -> dict:
+    with _lock:
+        return {
+            provider: {"limit": limiter.limit, "in_flight": _in_flight[provider]}
+            for provider, limiter in _limiters.items()
+        }
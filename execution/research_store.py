@@ -0,0 +1,205 @@
+"""
+Script: research_store.py
+Obiettivo: Riutilizzare le ricerche Sonar per topic uguali o quasi uguali.
+
+I topic vengono normalizzati (minuscole, senza accenti, punteggiatura e
+articoli/preposizioni; le lettere non latine restano) e confrontati con la
+similarità di Jaccard sulle parole, ridotte alla radice togliendo la vocale
+finale: "Intelligenza artificiale" e "L'intelligenza artificiale generativa"
+finiscono nello stesso gruppo e vengono ricercati con una sola chiamata, mentre
+"Intelligenza artificiale nella medicina" e "... nella finanza" restano
+separati. Topic con numeri diversi (anni, versioni) non vengono mai uniti.
+
+Le ricerche fatte restano nel DiskCache "research" per RESEARCH_CACHE_TTL
+secondi, indicizzate per topic normalizzato. Per trovare anche i topic simili
+già ricercati (da altri video o processi che condividono CACHE_DIR) ogni voce
+ha una firma MinHash, indicizzata a bande (LSH): la ricerca confronta solo i
+candidati che condividono almeno una banda.
+
+Configurazione (.env):
+    RESEARCH_CACHE_TTL=259200        validità di una ricerca in secondi (default 3 giorni, 0 = cache disattivata)
+    RESEARCH_CACHE_MAX_MB=100        dimensione massima della cache
+    RESEARCH_MERGE_THRESHOLD=0.66    similarità minima (0-1) per considerare due topic equivalenti
+"""
+
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+
+try:
+    from execution.disk_cache import DiskCache
+    from execution.metrics import counter
+except ImportError:
+    from disk_cache import DiskCache
+    from metrics import counter
+
+MERGED = counter("research_topics_merged_total", "Topic uniti a un topic quasi uguale prima della ricerca", ("scope",))
+
+STOPWORDS = {
+    # italiano
+    "il", "lo", "la", "i", "gli", "le", "l", "un", "uno", "una", "un'", "di", "del", "dello", "della", "dei",
+    "degli", "delle", "a", "al", "allo", "alla", "ai", "agli", "alle", "da", "dal", "dalla", "dai", "in", "nel",
+    "nello", "nella", "nei", "negli", "nelle", "con", "su", "sul", "sulla", "per", "tra", "fra", "e", "ed", "o",
+    "d", "come", "che",
+    # inglese
+    "the", "an", "of", "and", "or", "on", "for", "to", "with", "how", "what",
+}
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+_PRIME = (1 << 61) - 1
+# Permutazioni fisse: le firme devono essere confrontabili tra processi e riavvii
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _PRIME or 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERM)
+]
+_MAX_BUCKET = 50
+DEFAULT_MERGE_THRESHOLD = "0.66"
+
+
+def normalize_topic(topic: str) -> str:
+    """'L'Intelligenza Artificiale!' -> 'intelligenza artificiale'."""
+    text = unicodedata.normalize("NFKD", topic or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    tokens = re.findall(r"[^\W_]+", text)
+    meaningful = [token for token in tokens if token not in STOPWORDS]
+    # Un topic fatto solo di simboli non deve collassare sulla stringa vuota (e unirsi agli altri)
+    return " ".join(meaningful or tokens) or " ".join((topic or "").casefold().split())
+
+
+def _shingles(normalized: str) -> set:
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def _stems(normalized: str) -> set:
+    """Parole senza la vocale finale, così singolare e plurale coincidono ('tecnologie' ~ 'tecnologia')."""
+    return {token[:-1] if len(token) > 4 and token[-1] in "aeiou" else token for token in normalized.split()}
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard sulle parole di due topic già normalizzati (0 se i numeri non coincidono)."""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+        return 0.0
+    sa, sb = _stems(a), _stems(b)
+    return len(sa & sb) / len(sa | sb)
+
+
+def minhash(normalized: str) -> list:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+              for s in _shingles(normalized)]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def _band_keys(model: str, signature: list) -> list:
+    rows = NUM_PERM // BANDS
+    return [
+        f"lsh:{model}:{band}:" + hashlib.blake2b(
+            ",".join(map(str, signature[band * rows:(band + 1) * rows])).encode(), digest_size=8
+        ).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+def merge_topics(topics: list, threshold: float = None) -> list:
+    """
+    Raggruppa i topic quasi uguali mantenendo l'ordine di prima apparizione.
+    Restituisce una lista di gruppi (liste di topic originali).
+    """
+    if threshold is None:
+        threshold = float(os.getenv("RESEARCH_MERGE_THRESHOLD", DEFAULT_MERGE_THRESHOLD))
+    groups = []  # (topic normalizzati, topic originali)
+    for topic in topics:
+        normalized = normalize_topic(topic)
+        for members_normalized, members in groups:
+            if any(similarity(normalized, other) >= threshold for other in members_normalized):
+                members_normalized.append(normalized)
+                members.append(topic)
+                MERGED.inc(scope="request")
+                break
+        else:
+            groups.append(([normalized], [topic]))
+    return [members for _, members in groups]
+
+
+class ResearchStore:
+    def __init__(self, ttl: float = None, threshold: float = None, max_bytes: int = None, directory: str = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESEARCH_CACHE_TTL", str(3 * 24 * 3600)))
+        self.threshold = threshold or float(os.getenv("RESEARCH_MERGE_THRESHOLD", DEFAULT_MERGE_THRESHOLD))
+        self._cache = DiskCache(
+            "research",
+            ttl=self.ttl or None,
+            max_bytes=max_bytes or int(float(os.getenv("RESEARCH_CACHE_MAX_MB", "100")) * 1024 * 1024),
+            directory=directory
+        )
+        self._index_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def lookup(self, model: str, topic: str):
+        """Ricerca salvata per il topic o per uno quasi uguale, oppure None."""
+        if not self.enabled:
+            return None
+        normalized = normalize_topic(topic)
+        if not normalized:
+            return None
+        entry = self._cache.get(f"topic:{model}:{normalized}")
+        if entry is not None:
+            return entry
+
+        candidates = set()
+        for band_key in _band_keys(model, minhash(normalized)):
+            candidates.update(self._cache.get(band_key) or ())
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            score = similarity(normalized, candidate)
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None
+        entry = self._cache.get(f"topic:{model}:{best}")
+        if entry is not None:
+            MERGED.inc(scope="store")
+        return entry
+
+    def store(self, model: str, topics: list, text: str):
+        """Salva la ricerca sotto tutti i topic del gruppo che l'ha prodotta."""
+        if not self.enabled:
+            return
+        for topic in topics:
+            normalized = normalize_topic(topic)
+            if not normalized:
+                continue
+            self._cache.set(f"topic:{model}:{normalized}", {"topics": topics, "text": text})
+            with self._index_lock:
+                for band_key in _band_keys(model, minhash(normalized)):
+                    bucket = self._cache.get(band_key) or []
+                    if normalized not in bucket:
+                        self._cache.set(band_key, (bucket + [normalized])[-_MAX_BUCKET:])
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "merge_threshold": self.threshold}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_research_store() -> ResearchStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResearchStore()
+    return _store
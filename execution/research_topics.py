@@ -1,68 +1,263 @@
 """
 Script: research_topics.py
 Obiettivo: Ricercare approfondimenti sui topic usando Perplexity Sonar.
+
+I topic quasi uguali vengono uniti e ricercati una volta sola, e le ricerche
+recenti (anche di altri video) vengono riutilizzate: vedi research_store.py.
 """
 
 import os
 import sys
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
-load_dotenv()
+if TYPE_CHECKING:
+    from openai import OpenAI
 
-def research_topics(topics: list) -> str:
-    """
-    Esegue una ricerca online per ogni topic e compila un report.
-    Usa Perplexity Sonar via OpenRouter.
-    """
-    api_key = os.getenv("OPENROUTER_API_KEY")
+# Client OpenRouter condiviso (import come package dal backend o come script locale)
+try:
+    from execution.openrouter_client import get_client, get_async_client
+except ImportError:
+    from openrouter_client import get_client, get_async_client
+
+try:
+    from execution.provider_calls import call_provider, acall_provider
+except ImportError:
+    from provider_calls import call_provider, acall_provider
+
+try:
+    from execution.metrics import track_llm_call, record_usage, record_cache
+except ImportError:
+    from metrics import track_llm_call, record_usage, record_cache
+
+try:
+    from execution.research_store import get_research_store, merge_topics
+except ImportError:
+    from research_store import get_research_store, merge_topics
+
+try:
+    from execution.single_flight import SingleFlight
+    from execution.env_loader import load_env
+    from execution import deadlines
+except ImportError:
+    from single_flight import SingleFlight
+    from env_loader import load_env
+    import deadlines
+
+load_env()
+
+SYSTEM_PROMPT = "Sei un ricercatore esperto. Usa il web per trovare informazioni aggiornate."
+
+# Lo stesso topic richiesto in contemporanea (da step, job o batch diversi) viene ricercato una volta sola
+_research_calls = SingleFlight("research")
+
+
+def _topic_key(model: str, topic: str) -> tuple:
+    return model, " ".join(topic.split()).casefold()
+
+def _get_config(max_concurrency: int = None, timeout: float = None) -> tuple:
+    """Legge modello e limiti di concorrenza/timeout (parametri > .env > default)."""
     model = os.getenv("OPENROUTER_MODEL_PERPLEXITY", "perplexity/sonar")
-    
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY mancante nel file .env")
 
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("RESEARCH_CONCURRENCY", "5"))
+    if timeout is None:
+        timeout = float(os.getenv("RESEARCH_TOPIC_TIMEOUT", "90"))
+    return model, max(1, max_concurrency), timeout
 
-    combined_research = "# Risultati Ricerca\n\n"
 
-    # Per semplicità, facciamo un'unica chiamata grossa o una per topic.
-    # Una chiamata per topic è più accurata ma più lenta costosa. 
-    # Optiamo per una chiamata unica raggruppata se sono pochi, o loop.
-    # Utente vuole "ricercare online questi topics". Facciamo un loop.
-    
-    for topic in topics:
-        # Processing topic silently to avoid Windows encoding issues
-        
-        prompt = f"""
+def _build_prompt(topic: str) -> str:
+    return f"""
         Effettua una ricerca approfondita sul seguente argomento: "{topic}".
         Fornisci dati recenti, fatti interessanti e dettagli che non sono ovvi.
         Includi le fonti URL alla fine.
         """
 
-        try:
-            response = client.chat.completions.create(
+
+def _build_messages(topic: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": _build_prompt(topic)}
+    ]
+
+
+def _plan(model: str, topics: list, use_cache: bool) -> tuple:
+    """
+    Unisce i topic quasi uguali e cerca ogni gruppo nel research store.
+    Restituisce (gruppi, ricerche in cache o None per ogni gruppo).
+    """
+    groups = merge_topics(topics)
+    if len(groups) < len(topics):
+        print(f"[INFO] {len(topics)} topic uniti in {len(groups)} ricerche")
+    store = get_research_store()
+    cached = []
+    for group in groups:
+        entry = None
+        if use_cache and store.enabled:
+            entry = next(filter(None, (store.lookup(model, topic) for topic in group)), None)
+            record_cache("research", "research", entry is not None)
+        cached.append(entry["text"] if entry else None)
+    return groups, cached
+
+
+def _group_query(group: list) -> str:
+    """Topic da ricercare per un gruppo: i nomi dei topic uniti, separati da ' / '."""
+    return " / ".join(group)
+
+
+def _store_result(model: str, group: list, text: str):
+    try:
+        get_research_store().store(model, group, text)
+    except Exception as e:
+        print(f"[WARN] Impossibile salvare la ricerca in cache: {e}")
+
+
+def _format_report(topics: list, results: list) -> str:
+    """
+    Compone il report nell'ordine originale dei topic.
+    `results` contiene per ogni topic il testo della ricerca oppure l'eccezione.
+    """
+    combined_research = "# Risultati Ricerca\n\n"
+    for topic, result in zip(topics, results):
+        if isinstance(result, BaseException):
+            combined_research += f"## {topic}\n\nErrore durante la ricerca: {str(result) or type(result).__name__}\n\n"
+        else:
+            combined_research += f"## {topic}\n\n{result}\n\n---\n\n"
+    return combined_research
+
+
+def _topic_timeout(timeout: float) -> TimeoutError:
+    return TimeoutError(f"nessuna risposta entro {timeout:g}s")
+
+
+def _research_topic(client: "OpenAI", model: str, topic: str, timeout: float) -> str:
+    """
+    Ricerca di un topic con `timeout` come budget complessivo (retry compresi),
+    come nella variante asincrona. Se finisce il tempo della richiesta, o la
+    richiesta viene cancellata, l'errore si propaga invece di finire nel report.
+    """
+    try:
+        with deadlines.deadline_scope(timeout):
+            return _research_calls.do(_topic_key(model, topic), _research_topic_uncoalesced, client, model, topic)
+    except deadlines.DeadlineExceeded:
+        deadlines.check()  # scaduta la richiesta e non solo il budget del topic
+        raise _topic_timeout(timeout)
+
+
+def _research_topic_uncoalesced(client: "OpenAI", model: str, topic: str) -> str:
+    def create():
+        with track_llm_call("research", model):
+            return client.chat.completions.create(
                 model=model,
-                messages=[
-                    {"role": "system", "content": "Sei un ricercatore esperto. Usa il web per trovare informazioni aggiornate."},
-                    {"role": "user", "content": prompt}
-                ],
-                extra_headers={
-                    "HTTP-Referer": "https://antigravity.app", 
-                    "X-Title": "Antigravity App"
-                }
+                messages=_build_messages(topic),
+                timeout=deadlines.timeout_for()
             )
-            
-            result = response.choices[0].message.content
-            combined_research += f"## {topic}\n\n{result}\n\n---\n\n"
-            
-        except Exception as e:
-            combined_research += f"## {topic}\n\nErrore durante la ricerca: {str(e)}\n\n"
 
-    return combined_research
+    response = call_provider("openrouter", create, key=model)
+    record_usage("research", model, response.usage)
+    return response.choices[0].message.content
+
+
+def research_topics(topics: list, max_concurrency: int = None, timeout: float = None, use_cache: bool = True) -> str:
+    """
+    Esegue una ricerca online per ogni topic e compila un report.
+    Usa Perplexity Sonar via OpenRouter.
+
+    I topic quasi uguali formano un'unica sezione del report, e le ricerche
+    recenti sugli stessi topic vengono riutilizzate (`use_cache=False` le ignora).
+    Le ricerche partono in parallelo (al massimo `max_concurrency` alla volta,
+    default RESEARCH_CONCURRENCY) con un budget di tempo per singolo topic, retry
+    compresi (default RESEARCH_TOPIC_TIMEOUT secondi). Un topic fallito non blocca
+    gli altri: nel report compare il messaggio di errore al suo posto. La scadenza
+    o la cancellazione della richiesta (deadlines.py) interrompono invece la ricerca.
+    """
+    model, max_concurrency, timeout = _get_config(max_concurrency, timeout)
+    if not topics:
+        return _format_report([], [])
+
+    groups, results = _plan(model, topics, use_cache)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        client = get_client()
+
+        def research_group(group: list) -> str:
+            text = _research_topic(client, model, _group_query(group), timeout)
+            _store_result(model, group, text)
+            return text
+
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(missing)), thread_name_prefix="research") as pool:
+            futures = {i: pool.submit(deadlines.propagate(research_group), groups[i]) for i in missing}
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except (deadlines.DeadlineExceeded, deadlines.RequestCancelled):
+                    raise
+                except Exception as e:
+                    results[i] = e
+
+    return _format_report([_group_query(group) for group in groups], results)
+
+
+async def research_topics_async(topics: list, max_concurrency: int = None, timeout: float = None,
+                                use_cache: bool = True) -> str:
+    """
+    Variante asincrona di `research_topics`: stesse regole di concorrenza,
+    timeout, cache e risultati parziali, senza occupare un thread per topic.
+    """
+    model, max_concurrency, timeout = _get_config(max_concurrency, timeout)
+    if not topics:
+        return _format_report([], [])
+
+    # Il research store è su SQLite: letture e scritture fuori dall'event loop
+    groups, cached = await asyncio.to_thread(_plan, model, topics, use_cache)
+    client = get_async_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def research_one(topic: str) -> str:
+        async def create():
+            with track_llm_call("research", model):
+                return await client.chat.completions.create(
+                    model=model,
+                    messages=_build_messages(topic),
+                    timeout=deadlines.timeout_for()
+                )
+
+        async def research_uncoalesced() -> str:
+            async with semaphore:
+                # Il timeout copre anche i retry: è il budget complessivo del topic, e come nel
+                # percorso sincrono limita anche il timeout HTTP di ogni tentativo
+                try:
+                    with deadlines.deadline_scope(timeout):
+                        response = await deadlines.wait_with_deadline(
+                            acall_provider("openrouter", create, key=model), timeout
+                        )
+                except deadlines.DeadlineExceeded:
+                    deadlines.check()  # scaduta la richiesta e non solo il budget del topic
+                    raise _topic_timeout(timeout)
+                except asyncio.TimeoutError:
+                    raise _topic_timeout(timeout)
+                record_usage("research", model, response.usage)
+                return response.choices[0].message.content
+
+        return await _research_calls.ado(_topic_key(model, topic), research_uncoalesced)
+
+    async def research_group(group: list, cached_text: str) -> str:
+        if cached_text is not None:
+            return cached_text
+        text = await research_one(_group_query(group))
+        await asyncio.to_thread(_store_result, model, group, text)
+        return text
+
+    results = await asyncio.gather(
+        *(research_group(group, cached_text) for group, cached_text in zip(groups, cached)), return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, (deadlines.DeadlineExceeded, deadlines.RequestCancelled)):
+            raise result
+
+    return _format_report([_group_query(group) for group in groups], results)
 
 if __name__ == "__main__":
     # Input atteso: JSON list of strings da stdin o file
@@ -0,0 +1,110 @@
+"""
+Script: single_flight.py
+Obiettivo: Deduplicare il lavoro identico in corso (single-flight).
+
+Se arriva una richiesta con la stessa chiave di una già in esecuzione, invece
+di ripartire da zero aspetta quella e ne riceve il risultato (o l'errore).
+Funziona tra thread e tra coroutine dello stesso processo: la chiamata in corso
+è un concurrent.futures.Future condiviso, atteso con `.result()` dai thread e
+con `asyncio.wrap_future` dalle coroutine.
+Se chi esegue il lavoro viene cancellato, o finisce il tempo della sua
+richiesta (deadlines.py), chi aspettava riprova da capo con la propria scadenza.
+"""
+
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+try:
+    from execution.metrics import counter
+    from execution.deadlines import DeadlineExceeded, RequestCancelled
+except ImportError:
+    from metrics import counter
+    from deadlines import DeadlineExceeded, RequestCancelled
+
+COALESCED = counter("coalesced_calls_total", "Chiamate servite da un'esecuzione identica già in corso", ("operation",))
+
+
+class _LeaderCancelled(Exception):
+    """L'esecuzione condivisa è stata cancellata prima di finire."""
+
+
+def content_key(*parts) -> str:
+    """Chiave compatta per input lunghi (es. una trascrizione intera)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key) -> tuple:
+        """Restituisce (future, leader): leader=True se tocca a noi eseguire."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Esegue `fn(*args, **kwargs)` oppure si accoda all'esecuzione in corso con la stessa chiave."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                COALESCED.inc(operation=self.operation)
+                try:
+                    return future.result()
+                except _LeaderCancelled:
+                    continue
+            try:
+                result = fn(*args, **kwargs)
+            except (DeadlineExceeded, RequestCancelled):
+                self._finish(key, future, error=_LeaderCancelled())
+                raise
+            except BaseException as e:
+                self._finish(key, future, error=e)
+                raise
+            self._finish(key, future, result=result)
+            return result
+
+    async def ado(self, key, coro_fn, *args, **kwargs):
+        """Come `do` per le coroutine; cancellare chi aspetta non cancella il lavoro condiviso."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                COALESCED.inc(operation=self.operation)
+                try:
+                    return await asyncio.shield(asyncio.wrap_future(future))
+                except _LeaderCancelled:
+                    continue
+            try:
+                result = await coro_fn(*args, **kwargs)
+            except (asyncio.CancelledError, DeadlineExceeded, RequestCancelled):
+                self._finish(key, future, error=_LeaderCancelled())
+                raise
+            except BaseException as e:
+                self._finish(key, future, error=e)
+                raise
+            self._finish(key, future, result=result)
+            return result
@@ -0,0 +1,66 @@
+"""
+Script: text_chunks.py
+Obiettivo: Dividere testi lunghi in blocchi entro un budget di token.
+
+Il conteggio dei token è una stima (circa 4 caratteri per token), sufficiente
+per restare sotto i limiti dei modelli senza dipendere da un tokenizer.
+I tagli avvengono sui confini di frase; le frasi troppo lunghe (es. sottotitoli
+automatici senza punteggiatura) vengono spezzate sui confini di parola.
+"""
+
+import re
+
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_END_RE.split(text) if s and s.strip()]
+
+
+def _split_words(sentence: str, max_chars: int) -> list:
+    pieces = []
+    current = []
+    length = 0
+    for word in sentence.split():
+        if current and length + 1 + len(word) > max_chars:
+            pieces.append(" ".join(current))
+            current = []
+            length = 0
+        current.append(word)
+        length += len(word) + (1 if length else 0)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int) -> list:
+    """
+    Divide `text` in blocchi di al massimo `max_tokens` token stimati,
+    preservando l'ordine. Unendo i blocchi con uno spazio si riottiene il
+    testo (a meno degli spazi bianchi).
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return [text] if text.strip() else []
+
+    chunks = []
+    current = []
+    length = 0
+    for sentence in split_sentences(text):
+        parts = [sentence] if len(sentence) <= max_chars else _split_words(sentence, max_chars)
+        for part in parts:
+            if current and length + 1 + len(part) > max_chars:
+                chunks.append(" ".join(current))
+                current = []
+                length = 0
+            current.append(part)
+            length += len(part) + (1 if length else 0)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
@@ -1,22 +1,104 @@
 """
 Script: transcribe_video.py
 Obiettivo: Trascrivere un video YouTube usando Apify.
+
+Configurazione (.env):
+    APIFY_ACTOR_MEMORY_MB      memoria del run dell'actor (default: quella dell'actor)
+    APIFY_ACTOR_TIMEOUT        timeout del run in secondi (default: quello dell'actor)
+    APIFY_WAIT_SECS=30         long polling per richiesta mentre si attende il run (percorso async)
+    APIFY_DATASET_PAGE_SIZE=1000   item letti per pagina dal dataset (percorso async)
 """
 
 import os
 import sys
 import json
-from dotenv import load_dotenv
-from apify_client import ApifyClient
-from openai import OpenAI
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Chiamate OpenRouter con routing del modello (import come package dal backend o come script locale)
+try:
+    from execution.llm_cache import complete
+    from execution.model_router import choose_model
+except ImportError:
+    from llm_cache import complete
+    from model_router import choose_model
+
+try:
+    from execution.provider_calls import call_provider, acall_provider
+    from execution.provider_limits import provider_slot, async_provider_slot
+except ImportError:
+    from provider_calls import call_provider, acall_provider
+    from provider_limits import provider_slot, async_provider_slot
+
+try:
+    from execution.text_chunks import chunk_text
+except ImportError:
+    from text_chunks import chunk_text
+
+try:
+    from execution.transcript_segments import parse_dataset_items
+except ImportError:
+    from transcript_segments import parse_dataset_items
+
+try:
+    from execution.language_detect import resolve_language
+except ImportError:
+    from language_detect import resolve_language
+
+try:
+    from execution.transcript_cache import get_cached_transcript, store_transcript, normalize_video_id, cache_key
+except ImportError:
+    from transcript_cache import get_cached_transcript, store_transcript, normalize_video_id, cache_key
+
+try:
+    from execution.single_flight import SingleFlight
+except ImportError:
+    from single_flight import SingleFlight
+
+try:
+    from execution.metrics import record_cache
+    from execution.env_loader import load_env
+    from execution import deadlines
+except ImportError:
+    from metrics import record_cache
+    from env_loader import load_env
+    import deadlines
+
+load_env()
+
+logger = logging.getLogger(__name__)
+
+# Stesso video richiesto più volte in contemporanea: un solo run Apify e una sola traduzione
+_transcriptions = SingleFlight("transcribe")
+_raw_fetches = SingleFlight("fetch_transcript")
+
+TRANSLATION_SYSTEM_PROMPT = "Sei un traduttore professionale. Traduci il seguente testo in italiano. Se il testo è già in italiano, restituiscilo esattamente come è. Non aggiungere commenti o spiegazioni, solo la traduzione."
+
 
-load_dotenv()
+def _translate_chunk(text: str, max_tokens: int = 8000) -> str:
+    messages = [
+        {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
+        {"role": "user", "content": text}
+    ]
+    content, _ = complete(
+        "translate", choose_model("translate", messages), messages, max_tokens=max_tokens, temperature=0.3
+    )
+    return content.strip()
 
 
-def translate_to_italian(text: str) -> str:
+def translate_to_italian(text: str, chunk_tokens: int = None, max_concurrency: int = None,
+                         source_language: str = None) -> str:
     """
-    Traduce il testo in italiano usando Claude via OpenRouter.
-    Se il testo è già in italiano, lo restituisce così com'è.
+    Traduce il testo in italiano via OpenRouter (modello scelto da model_router.py).
+    Se il testo è già in italiano, lo restituisce così com'è senza chiamare
+    il modello: la lingua viene riconosciuta in locale, oppure presa da
+    `source_language` se la sorgente la dichiara.
+
+    I testi più lunghi di `chunk_tokens` (default TRANSLATION_CHUNK_TOKENS) vengono
+    divisi sui confini di frase e tradotti in parallelo (al massimo `max_concurrency`
+    blocchi alla volta, default TRANSLATION_CONCURRENCY), poi riassemblati in ordine.
+    Se un blocco fallisce, solo quel blocco resta nella lingua originale.
     """
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
@@ -26,46 +108,90 @@ def translate_to_italian(text: str) -> str:
     # Se il testo è corto, non vale la pena tradurlo
     if len(text) < 50:
         return text
-    
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
-    
-    try:
-        response = client.chat.completions.create(
-            model=os.getenv("OPENROUTER_MODEL_CLAUDE", "anthropic/claude-3.5-sonnet"),
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Sei un traduttore professionale. Traduci il seguente testo in italiano. Se il testo è già in italiano, restituiscilo esattamente come è. Non aggiungere commenti o spiegazioni, solo la traduzione."
-                },
-                {
-                    "role": "user",
-                    "content": text
-                }
-            ],
-            max_tokens=8000,
-            temperature=0.3
-        )
-        translated = response.choices[0].message.content.strip()
-        print(f"[INFO] Traduzione completata: {len(text)} -> {len(translated)} chars")
-        return translated
-    except Exception as e:
-        print(f"[WARN] Errore traduzione: {e}, uso testo originale")
+
+    language, _ = resolve_language(text, source_language)
+    if language == "it":
+        print("[INFO] Testo già in italiano, skip traduzione")
         return text
 
-def get_transcription(video_url: str) -> dict:
+    if chunk_tokens is None:
+        chunk_tokens = int(os.getenv("TRANSLATION_CHUNK_TOKENS", "1500"))
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", "6"))
+
+    chunks = chunk_text(text, chunk_tokens)
+    if len(chunks) <= 1:
+        try:
+            translated = _translate_chunk(text)
+            print(f"[INFO] Traduzione completata: {len(text)} -> {len(translated)} chars")
+            return translated
+        except (deadlines.DeadlineExceeded, deadlines.RequestCancelled):
+            raise
+        except Exception as e:
+            print(f"[WARN] Errore traduzione: {e}, uso testo originale")
+            return text
+
+    # Margine per l'espansione del testo tradotto rispetto all'originale
+    max_tokens = min(8000, chunk_tokens * 2)
+
+    def translate_or_keep(index: int, chunk: str) -> str:
+        try:
+            return _translate_chunk(chunk, max_tokens=max_tokens)
+        except (deadlines.DeadlineExceeded, deadlines.RequestCancelled):
+            raise
+        except Exception as e:
+            print(f"[WARN] Errore traduzione blocco {index + 1}/{len(chunks)}: {e}, uso testo originale")
+            return chunk
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))), thread_name_prefix="translate") as pool:
+        translated_chunks = list(pool.map(deadlines.propagate(translate_or_keep), range(len(chunks)), chunks))
+
+    translated = " ".join(translated_chunks)
+    print(f"[INFO] Traduzione completata in {len(chunks)} blocchi: {len(text)} -> {len(translated)} chars")
+    return translated
+
+def _transcription_result(video_url: str, text: str, title: str, language: str, cached: bool) -> dict:
+    return {
+        "text": text,
+        "metadata": {
+            "title": title,
+            "url": video_url,
+            "video_id": normalize_video_id(video_url),
+            "language": language,
+            "cached": cached
+        }
+    }
+
+
+def transcription_from_cache(video_url: str):
+    """Trascrizione già elaborata per lo stesso video (anche con URL diverso), oppure None."""
+    cached = get_cached_transcript(video_url)
+    record_cache("transcript", "transcribe", bool(cached))
+    if not cached:
+        return None
+    print(f"[INFO] Trascrizione trovata in cache per {video_url}")
+    return _transcription_result(video_url, cached["text"], cached["title"], cached.get("language"), True)
+
+
+def fetch_raw_transcript(video_url: str) -> dict:
     """
-    Scarica la trascrizione di un video YouTube tramite Apify.
-    Restituisce un dizionario con 'text' (testo completo) e 'metadata'.
+    Scarica i sottotitoli tramite Apify, senza cache né traduzione.
+    Restituisce {'raw_text', 'title', 'language', 'segment_count', 'duration'}.
+    Richieste contemporanee per lo stesso video condividono un unico run.
     """
+    return _raw_fetches.do(cache_key(video_url), _fetch_raw_transcript, video_url)
+
+
+APIFY_ACTOR_ID = "pintostudio/youtube-transcript-scraper"
+RUN_FAILED_STATUSES = ("FAILED", "ABORTED", "TIMED-OUT")
+
+
+def _apify_settings(video_url: str) -> tuple:
+    """Restituisce (api_key, api_url, run_input, opzioni di start) per l'actor di trascrizione."""
     api_key = os.getenv("APIFY_API_KEY")
     if not api_key:
         raise ValueError("APIFY_API_KEY mancante nel file .env")
 
-    client = ApifyClient(api_key)
-
     # Configurazione input per pintostudio/youtube-transcript-scraper
     run_input = {
         "videoUrl": video_url,
@@ -73,105 +199,240 @@ def get_transcription(video_url: str) -> dict:
         "addVideoInfo": True
     }
 
-    # Esegui l'actor
-    run = client.actor("pintostudio/youtube-transcript-scraper").call(run_input=run_input)
+    # Memoria e timeout del run: se non indicati valgono quelli di default dell'actor
+    start_options = {}
+    if os.getenv("APIFY_ACTOR_MEMORY_MB"):
+        start_options["memory_mbytes"] = int(os.getenv("APIFY_ACTOR_MEMORY_MB"))
+    if os.getenv("APIFY_ACTOR_TIMEOUT"):
+        start_options["timeout_secs"] = int(os.getenv("APIFY_ACTOR_TIMEOUT"))
 
-    # Recupera i risultati dal dataset
-    dataset_items = client.dataset(run["defaultDatasetId"]).list_items().items
-    
-    if not dataset_items:
+    # APIFY_API_URL permette di puntare a un server alternativo (es. i fake dei benchmark)
+    return api_key, os.getenv("APIFY_API_URL") or None, run_input, start_options
+
+
+def _with_deadline(start_options: dict) -> dict:
+    """Limita il timeout del run al tempo rimasto alla richiesta: Apify lo ferma da sé."""
+    left = deadlines.timeout_for(start_options.get("timeout_secs"))
+    if left is None:
+        return start_options
+    return {**start_options, "timeout_secs": max(1, int(left))}
+
+
+def _finished(run: dict) -> bool:
+    return run is None or run["status"] in RUN_FAILED_STATUSES + ("SUCCEEDED",)
+
+
+def _check_run(run: dict):
+    if run is None:
+        raise Exception("Run Apify non trovato")
+    if run["status"] in RUN_FAILED_STATUSES:
+        raise Exception(f"Run Apify terminato con stato {run['status']}")
+
+
+def _raw_transcript(parsed: dict) -> dict:
+    if not parsed["item_count"]:
         raise Exception("Nessuna trascrizione trovata o errore nello scraper.")
 
-    # Debug: stampa la struttura dei dati ricevuti
-    print(f"[DEBUG] Received {len(dataset_items)} items from Apify")
-    for i, item in enumerate(dataset_items):
-        print(f"[DEBUG] Item {i} keys: {list(item.keys())}")
-        # Stampa un campione dei dati per capire la struttura
-        for key, value in item.items():
-            if isinstance(value, str) and len(value) > 100:
-                print(f"[DEBUG]   {key}: (string, {len(value)} chars)")
-            elif isinstance(value, list):
-                print(f"[DEBUG]   {key}: (list, {len(value)} items)")
-                if value and len(value) > 0:
-                    print(f"[DEBUG]     First item type: {type(value[0])}")
-                    if isinstance(value[0], dict):
-                        print(f"[DEBUG]     First item keys: {list(value[0].keys())}")
-            else:
-                print(f"[DEBUG]   {key}: {value}")
-
-    # Funzione ricorsiva per estrarre testo da qualsiasi struttura
-    def extract_text_recursive(obj, depth=0):
-        texts = []
-        if depth > 10:  # Protezione ricorsione
-            return texts
-            
-        if isinstance(obj, str):
-            if len(obj) > 5:  # Ignora stringhe troppo corte
-                texts.append(obj)
-        elif isinstance(obj, dict):
-            # Cerca campi di testo comuni
-            for key in ["text", "content", "segment", "caption", "line", "transcript_text"]:
-                if key in obj and obj[key]:
-                    result = extract_text_recursive(obj[key], depth + 1)
-                    texts.extend(result)
-            # Se non trovato, cerca in tutti i valori che sembrano contenere testo
-            if not texts:
-                for key, value in obj.items():
-                    if key.lower() in ["title", "videotitle", "url", "videoid", "id", "duration", "start", "end"]:
-                        continue
-                    result = extract_text_recursive(value, depth + 1)
-                    texts.extend(result)
-        elif isinstance(obj, list):
-            for item in obj:
-                result = extract_text_recursive(item, depth + 1)
-                texts.extend(result)
-        return texts
-
-    full_text = ""
-    title = "Unknown Title"
-    
-    for item in dataset_items:
-        # Estrai il titolo se disponibile
-        for title_key in ["title", "videoTitle", "video_title"]:
-            if title_key in item and item[title_key]:
-                title = item[title_key]
-                break
-        
-        # Formato specifico Apify: item["data"] contiene lista di {start, dur, text}
-        if "data" in item and isinstance(item["data"], list):
-            for segment in item["data"]:
-                if isinstance(segment, dict) and "text" in segment:
-                    full_text += segment["text"] + " "
-        else:
-            # Fallback: Estrai testo ricorsivamente
-            texts = extract_text_recursive(item)
-            full_text += " ".join(texts) + " "
-
-    if not full_text.strip():
-        # Se ancora vuoto, prova a stampare l'intera struttura per debug
-        print(f"[DEBUG] Full structure: {json.dumps(dataset_items, indent=2, default=str)[:5000]}")
+    segments = parsed["segments"]
+    raw_text = segments.text()
+    if not raw_text:
+        logger.debug(f"Nessun testo nei {parsed['item_count']} item restituiti da Apify")
         raise Exception("Trascrizione vuota - il video potrebbe non avere sottotitoli disponibili.")
 
+    title = parsed["title"]
+    declared_language = parsed["language"]
+    language, language_source = resolve_language(raw_text, declared_language)
+    print(f"[INFO] Lingua rilevata: {language or 'sconosciuta'} ({language_source})")
+    return {
+        "raw_text": raw_text,
+        "title": title,
+        "language": language,
+        "segment_count": len(segments),
+        "duration": segments.duration()
+    }
+
+
+def _fetch_raw_transcript(video_url: str) -> dict:
+    api_key, api_url, run_input, start_options = _apify_settings(video_url)
+
+    # Import differito: apify_client pesa sull'avvio del backend e serve solo qui
+    from apify_client import ApifyClient
+    client = ApifyClient(api_key, api_url=api_url)
+
+    # start + wait_for_finish invece di call(): niente thread di log e status watcher per ogni run.
+    # Il retry di call_provider copre solo lo start: un errore dopo non deve avviare un secondo run
+    # (a pagamento). Attesa e lettura del dataset usano i retry interni di apify_client sullo
+    # stesso run. Il posto nel semaforo vale per tutto il run.
+    def start() -> dict:
+        return client.actor(APIFY_ACTOR_ID).start(run_input=run_input, **_with_deadline(start_options))
+
+    with provider_slot("apify"):
+        run = call_provider("apify", start, key=APIFY_ACTOR_ID, slot=False)
+        run_client = client.run(run["id"])
+
+        finished = False
+        try:
+            left = deadlines.remaining()
+            run = run_client.wait_for_finish(wait_secs=None if left is None else max(1, int(left)))
+            finished = _finished(run)
+            if not finished:
+                # Scadenza della richiesta raggiunta con il run ancora in corso
+                raise deadlines.DeadlineExceeded(f"Run Apify {run['id']} interrotto: tempo massimo della richiesta superato")
+            _check_run(run)
+
+            # Leggi il dataset pagina per pagina, senza caricarlo tutto in memoria
+            parsed = parse_dataset_items(client.dataset(run["defaultDatasetId"]).iterate_items())
+        except BaseException:
+            if not finished:
+                _abort_run(run_client)
+            raise
+
+    return _raw_transcript(parsed)
+
+
+def _abort_run(run_client):
+    """Nessuno aspetta più il risultato: fermiamo il run per non pagarlo."""
+    try:
+        run_client.abort()
+    except Exception as e:
+        print(f"[WARN] Impossibile interrompere il run Apify {run_client.resource_id}: {e}")
+
+
+async def fetch_raw_transcript_async(video_url: str) -> dict:
+    """
+    Come `fetch_raw_transcript`, senza occupare un thread durante il run:
+    l'actor viene avviato, atteso con long polling (APIFY_WAIT_SECS per richiesta)
+    e il dataset viene letto a pagine di APIFY_DATASET_PAGE_SIZE item, anche
+    mentre il run è ancora in corso. Se la richiesta viene cancellata il run viene interrotto.
+    Condivide il run con le chiamate sincrone contemporanee per lo stesso video.
+    """
+    return await _raw_fetches.ado(cache_key(video_url), _fetch_raw_transcript_async, video_url)
+
+
+async def _read_new_items(dataset, items: list, offset: int, page_size: int) -> int:
+    """
+    Aggiunge a `items` gli item del dataset a partire da `offset` e restituisce
+    il nuovo offset. Si legge senza `clean`: Apify applica l'offset prima di
+    scartare gli item vuoti, quindi il filtro va fatto qui per non sfasare la paginazione.
+    """
+    while True:
+        page = await dataset.list_items(offset=offset, limit=page_size)
+        offset += len(page.items)
+        for item in page.items:
+            # Come clean=True: niente campi nascosti ("#...") né item vuoti
+            item = {key: value for key, value in item.items() if not key.startswith("#")}
+            if item:
+                items.append(item)
+        if len(page.items) < page_size:
+            return offset
+
+
+async def _fetch_raw_transcript_async(video_url: str) -> dict:
+    api_key, api_url, run_input, start_options = _apify_settings(video_url)
+    wait_secs = int(os.getenv("APIFY_WAIT_SECS", "30"))
+    page_size = int(os.getenv("APIFY_DATASET_PAGE_SIZE", "1000"))
+
+    from apify_client import ApifyClientAsync
+    client = ApifyClientAsync(api_key, api_url=api_url)
+
+    # Come nel percorso sincrono: call_provider ritenta solo lo start, mai un secondo run
+    async def start() -> dict:
+        return await client.actor(APIFY_ACTOR_ID).start(run_input=run_input, **_with_deadline(start_options))
+
+    async with async_provider_slot("apify"):
+        run = await acall_provider("apify", start, key=APIFY_ACTOR_ID, slot=False)
+        run_client = client.run(run["id"])
+        dataset = client.dataset(run["defaultDatasetId"])
+        items = []
+        offset = 0
+        finished = False
+        try:
+            while not finished:
+                poll = deadlines.timeout_for(wait_secs)
+                run = await run_client.wait_for_finish(wait_secs=max(1, int(poll)))
+                finished = _finished(run)
+                offset = await _read_new_items(dataset, items, offset, page_size)
+        except BaseException:
+            # Cancellazione, scadenza o errore definitivo con il run ancora in corso: fermiamolo
+            if not finished:
+                try:
+                    await asyncio.shield(run_client.abort())
+                except Exception as e:
+                    print(f"[WARN] Impossibile interrompere il run Apify {run_client.resource_id}: {e}")
+            raise
+        _check_run(run)
+
+    # Parsing e riconoscimento della lingua sono CPU: fuori dall'event loop
+    return await asyncio.to_thread(lambda: _raw_transcript(parse_dataset_items(items)))
+
+
+def finalize_transcription(video_url: str, raw: dict) -> dict:
+    """
+    Traduce il testo grezzo di `fetch_raw_transcript` (se serve), lo salva in
+    cache e restituisce il formato di `get_transcription`.
+    """
     # Traduci automaticamente in italiano se necessario
     print("[INFO] Avvio traduzione in italiano...")
-    translated_text = translate_to_italian(full_text.strip())
+    translated_text = translate_to_italian(raw["raw_text"], source_language=raw.get("language"))
 
-    return {
-        "text": translated_text,
-        "metadata": {
-            "title": title,
-            "url": video_url
-        }
-    }
+    try:
+        store_transcript(video_url, raw["raw_text"], translated_text, raw["title"], language=raw.get("language"))
+    except Exception as e:
+        print(f"[WARN] Impossibile salvare la trascrizione in cache: {e}")
+
+    return _transcription_result(video_url, translated_text, raw["title"], raw.get("language"), False)
+
+
+def get_transcription(video_url: str, use_cache: bool = True) -> dict:
+    """
+    Scarica la trascrizione di un video YouTube tramite Apify.
+    Restituisce un dizionario con 'text' (testo completo) e 'metadata'.
+
+    Se il video è già stato trascritto (stesso ID, anche con URL diverso)
+    il risultato arriva dalla cache su disco; `use_cache=False` la ignora.
+    Richieste contemporanee per lo stesso video aspettano la stessa elaborazione.
+    """
+    shared = _transcriptions.do((cache_key(video_url), use_cache), _get_transcription, video_url, use_cache)
+    # Il risultato è condiviso: ognuno riceve la sua copia, con il proprio URL
+    return {**shared, "metadata": {**shared["metadata"], "url": video_url}}
+
+
+def _get_transcription(video_url: str, use_cache: bool) -> dict:
+    if use_cache:
+        cached = transcription_from_cache(video_url)
+        if cached:
+            return cached
+    return finalize_transcription(video_url, fetch_raw_transcript(video_url))
+
+
+async def get_transcription_async(video_url: str, use_cache: bool = True) -> dict:
+    """
+    Come `get_transcription`, con il run Apify atteso senza bloccare un thread
+    (vedi `fetch_raw_transcript_async`). Cache e traduzione girano su thread.
+    """
+    shared = await _transcriptions.ado((cache_key(video_url), use_cache), _get_transcription_async, video_url, use_cache)
+    return {**shared, "metadata": {**shared["metadata"], "url": video_url}}
+
+
+async def _get_transcription_async(video_url: str, use_cache: bool) -> dict:
+    if use_cache:
+        cached = await asyncio.to_thread(transcription_from_cache, video_url)
+        if cached:
+            return cached
+    raw = await fetch_raw_transcript_async(video_url)
+    return await asyncio.to_thread(finalize_transcription, video_url, raw)
 
 if __name__ == "__main__":
+    # LOG_LEVEL=DEBUG mostra la struttura degli item restituiti da Apify
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
     if len(sys.argv) < 2:
-        print("Uso: python transcribe_video.py <youtube_url>")
+        print("Uso: python transcribe_video.py <youtube_url> [--no-cache]")
         sys.exit(1)
     
     url = sys.argv[1]
     try:
-        result = get_transcription(url)
+        result = get_transcription(url, use_cache="--no-cache" not in sys.argv[2:])
         print(json.dumps(result, indent=2, ensure_ascii=False))
     except Exception as e:
         print(f"Errore: {str(e)}", file=sys.stderr)
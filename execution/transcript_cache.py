@@ -0,0 +1,93 @@
+"""
+Script: transcript_cache.py
+Obiettivo: Cache persistente delle trascrizioni, indicizzata per ID del video YouTube.
+
+URL diversi dello stesso video (youtu.be, watch?v=, shorts, embed...) puntano
+alla stessa voce. Ogni voce contiene sia il testo originale sia quello tradotto.
+
+Configurazione (.env):
+    TRANSCRIPT_CACHE_TTL       validità di una voce in secondi (default 7 giorni)
+    TRANSCRIPT_CACHE_MAX_MB    dimensione massima della cache (default 200 MB)
+"""
+
+import os
+import re
+import threading
+from urllib.parse import urlparse, parse_qs
+
+try:
+    from execution.disk_cache import DiskCache
+except ImportError:
+    from disk_cache import DiskCache
+
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_PATH_PREFIXES = ("shorts", "embed", "live", "v", "e")
+
+_cache = None
+_lock = threading.Lock()
+
+
+def normalize_video_id(video_url: str):
+    """
+    Estrae l'ID (11 caratteri) di un video YouTube da un URL o da un ID nudo.
+    Restituisce None se l'URL non è riconosciuto.
+    """
+    value = (video_url or "").strip()
+    if _VIDEO_ID_RE.match(value):
+        return value
+
+    if "://" not in value:
+        value = "https://" + value
+    parsed = urlparse(value)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    parts = [p for p in parsed.path.split("/") if p]
+
+    candidate = None
+    if host == "youtu.be" and parts:
+        candidate = parts[0]
+    elif host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        query = parse_qs(parsed.query)
+        if "v" in query:
+            candidate = query["v"][0]
+        elif len(parts) >= 2 and parts[0] in _PATH_PREFIXES:
+            candidate = parts[1]
+
+    if candidate and _VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def cache_key(video_url: str) -> str:
+    """Chiave di cache: ID del video se riconosciuto, altrimenti l'URL stesso."""
+    video_id = normalize_video_id(video_url)
+    return f"yt:{video_id}" if video_id else f"url:{video_url.strip()}"
+
+
+def get_transcript_cache() -> DiskCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = DiskCache(
+                    "transcripts",
+                    ttl=float(os.getenv("TRANSCRIPT_CACHE_TTL", str(7 * 24 * 3600))),
+                    max_bytes=int(float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "200")) * 1024 * 1024),
+                )
+    return _cache
+
+
+def get_cached_transcript(video_url: str):
+    """Voce salvata ({'raw_text', 'text', 'title', 'video_id', 'language'}) o None."""
+    return get_transcript_cache().get(cache_key(video_url))
+
+
+def store_transcript(video_url: str, raw_text: str, text: str, title: str, language: str = None):
+    get_transcript_cache().set(cache_key(video_url), {
+        "raw_text": raw_text,
+        "text": text,
+        "title": title,
+        "video_id": normalize_video_id(video_url),
+        "language": language,
+    })
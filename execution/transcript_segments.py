@@ -0,0 +1,161 @@
+"""
+Script: transcript_segments.py
+Obiettivo: Leggere in streaming gli item del dataset Apify e raccogliere i segmenti dei sottotitoli.
+
+Gli item vengono consumati uno alla volta (anche pagina per pagina dal dataset)
+e i segmenti finiscono in una struttura compatta: timestamp in array di double,
+testi in una lista, uniti una sola volta alla fine. Nessuna concatenazione di
+stringhe in ciclo, quindi il costo resta lineare anche su video di ore.
+"""
+
+import math
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+TEXT_KEYS = ("text", "content", "segment", "caption", "line", "transcript_text")
+SKIP_KEYS = {"title", "videotitle", "url", "videoid", "id", "duration", "start", "end"}
+TITLE_KEYS = ("title", "videoTitle", "video_title")
+LANGUAGE_KEYS = ("language", "languageCode", "language_code", "lang")
+
+
+class SegmentList:
+    """
+    Segmenti di sottotitoli in forma compatta: `starts` e `durations` sono
+    array('d') (NaN se il timestamp manca), `texts` la lista dei testi.
+    """
+
+    __slots__ = ("starts", "durations", "texts")
+
+    def __init__(self):
+        self.starts = array("d")
+        self.durations = array("d")
+        self.texts = []
+
+    def append(self, text: str, start=None, dur=None):
+        self.starts.append(_to_float(start))
+        self.durations.append(_to_float(dur))
+        self.texts.append(text)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self):
+        return zip(self.starts, self.durations, self.texts)
+
+    def text(self) -> str:
+        return " ".join(self.texts).strip()
+
+    def duration(self):
+        """Fine dell'ultimo segmento con timestamp, in secondi (None se non disponibile)."""
+        for start, dur in zip(reversed(self.starts), reversed(self.durations)):
+            if not math.isnan(start):
+                return round(start + (0.0 if math.isnan(dur) else dur), 3)
+        return None
+
+    def to_list(self) -> list:
+        return [
+            {
+                "start": None if math.isnan(start) else start,
+                "dur": None if math.isnan(dur) else dur,
+                "text": text
+            }
+            for start, dur, text in self
+        ]
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _extract_text_recursive(obj, out: list, depth: int = 0):
+    """Raccoglie in `out` le stringhe di testo trovate in qualsiasi struttura."""
+    if depth > 10:  # Protezione ricorsione
+        return
+
+    if isinstance(obj, str):
+        if len(obj) > 5:  # Ignora stringhe troppo corte
+            out.append(obj)
+    elif isinstance(obj, dict):
+        found_before = len(out)
+        # Cerca campi di testo comuni
+        for key in TEXT_KEYS:
+            if obj.get(key):
+                _extract_text_recursive(obj[key], out, depth + 1)
+        # Se non trovato, cerca in tutti i valori che sembrano contenere testo
+        if len(out) == found_before:
+            for key, value in obj.items():
+                if key.lower() in SKIP_KEYS:
+                    continue
+                _extract_text_recursive(value, out, depth + 1)
+    elif isinstance(obj, list):
+        for item in obj:
+            _extract_text_recursive(item, out, depth + 1)
+
+
+def _log_item_structure(index: int, item: dict):
+    logger.debug(f"Item {index} keys: {list(item.keys())}")
+    for key, value in item.items():
+        if isinstance(value, str) and len(value) > 100:
+            logger.debug(f"  {key}: (string, {len(value)} chars)")
+        elif isinstance(value, list):
+            logger.debug(f"  {key}: (list, {len(value)} items)")
+            if value and isinstance(value[0], dict):
+                logger.debug(f"    First item keys: {list(value[0].keys())}")
+        else:
+            logger.debug(f"  {key}: {value}")
+
+
+def parse_dataset_items(items) -> dict:
+    """
+    Consuma un iterabile di item del dataset Apify (anche un generatore paginato).
+    Restituisce {'segments': SegmentList, 'title', 'language', 'item_count'}.
+    """
+    segments = SegmentList()
+    title = "Unknown Title"
+    declared_language = None
+    item_count = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for item in items:
+        if debug:
+            _log_item_structure(item_count, item)
+        item_count += 1
+
+        # Estrai il titolo se disponibile
+        for title_key in TITLE_KEYS:
+            if item.get(title_key):
+                title = item[title_key]
+                break
+
+        # Lingua dei sottotitoli, se lo scraper la restituisce
+        for language_key in LANGUAGE_KEYS:
+            if isinstance(item.get(language_key), str) and item[language_key]:
+                declared_language = item[language_key]
+                break
+
+        # Formato specifico Apify: item["data"] contiene lista di {start, dur, text}
+        if isinstance(item.get("data"), list):
+            for segment in item["data"]:
+                if isinstance(segment, dict) and "text" in segment:
+                    segments.append(segment["text"], segment.get("start"), segment.get("dur"))
+        else:
+            # Fallback: Estrai testo ricorsivamente
+            texts = []
+            _extract_text_recursive(item, texts)
+            for text in texts:
+                segments.append(text)
+
+    if debug:
+        logger.debug(f"Received {item_count} items from Apify, {len(segments)} segments")
+
+    return {
+        "segments": segments,
+        "title": title,
+        "language": declared_language,
+        "item_count": item_count
+    }
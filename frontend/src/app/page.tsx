@@ -23,10 +23,25 @@ export default function Home() {
   const [topics, setTopics] = useState<string[]>([]);
   const [research, setResearch] = useState<string>("");
   const [finalScript, setFinalScript] = useState<string>("");
+  // Sessione per il backend: mentre l'utente legge un risultato, lo step successivo parte in anticipo
+  const [sessionId, setSessionId] = useState<string>("");
+  // Handle degli output salvati sul backend: evitano di rimandare trascrizione e ricerca a ogni step
+  const [transcriptHandle, setTranscriptHandle] = useState<string | null>(null);
+  const [researchHandle, setResearchHandle] = useState<string | null>(null);
+
+  // POST con gli handle; se il backend non li conosce più (404) ripete con il testo completo
+  const postWithHandles = async (url: string, handles: object, fullBody: object) => {
+    const init = { method: "POST", headers: { "Content-Type": "application/json" } };
+    const res = await fetch(url, { ...init, body: JSON.stringify(handles) });
+    if (res.status !== 404) return res;
+    return fetch(url, { ...init, body: JSON.stringify(fullBody) });
+  };
 
   const resetAll = () => {
     setCurrentStep("idle");
     setTranscript(null);
+    setTranscriptHandle(null);
+    setResearchHandle(null);
     setTopics([]);
     setResearch("");
     setFinalScript("");
@@ -47,6 +62,8 @@ export default function Home() {
     setLoading(true);
     setError(null);
     setCurrentStep("transcribing");
+    const newSessionId = crypto.randomUUID();
+    setSessionId(newSessionId);
 
     // Sanitize API URL: remove quotes, trailing slashes, and fix common typos (https:77 -> https://)
     let apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
@@ -60,7 +77,7 @@ export default function Home() {
       const res = await fetch(`${apiUrl}/api/step/transcribe`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ url }),
+        body: JSON.stringify({ url, session_id: newSessionId }),
       });
       console.log("Response status:", res.status);
       const data = await res.json();
@@ -68,6 +85,7 @@ export default function Home() {
 
       if (data.success) {
         setTranscript(data.data);
+        setTranscriptHandle(data.transcript_handle || null);
         setCurrentStep("transcribed");
       } else {
         setError(data.error || "Errore sconosciuto dal server");
@@ -90,11 +108,15 @@ export default function Home() {
 
     try {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
-      const res = await fetch(`${apiUrl}/api/step/extract-topics`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ transcript_text: transcript.text }),
-      });
+      const fullBody = { transcript_text: transcript.text, session_id: sessionId };
+      const res = transcriptHandle
+        ? await postWithHandles(`${apiUrl}/api/step/extract-topics`,
+            { transcript_handle: transcriptHandle, session_id: sessionId }, fullBody)
+        : await fetch(`${apiUrl}/api/step/extract-topics`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(fullBody),
+          });
       const data = await res.json();
 
       if (data.success) {
@@ -123,12 +145,13 @@ export default function Home() {
       const res = await fetch(`${apiUrl}/api/step/research`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ topics }),
+        body: JSON.stringify({ topics, session_id: sessionId }),
       });
       const data = await res.json();
 
       if (data.success) {
         setResearch(data.data);
+        setResearchHandle(data.research_handle || null);
         setCurrentStep("researched");
       } else {
         setError(data.error);
@@ -141,27 +164,69 @@ export default function Home() {
     setLoading(false);
   };
 
-  // Step 4: Generate Script
+  // Step 4: Generate Script (streaming SSE: lo script compare mentre viene scritto)
   const handleGenerateScript = async () => {
     if (!transcript || !research) return;
     setLoading(true);
     setError(null);
+    setFinalScript("");
     setCurrentStep("generating");
 
     try {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
-      const res = await fetch(`${apiUrl}/api/step/generate-script`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ transcript_text: transcript.text, research }),
-      });
-      const data = await res.json();
+      const fullBody = { transcript_text: transcript.text, research, session_id: sessionId };
+      const res = transcriptHandle && researchHandle
+        ? await postWithHandles(`${apiUrl}/api/step/generate-script/stream`,
+            { transcript_handle: transcriptHandle, research_handle: researchHandle, session_id: sessionId }, fullBody)
+        : await fetch(`${apiUrl}/api/step/generate-script/stream`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(fullBody),
+          });
+      if (!res.ok || !res.body) {
+        throw new Error(`HTTP ${res.status}`);
+      }
 
-      if (data.success) {
-        setFinalScript(data.data);
-        setCurrentStep("completed");
-      } else {
-        setError(data.error);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let streamed = "";
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Ogni evento SSE termina con una riga vuota
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf("\n\n");
+
+          const event = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const dataLine = rawEvent.match(/^data: (.*)$/m)?.[1];
+          if (!event || !dataLine) continue;
+          const data = JSON.parse(dataLine);
+
+          if (event === "token") {
+            streamed += data.text;
+            setFinalScript(streamed);
+          } else if (event === "done") {
+            setFinalScript(data.data);
+            setCurrentStep("completed");
+            finished = true;
+          } else if (event === "error") {
+            setError(data.error);
+            setCurrentStep("error");
+            finished = true;
+          }
+        }
+      }
+
+      if (!finished) {
+        setError("Connessione interrotta durante la generazione");
         setCurrentStep("error");
       }
     } catch (e) {
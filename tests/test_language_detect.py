@@ -0,0 +1,41 @@
+from execution.language_detect import detect_language, resolve_language
+
+SPANISH = (
+    "Hola a todos y bienvenidos al canal. Hoy vamos a hablar de la inteligencia artificial, "
+    "porque es un tema que está cambiando todo lo que hacemos. Entonces, cuando pensamos en "
+    "los datos y en las herramientas que hay, también tenemos que ver cómo se usan para "
+    "trabajar mejor, y esto es muy importante para nosotros."
+)
+
+ENGLISH = (
+    "Hi everyone and welcome back to the channel. Today we are going to talk about the way "
+    "research and data change what we do every day, and this is really important because "
+    "you can use these tools for your work if you just know what to look for."
+)
+
+ITALIAN = (
+    "Ciao a tutti e benvenuti sul canale. Oggi parliamo di intelligenza artificiale, perché è "
+    "un tema che sta cambiando il modo in cui lavoriamo. Quindi, quando pensiamo ai dati e "
+    "agli strumenti che abbiamo, dobbiamo anche capire come usarli per fare meglio il nostro lavoro."
+)
+
+
+def test_spanish_declared_italian_is_detected_as_spanish():
+    assert detect_language(SPANISH)[0] == "es"
+    assert resolve_language(SPANISH, "it") == ("es", "local")
+
+
+def test_english_declared_italian_is_detected_as_english():
+    assert resolve_language(ENGLISH, "it") == ("en", "local")
+
+
+def test_italian_declared_italian_keeps_source():
+    assert resolve_language(ITALIAN, "it") == ("it", "source")
+
+
+def test_declared_language_kept_for_short_text():
+    assert resolve_language("ok grazie", "it") == ("it", "source")
+
+
+def test_no_declaration_uses_local_detection():
+    assert resolve_language(ENGLISH) == ("en", "local")
@@ -0,0 +1,38 @@
+from execution.research_store import ResearchStore, merge_topics, normalize_topic, similarity
+
+
+def test_non_latin_topics_are_not_normalized_to_empty():
+    assert normalize_topic("Искусственный интеллект") == "искусственныи интеллект"
+    assert normalize_topic("人工智能") == "人工智能"
+    assert normalize_topic("!!!") == "!!!"
+
+
+def test_non_latin_topics_are_not_merged():
+    topics = ["Искусственный интеллект", "Криптовалюты", "人工智能", "区块链"]
+    assert merge_topics(topics) == [[topic] for topic in topics]
+
+
+def test_same_subject_in_different_fields_is_not_merged():
+    medicine = normalize_topic("Intelligenza artificiale nella medicina")
+    finance = normalize_topic("Intelligenza artificiale nella finanza")
+    assert similarity(medicine, finance) < 0.66
+    assert len(merge_topics(["Intelligenza artificiale nella medicina",
+                             "Intelligenza artificiale nella finanza"])) == 2
+
+
+def test_near_duplicates_are_merged():
+    assert merge_topics(["Intelligenza artificiale", "L'intelligenza artificiale generativa",
+                         "Le energie rinnovabili", "Energia rinnovabile"]) == [
+        ["Intelligenza artificiale", "L'intelligenza artificiale generativa"],
+        ["Le energie rinnovabili", "Energia rinnovabile"],
+    ]
+
+
+def test_store_does_not_serve_a_different_field(tmp_path):
+    store = ResearchStore(ttl=3600, directory=str(tmp_path))
+    store.store("sonar", ["Intelligenza artificiale nella medicina"], "report medicina")
+    store.store("sonar", ["Криптовалюты"], "report crypto")
+
+    assert store.lookup("sonar", "Intelligenza artificiale nella finanza") is None
+    assert store.lookup("sonar", "Искусственный интеллект") is None
+    assert store.lookup("sonar", "L'intelligenza artificiale in medicina")["text"] == "report medicina"